@@ -11,18 +11,61 @@ logger = logging.getLogger(__name__)
 description = "An automated grading tool for programming assignments."
 
 subcommands = OrderedDict([
-    ("init", "grader.commands.init"),
-    ("new", "grader.commands.new"),
-    ("build", "grader.commands.build"),
-    ("import", "grader.commands.import"),
-    ("list", "grader.commands.list"),
-    ("grade", "grader.commands.grade"),
-    ("inspect", "grader.commands.inspect"),
-    ("cat", "grader.commands.cat"),
-    ("report", "grader.commands.report"),
-    ("review", "grader.commands.review"),
-    ("canvas", "grader.commands.canvas"),
+    ("init", ("grader.commands.init",
+              "Initialize grader by creating grader.yml")),
+    ("new", ("grader.commands.new",
+             "Create a new assignment")),
+    ("build", ("grader.commands.build",
+               "Build an assignment's docker image")),
+    ("import", ("grader.commands.import",
+                "Import student submission(s)")),
+    ("list", ("grader.commands.list",
+              "List student submission(s)")),
+    ("grade", ("grader.commands.grade",
+               "Grade assignment submission(s)")),
+    ("worker", ("grader.commands.worker",
+                "Grade submission(s) handed out by grade --serve")),
+    ("inspect", ("grader.commands.inspect",
+                 "Inspect a graded submission's container.")),
+    ("cat", ("grader.commands.cat",
+             "Print an assignment's grade output to STDOUT")),
+    ("report", ("grader.commands.report",
+                "Generate reports using a gradesheet template")),
+    ("review", ("grader.commands.review",
+                "Opens results for each submission along with "
+                "submission code in an editor.")),
+    ("canvas", ("grader.commands.canvas",
+                "Import student submission(s)")),
+    ("timings", ("grader.commands.timings",
+                 "Summarize how long each phase of grading took")),
 ])
+"""Maps each subcommand to the module that implements it, and its help
+text. Modules are only imported when their subcommand is used."""
+
+
+class _LazySubParsersAction(argparse._SubParsersAction):
+    """A subparsers action that imports a subcommand's module (and sets
+    up its parser) only when that subcommand is chosen. Listing the
+    subcommands, e.g. for ``grader help``, doesn't import anything.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lazy_modules = {}
+
+    def add_lazy_parser(self, name, module_path, **kwargs):
+        parser = self.add_parser(name, **kwargs)
+        self._lazy_modules[name] = module_path
+        return parser
+
+    def __call__(self, parser, namespace, values, option_string=None):
+        name = values[0]
+        module_path = self._lazy_modules.pop(name, None)
+        if module_path is not None:
+            module = importlib.import_module(module_path)
+            module.setup_parser(self._name_parser_map[name])
+        super().__call__(parser, namespace, values, option_string)
 
 
 def configure_logging():
@@ -69,15 +112,20 @@ def make_parser():
     parser.add_argument('--verbosity', default="INFO",
                         choices=["DEBUG", "INFO", "WARNING", "ERROR"],
                         help='Desired log level')
+    parser.add_argument('--timings', metavar='FILE',
+                        help='Append how long each phase of grading and '
+                             'building takes to FILE, as JSON lines')
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='Write the total time spent in each phase '
+                             'to FILE, as a Prometheus textfile')
     # If no arguments are provided, show the usage screen
     parser.set_defaults(run=lambda x: parser.print_usage())
 
     # Set up subcommands for each package
-    subparsers = parser.add_subparsers(title="subcommands")
-    for name, path in subcommands.items():
-        module = importlib.import_module(path)
-        subparser = subparsers.add_parser(name, help=module.help)
-        module.setup_parser(subparser)
+    subparsers = parser.add_subparsers(title="subcommands",
+                                       action=_LazySubParsersAction)
+    for name, (path, help_text) in subcommands.items():
+        subparsers.add_lazy_parser(name, path, help=help_text)
 
     # The 'help' command shows the help screen
     help_parser = subparsers.add_parser("help",
@@ -100,6 +148,11 @@ def run():                      # pragma: no cover
     # Set logging verbosity
     logging.getLogger().setLevel(args.verbosity)
 
+    # Time grading phases, if asked to
+    if args.timings or args.metrics:
+        from grader.utils import timings
+        timings.start(args.timings, args.metrics)
+
     # Do it
     try:
         args.run(args)
@@ -108,6 +161,9 @@ def run():                      # pragma: no cover
             raise e
         logger.error(str(e))
         raise SystemExit(1) from e
+    finally:
+        if args.timings or args.metrics:
+            timings.stop()
 
 if __name__ == '__main__':      # pragma: no cover
     run()
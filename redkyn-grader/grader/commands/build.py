@@ -1,4 +1,8 @@
-'''TODO: Build command docs
+'''Builds assignments' docker images.
+
+Images are labelled with a hash of their gradesheet and build options,
+and aren't built again until one of those changes (unless ``--force``
+or ``--no-cache`` is given).
 '''
 import logging
 
@@ -7,12 +11,16 @@ from grader.utils.config import require_grader_config
 
 logger = logging.getLogger(__name__)
 
-help = "Build an assignment's docker image"
-
 
 def setup_parser(parser):
-    parser.add_argument('assignment',
+    parser.add_argument('assignment', nargs='?',
                         help='Name of the assignment to build.')
+    parser.add_argument('--all', action='store_true',
+                        help='Build every assignment whose image is out '
+                             'of date.')
+    parser.add_argument('--force', action='store_true',
+                        help='Build even if nothing has changed since the '
+                             'last build.')
     parser.add_argument('--no-cache', action='store_true',
                         help='Do not use docker image cache when building.')
     parser.add_argument('--pull', action='store_true',
@@ -24,6 +32,27 @@ def setup_parser(parser):
 
 @require_grader_config
 def run(args):
+    if bool(args.assignment) == args.all:
+        logger.error("Give either an assignment or --all")
+        return
+
     g = Grader(args.path)
-    a = g.get_assignment(args.assignment)
-    a.build_image(args.no_cache, args.pull, args.silent)
+    if not args.all:
+        a = g.get_assignment(args.assignment)
+        a.build_image(args.no_cache, args.pull, args.silent, args.force)
+        return
+
+    # One broken assignment (e.g., a gradesheet that can't be loaded)
+    # shouldn't stop the others from being built
+    failed = []
+    for name in g.assignment_names:
+        try:
+            a = g.get_assignment(name)
+            a.build_image(args.no_cache, args.pull, args.silent, args.force)
+        except Exception as e:
+            logger.error("Could not build %s: %s", name, e)
+            failed.append(name)
+
+    if failed:
+        logger.error("Failed to build: %s", ", ".join(failed))
+        raise SystemExit(1)
@@ -12,7 +12,6 @@ from prettytable import PrettyTable
 
 logger = logging.getLogger(__name__)
 
-help = "Import student submission(s)"
 
 def setup_parser(parser):
     subparsers = parser.add_subparsers(title='Canvas commands')
@@ -62,10 +61,8 @@ def import_from_canvas(args):
             logger.error("Could not get username for %s", s['sortable_name'])
 
         if not force:
-            for student in g.config.roster:
-                if student['name'] == s['sortable_name']:
-                    logger.warning("User %s is already in the roster, skipping", s['sis_user_id'])
-                    break
+            if g.config.roster.by_name(s['sortable_name']):
+                logger.warning("User %s is already in the roster, skipping", s['sis_user_id'])
             else:
                 g.config.roster.append({'name': s['sortable_name'], 'id': s['sis_user_id']})
         else:
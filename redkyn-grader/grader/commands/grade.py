@@ -1,20 +1,54 @@
 '''TODO: Grade command docs
 '''
+import functools
 import logging
+import shutil
+import sys
+import threading
+import time
 
-from grader.models import Grader
+from grader.models import ContainerPool, Grader, Submission
+from grader.utils.asyncdocker import AsyncDockerClient
 from grader.utils.config import require_grader_config
+from grader.utils import workqueue
+from grader.utils.jobs import run_async_jobs, run_jobs, summarize_jobs
 
 logger = logging.getLogger(__name__)
 
-help = "Grade assignment submission(s)"
-
 
 def setup_parser(parser):
     parser.add_argument('--rebuild', action='store_true',
                         help='Rebuild containers (if they exist).')
     parser.add_argument('--suppress_output', action='store_false',
                         help='Don\'t display output.')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='Number of students to grade at once. Each '
+                             'student\'s submissions are graded one after '
+                             'another, oldest first.')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='Drive all jobs from a single asyncio event '
+                             'loop instead of a thread pool.')
+    parser.add_argument('--force', action='store_true',
+                        help='Grade submissions even if they haven\'t '
+                             'changed since they were last graded.')
+    parser.add_argument('--skip-duplicates', action='store_true',
+                        help='Skip submissions identical to one that has '
+                             'already been graded for the same student.')
+    parser.add_argument('--pool', type=int, metavar='N',
+                        help='Grade in a pool of N containers that are '
+                             'reused between submissions (overrides '
+                             'container-pool-size in assignment.yml).')
+    parser.add_argument('--serve', metavar='[HOST:]PORT',
+                        help='Don\'t grade anything here. Instead, hand '
+                             'submissions out to "grader worker" processes '
+                             'that connect to this address. Without a '
+                             'HOST, only workers on this machine can '
+                             'connect.')
+    parser.add_argument('--lease-timeout', type=float,
+                        default=workqueue.LEASE_TIMEOUT,
+                        help='With --serve, seconds a worker can go without '
+                             'checking in before its submission is handed '
+                             'to another worker.')
     parser.add_argument('assignment',
                         help='Name of the assignment to grade.')
     parser.add_argument('student_id', nargs='?',
@@ -22,6 +56,60 @@ def setup_parser(parser):
     parser.set_defaults(run=run)
 
 
+def skip_duplicates(submissions):
+    """Filters out submissions whose archive is identical to one that has
+    already been graded (or is about to be).
+
+    :param list submissions: One student's submissions
+
+    :return: The submissions that still need grading
+    :rtype: list
+    """
+    graded = {}
+    for submission in submissions:
+        if submission.graded:
+            graded.setdefault(submission.sha1sum, submission)
+
+    remaining = []
+    for submission in submissions:
+        original = graded.get(submission.sha1sum)
+        if original is None:
+            remaining.append(submission)
+            graded[submission.sha1sum] = submission
+        elif original is submission:
+            logger.info("Skipping %s: already graded", submission)
+        else:
+            logger.info("Skipping %s: identical to %s",
+                        submission, original)
+    return remaining
+
+
+def grade_in_order(grade, submissions):
+    """Grades one student's submissions one after another, in the order
+    they were imported, so that the newest submission's result is the
+    last one recorded (and so the student's latest result) even when
+    students are graded in parallel. Stops at the first submission that
+    can't be graded.
+
+    :param grade: A callable that grades a single submission
+
+    :return: ``(submission, result path)`` pairs
+    :rtype: list
+    """
+    return [(submission, grade(submission)) for submission in submissions]
+
+
+async def grade_in_order_async(grade, submissions):
+    """Like :func:`grade_in_order`, but ``grade`` is a coroutine
+    function.
+
+    """
+    results = []
+    for submission in submissions:
+        results.append((submission, await grade(submission)))
+    return results
+
+
 @require_grader_config
 def run(args):
     g = Grader(args.path)
@@ -36,8 +124,200 @@ def run(args):
             logger.error("Cannot find student %s", args.student_id)
             return
 
-    for user_id, submissions in users.items():
-        logger.info("Grading submissions for %s", user_id)
-        for submission in submissions:
-            submission.grade(a, rebuild_container=args.rebuild,
-                             show_output=args.suppress_output)
+    if args.jobs < 1:
+        logger.error("--jobs must be at least 1")
+        return
+
+    if args.serve:
+        submissions = []
+        for user_id, user_submissions in sorted(users.items()):
+            if args.skip_duplicates:
+                user_submissions = skip_duplicates(user_submissions)
+            submissions.extend(user_submissions)
+        serve(a, submissions, args)
+        return
+
+    # With a single job, output is shown as it happens. Otherwise,
+    # each submission's output is shown in one piece once it's done.
+    live = args.jobs == 1
+    options = {
+        'rebuild_container': args.rebuild,
+        'show_output': live and args.suppress_output,
+        'force': args.force,
+        # Asks git, so it's looked up once rather than per submission
+        'gradesheet_commit': a.gradesheet.commit,
+    }
+    pool_size = args.pool
+    if pool_size is None:
+        pool_size = a.gradesheet.config.get('container-pool-size', 0)
+    if pool_size < 0:
+        logger.error("--pool must be at least 0")
+        return
+    if pool_size and args.use_async:
+        logger.error("--async can't be used with a container pool")
+        return
+    if pool_size and args.rebuild:
+        logger.error("--rebuild can't be used with a container pool; "
+                     "pooled containers are always new")
+        return
+
+    # Containers aren't created until the pool is warmed, below
+    pool = ContainerPool(a, pool_size) if pool_size else None
+    if pool:
+        options['pool'] = pool
+
+    endpoints = a.grader.endpoints
+    if args.use_async and len(endpoints) > 1:
+        logger.error("--async can't be used with more than one docker "
+                     "endpoint")
+        return
+
+    if args.use_async:
+        try:
+            client = AsyncDockerClient(base_url=endpoints.primary.url)
+        except ValueError as e:
+            logger.error("--async can't be used with %s: %s",
+                         endpoints.primary.url, e)
+            return
+        grade_func = functools.partial(Submission.grade_async, client=client)
+        in_order = grade_in_order_async
+        runner = run_async_jobs
+    else:
+        grade_func = Submission.grade
+        in_order = grade_in_order
+        runner = run_jobs
+
+    def grade(submission):
+        return grade_func(submission, a, **options)
+
+    # One job per student rather than per submission. A student's
+    # submissions are numbered in the order their results are recorded,
+    # so grading them in parallel could leave an older submission's
+    # output as the latest.
+    jobs = []
+    count = 0
+    for user_id, submissions in sorted(users.items()):
+        if args.skip_duplicates:
+            submissions = skip_duplicates(submissions)
+        if submissions:
+            jobs.append((user_id, functools.partial(in_order, grade,
+                                                    submissions)))
+            count += len(submissions)
+
+    logger.info("Grading %d submission(s) from %d student(s) with %d "
+                "job(s)", count, len(jobs), args.jobs)
+
+    start = time.monotonic()
+    results = []
+    try:
+        if pool and jobs:
+            pool.warm()
+
+        for result in runner(jobs, workers=args.jobs):
+            results.append(result)
+            if not result.ok:
+                logger.error("Could not grade %s: %s",
+                             result.name, result.error)
+                continue
+
+            logger.info("Graded %s in %.2fs", result.name, result.elapsed)
+            if not live and args.suppress_output:
+                for submission, path in result.value:
+                    print("==> {} <==".format(submission))
+                    with open(path) as f:
+                        shutil.copyfileobj(f, sys.stdout)
+                    print()
+    finally:
+        if pool:
+            pool.close()
+
+    logger.info(summarize_jobs(results, time.monotonic() - start))
+    if not all(r.ok for r in results):
+        raise SystemExit(1)
+
+
+def parse_address(address):
+    """Splits a ``[HOST:]PORT`` address. Without a host, only this
+    machine can connect.
+
+    :rtype: (str, int)
+    """
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def serve(assignment, submissions, args):
+    """Hands submissions out to workers, and records their results.
+    Submissions whose results are already here aren't handed out,
+    unless ``--force`` is given.
+    """
+    gradesheet_commit = assignment.gradesheet.commit
+    # Each worker builds its own image, so results are cached under what
+    # the image is built from rather than an image ID
+    build_hash = assignment.build_hash()
+    image = "build:{}".format(build_hash)
+    keys = {s.full_id: s._result_key(image, gradesheet_commit)
+            for s in submissions}
+    if not args.force:
+        submissions = [
+            s for s in submissions
+            if s._cached_result(keys[s.full_id],
+                                args.suppress_output) is None
+        ]
+    if not submissions:
+        logger.info("Nothing to grade")
+        return
+
+    jobs = [workqueue.Job(s.full_id, s.path, {
+        'assignment': assignment.name,
+        'full_id': s.full_id,
+        'sha1': s.sha1sum,
+        'gradesheet': gradesheet_commit,
+        'force': args.force,
+        'rebuild': args.rebuild,
+    }) for s in submissions]
+    by_id = {s.full_id: s for s in submissions}
+    # Results arrive on the server's threads
+    lock = threading.Lock()
+
+    def record(job, output, details):
+        # Output from a worker with a different gradesheet (or image)
+        # would be cached as if it were graded here; have it regraded
+        if details.get('gradesheet') != gradesheet_commit:
+            raise ValueError("{} graded with gradesheet {}, not {}".format(
+                job.worker, details.get('gradesheet'), gradesheet_commit))
+        if details.get('build_hash') != build_hash:
+            raise ValueError("{}'s image wasn't built from the same "
+                             "gradesheet".format(job.worker))
+
+        submission = by_id[job.name]
+        output = output.decode("utf-8")
+        with lock:
+            path = submission.record_output(output, keys[job.name])
+            logger.info("%s graded %s", job.worker, submission)
+            if args.suppress_output:
+                print("==> {} <==".format(submission))
+                print(output)
+        return path
+
+    try:
+        host, port = parse_address(args.serve)
+    except ValueError:
+        logger.error("--serve needs a port, not %s", args.serve)
+        raise SystemExit(1)
+
+    queue = workqueue.WorkQueue(jobs, lease_timeout=args.lease_timeout)
+    coordinator = workqueue.Coordinator(queue, record, host, port)
+    logger.info("Serving %d submission(s). Start workers with: "
+                "grader worker --token %s %s", len(jobs),
+                coordinator.token, coordinator.url)
+
+    start = time.monotonic()
+    results = coordinator.serve()
+    for result in results:
+        if not result.ok:
+            logger.error("Could not grade %s: %s", result.name, result.error)
+
+    logger.info(summarize_jobs(results, time.monotonic() - start))
+    if not all(r.ok for r in results):
+        raise SystemExit(1)
@@ -7,8 +7,6 @@ from grader.utils.config import require_grader_config
 
 logger = logging.getLogger(__name__)
 
-help = "Import student submission(s)"
-
 
 def setup_parser(parser):
     parser.add_argument('--kind', required=True,
@@ -16,6 +14,9 @@ def setup_parser(parser):
     parser.add_argument('--pattern',
                         help='Regular expression to match student ID'
                         ' in submission filename')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='Number of submissions to import at once '
+                        '(only for --kind multiple)')
     parser.add_argument('assignment',
                         help='Name of the assignment to add submission(s) to.')
     parser.add_argument('submission_path',
@@ -28,5 +29,12 @@ def run(args):
     g = Grader(args.path)
     a = g.get_assignment(args.assignment)
 
+    if args.jobs < 1:
+        logger.error("--jobs must be at least 1")
+        return
+    if args.jobs > 1 and args.kind != 'multiple':
+        logger.warning("--jobs only applies to --kind multiple")
+
     pattern = args.pattern if args.pattern else r"(?P<id>.*)"
-    a.import_submission(args.submission_path, args.kind, pattern)
+    a.import_submission(args.submission_path, args.kind, pattern,
+                        jobs=args.jobs)
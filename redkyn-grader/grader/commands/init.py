@@ -9,8 +9,6 @@ from grader.utils.config import is_grader_dir
 
 logger = logging.getLogger(__name__)
 
-help = 'Initialize grader by creating grader.yml'
-
 
 def setup_parser(parser):
     parser.add_argument('--course-id', default=str(uuid.uuid4()),
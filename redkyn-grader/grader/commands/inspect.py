@@ -2,14 +2,12 @@ import logging
 import shutil
 import subprocess
 
-from grader.models import Grader
+from grader.models import Grader, Submission
 from grader.utils.config import require_grader_config
 from grader.utils.interactive import submission_choice
 
 logger = logging.getLogger(__name__)
 
-help = "Inspect a graded submission's container."
-
 
 def setup_parser(parser):
     parser.add_argument('assignment',
@@ -39,11 +37,18 @@ def run(args):
 def inspect(a, id, user=None):
     shell = a.gradesheet.config.get('shell', '/bin/bash')
 
+    # The container may be on any of the grader's docker endpoints
+    _, uuid = Submission.split_full_id(id)
+    endpoint = a.containers.endpoint(uuid) or a.grader.endpoints.primary
+
     # Start container, run exec, stop container
     logger.info("Starting container {0}".format(id))
-    a.docker_cli.start(container=id)
+    endpoint.client.start(container=id)
 
-    command = [shutil.which("docker"), "exec", "-it"]
+    command = [shutil.which("docker")]
+    if not endpoint.is_default:
+        command.extend(["-H", endpoint.url])
+    command.extend(["exec", "-it"])
     if user:
         command.extend(["-u", user])
 
@@ -51,4 +56,4 @@ def inspect(a, id, user=None):
     subprocess.call(command)
 
     logger.info("Stopping container {0}".format(id))
-    a.docker_cli.stop(container=id)
+    endpoint.client.stop(container=id)
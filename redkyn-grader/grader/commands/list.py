@@ -12,8 +12,6 @@ from grader.utils.config import require_grader_config
 
 logger = logging.getLogger(__name__)
 
-help = "List student submission(s)"
-
 
 def setup_parser(parser):
     parser.add_argument('--submissions', action='store_true',
@@ -89,28 +87,26 @@ def build_submission_info(assignments, full=False):
 def run(args):
     g = Grader(args.path)
     assignments = g.assignments
-    a_info = build_assignment_info(assignments, full=args.full)
-    s_info = build_submission_info(assignments, full=args.full)
 
-    columns = [
-        "Assignment", "Total", "Graded", "Failed"
-    ]
-    rows = a_info
+    # Only load the assignment we're asked about
+    if args.assignment:
+        if args.assignment in assignments:
+            assignments = {args.assignment: assignments[args.assignment]}
+        else:
+            assignments = {}
 
     if args.submissions:
         columns = [
             "Assignment", "User ID", "Submission UUID", "Import Time",
             "Last File MTime", "Last Commit", "SHA1", "Re-Grades", "Failed"
         ]
-        rows = s_info
+        rows = build_submission_info(assignments, full=args.full)
         rows = sort_by_assignment(rows, args.sortby)
-
-    if args.assignment:
-        try:
-            a = assignments[args.assignment]
-            rows = [r for r in rows if r['Assignment'] == a.name]
-        except KeyError:
-            rows = []
+    else:
+        columns = [
+            "Assignment", "Total", "Graded", "Failed"
+        ]
+        rows = build_assignment_info(assignments, full=args.full)
 
     t = PrettyTable(columns)
     for row in rows:
@@ -5,8 +5,6 @@ import logging
 from grader.models import Grader
 from grader.utils.config import require_grader_config
 
-help = 'Create a new assignment'
-
 logger = logging.getLogger(__name__)
 
 
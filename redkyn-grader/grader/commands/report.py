@@ -11,8 +11,6 @@ from grader.utils.config import require_grader_config
 
 logger = logging.getLogger(__name__)
 
-help = "Generate reports using a gradesheet template"
-
 
 def setup_parser(parser):
     parser.add_argument('--template', type=str, default="markdown",
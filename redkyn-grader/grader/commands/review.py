@@ -13,9 +13,6 @@ from grader.commands.inspect import inspect
 
 logger = logging.getLogger(__name__)
 
-help = "Opens results for each submission along with submission code in an \
-        editor."
-
 
 def setup_parser(parser):
     parser.add_argument('assignment',
@@ -94,7 +91,7 @@ def review_loop(assignment, start_at):
                     choice = "A"
 
                 elif choice == "G":
-                    sub.grade(assignment, show_output=True)
+                    sub.grade(assignment, show_output=True, force=True)
                     choice = "A"
 
             if choice == "Q":
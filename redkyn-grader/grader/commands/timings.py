@@ -0,0 +1,52 @@
+'''Summarizes the timings recorded with ``grader --timings FILE``.
+
+For each phase of grading (and building), shows how many times it ran,
+the total time spent in it, and percentiles of how long it took.
+'''
+import logging
+
+from grader.utils.timings import PERCENTILES, read_records, summarize
+
+logger = logging.getLogger(__name__)
+
+
+def setup_parser(parser):
+    parser.add_argument('file',
+                        help='JSONL file written by "grader --timings".')
+    parser.add_argument('--run-id',
+                        help='Summarize this run, instead of the latest.')
+    parser.add_argument('--all', action='store_true',
+                        help='Summarize every run in the file together.')
+    parser.add_argument('--assignment',
+                        help='Only summarize phases for this assignment.')
+    parser.set_defaults(run=run)
+
+
+def run(args):
+    records = list(read_records(args.file))
+    if args.assignment:
+        records = [r for r in records
+                   if r.get('assignment') == args.assignment]
+    if not records:
+        logger.error("No timings found in %s", args.file)
+        return
+
+    if not args.all:
+        run_id = args.run_id or records[-1]['run']
+        records = [r for r in records if r['run'] == run_id]
+        if not records:
+            logger.error("No timings found for run %s", run_id)
+            return
+        logger.info("Run %s", run_id)
+
+    columns = ["count", "total"] + ["p{}".format(q) for q in PERCENTILES]
+    columns.append("max")
+    summary = summarize(records)
+    width = max(len("phase"), max(len(p) for p in summary))
+
+    print("{:<{}}".format("phase", width),
+          *("{:>9}".format(c) for c in columns))
+    for phase, stats in summary.items():
+        print("{:<{}}".format(phase, width),
+              "{:>9}".format(stats['count']),
+              *("{:>9.3f}".format(stats[c]) for c in columns[1:]))
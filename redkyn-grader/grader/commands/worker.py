@@ -0,0 +1,105 @@
+'''Grades submissions handed out by ``grader grade --serve``.
+
+Each worker grades with its own docker daemon, in its own grader
+directory, which needs the same roster and assignment (and gradesheet)
+as the coordinator's. Submissions are copied in as they're handed out, and the
+assignment's image is built the first time it's needed.
+'''
+import logging
+import os
+import socket
+import threading
+
+from grader.models import Grader, Submission
+from grader.utils.config import require_grader_config
+from grader.utils.files import link_or_copy
+from grader.utils.jobs import run_jobs
+from grader.utils.workqueue import Worker
+
+logger = logging.getLogger(__name__)
+
+
+def setup_parser(parser):
+    parser.add_argument('url',
+                        help='Address of the coordinator, as printed by '
+                             '"grader grade --serve".')
+    parser.add_argument('--token', required=True,
+                        help='The coordinator\'s token, as printed by '
+                             '"grader grade --serve".')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='Number of submissions to grade at once.')
+    parser.add_argument('--name', default=socket.gethostname(),
+                        help='Name to give the coordinator in its logs.')
+    parser.set_defaults(run=run)
+
+
+class JobGrader(object):
+    """Grades the submissions a :class:`~grader.utils.workqueue.Worker`
+    is handed, in a grader directory on this machine.
+
+    """
+
+    def __init__(self, grader):
+        self.grader = grader
+        self._lock = threading.Lock()
+        self._built = {}
+
+    def _assignment(self, name):
+        """Returns an assignment, and the hash of the image it's graded
+        in. The image is built (if it's out of date) the first time.
+
+        """
+        a = self.grader.get_assignment(name)
+        with self._lock:
+            if name not in self._built:
+                # Doesn't build anything if the image is up to date
+                a.build_image(silent=True)
+                self._built[name] = a.build_hash()
+        return a, self._built[name]
+
+    def __call__(self, info, path):
+        a, build_hash = self._assignment(info['assignment'])
+        commit = a.gradesheet.commit
+        if commit != info['gradesheet']:
+            logger.warning("%s's gradesheet here (%s) isn't the same as "
+                           "the coordinator's (%s)", a.name,
+                           commit, info['gradesheet'])
+
+        tar_name = "{}.tar.gz".format(info['full_id'])
+        dest = os.path.join(a.submissions_dir, tar_name)
+        if not os.path.exists(dest):
+            link_or_copy(path, dest)
+            a.invalidate_submissions()
+
+        submission = Submission(a, tar_name)
+        result = submission.grade(a, rebuild_container=info['rebuild'],
+                                  show_output=False, force=info['force'],
+                                  gradesheet_commit=commit)
+        with open(result, 'rb') as f:
+            output = f.read()
+        return output, {'gradesheet': commit, 'build_hash': build_hash}
+
+
+@require_grader_config
+def run(args):
+    if args.jobs < 1:
+        logger.error("--jobs must be at least 1")
+        return
+
+    grade = JobGrader(Grader(args.path))
+    workers = [
+        ("worker {}".format(i),
+         Worker(args.url, grade, "{}/{}".format(args.name, i),
+                token=args.token).run)
+        for i in range(args.jobs)
+    ]
+
+    results = list(run_jobs(workers, workers=args.jobs))
+    for result in results:
+        if not result.ok:
+            logger.error("%s stopped: %s", result.name, result.error)
+
+    logger.info("Graded %d submission(s)",
+                sum(r.value for r in results if r.ok))
+    if not all(r.ok for r in results):
+        raise SystemExit(1)
@@ -1,10 +1,19 @@
 from .assignment import Assignment, AssignmentError   # NOQA
+from .blobs import BlobStore                          # NOQA
 from .config import (                                 # NOQA
     GraderConfig, AssignmentConfig, ConfigValidationError
 )
 
+from .endpoints import (                              # NOQA
+    DockerEndpoint, DockerEndpoints
+)
 from .grader import (                                 # NOQA
     Grader, GraderError, AssignmentNotFoundError
 )
 from .gradesheet import GradeSheet, GradeSheetError   # NOQA
+from .index import AssignmentIndex                    # NOQA
+from .inventory import ContainerInventory             # NOQA
+from .pool import ContainerPool, ContainerPoolError   # NOQA
+from .results import ResultsIndex                     # NOQA
+from .roster import Roster                            # NOQA
 from .submission import Submission, SubmissionError   # NOQA
@@ -1,12 +1,20 @@
 import docker
-import itertools
 import json
 import logging
 import os
 import shutil
 import tempfile
+import time
 
+from grader.utils import timings
+from grader.utils.files import hash_build_context
+
+from .blobs import BlobStore
+from .config import RACY_WINDOW
 from .gradesheet import GradeSheet
+from .index import AssignmentIndex
+from .inventory import ContainerInventory
+from .results import ResultsIndex
 from .mixins import DockerClientMixin
 from .submission import Submission
 
@@ -143,6 +151,14 @@ class Assignment(DockerClientMixin):
         else:
             GradeSheet.new(gradesheet_dir, assignment_name)
 
+    @property
+    def docker_cli(self):
+        """A docker Client object for the grader's primary endpoint,
+        where the assignment's image is built
+
+        """
+        return self.grader.endpoints.primary.client
+
     @property
     def image_tag(self):
         """Unique tag for an assignment's docker image"""
@@ -166,24 +182,131 @@ class Assignment(DockerClientMixin):
         """File path to the assignment's submissions directory"""
         return os.path.join(self.path, "submissions")
 
+    @property
+    def index(self):
+        """The assignment's :class:`AssignmentIndex` of submission metadata"""
+        if self._index is None:
+            self._index = AssignmentIndex(self.path)
+        return self._index
+
+    @property
+    def blobs(self):
+        """The assignment's :class:`BlobStore` of submission archives"""
+        return BlobStore(self.path)
+
+    def _submissions_stamp(self):
+        stat = os.stat(self.submissions_dir)
+        return (stat.st_mtime_ns, stat.st_ctime_ns, stat.st_ino)
+
+    def _load_submissions(self):
+        records = self.index.records()
+        submissions = []
+        for tar_name in os.listdir(self.submissions_dir):
+            # Skip partially-written imports
+            if tar_name.startswith("."):
+                continue
+
+            path = os.path.join(self.submissions_dir, tar_name)
+            record = records.pop(Submission._remove_extension(tar_name), None)
+            if record is not None and AssignmentIndex.is_stale(record, path):
+                record = None
+
+            submission = Submission(self, tar_name, record)
+            if record is None:
+                logger.debug("Indexing %s", tar_name)
+                submission.reindex()
+            submissions.append(submission)
+
+        # Forget about submissions that have been removed
+        if records:
+            self.index.remove(*records)
+
+        return submissions
+
+    def _cached_submissions(self):
+        """Returns this assignment's submissions, and the same grouped by
+        user. They're only loaded again if the submissions directory has
+        changed since the last time, or :meth:`invalidate_submissions`
+        has been called.
+
+        """
+        stamp = self._submissions_stamp()
+        cached = self._submissions_cache
+        if cached is not None and cached[0] == stamp:
+            return cached[1], cached[2]
+
+        submissions = self._load_submissions()
+        by_user = {}
+        for submission in sorted(submissions, key=lambda x: x.user_id):
+            by_user.setdefault(submission.user_id, []).append(submission)
+        for user_submissions in by_user.values():
+            user_submissions.sort(key=lambda x: x.import_time)
+
+        # A change made within the timestamp granularity of the
+        # filesystem might not show up in the directory's mtime
+        if time.time() - stamp[0] / 1e9 > RACY_WINDOW:
+            self._submissions_cache = (stamp, submissions, by_user)
+        else:
+            self._submissions_cache = None
+        return submissions, by_user
+
+    def invalidate_submissions(self):
+        """Forgets the submissions loaded by :attr:`submissions` and
+        :attr:`submissions_by_user`, so they're loaded again next time.
+        Importers call this.
+
+        """
+        self._submissions_cache = None
+
     @property
     def submissions(self):
         """All submissions for this assignment"""
-        tarballs = os.listdir(self.submissions_dir)
-        return [Submission(self, p) for p in tarballs]
+        submissions, _ = self._cached_submissions()
+        return list(submissions)
 
     @property
     def submissions_by_user(self):
         """All submissions for this assignment grouped by user"""
-        submissions = sorted(self.submissions, key=lambda x: x.user_id)
-        groups = itertools.groupby(submissions, key=lambda x: x.user_id)
-        return {k: sorted(g, key=lambda x: x.import_time) for k, g in groups}
+        _, by_user = self._cached_submissions()
+        return {k: list(v) for k, v in by_user.items()}
 
     @property
     def results_dir(self):
         """File path to the assignment's results directory"""
         return os.path.join(self.path, "results")
 
+    @property
+    def gradesheet(self):
+        """The assignment's :class:`GradeSheet`. It's loaded the first
+        time it's needed.
+
+        :raises GradeSheetError: if there was an error constructing
+            the GradeSheet
+        """
+        if self._gradesheet is None:
+            self._gradesheet = GradeSheet(self)
+        return self._gradesheet
+
+    @property
+    def containers(self):
+        """The assignment's :class:`ContainerInventory` of submission
+        containers, shared by all of its submissions
+
+        """
+        if self._containers is None:
+            self._containers = ContainerInventory(self)
+        return self._containers
+
+    @property
+    def results(self):
+        """The assignment's :class:`ResultsIndex`, shared by all of its
+        submissions
+
+        """
+        if self._results is None:
+            self._results = ResultsIndex(self.results_dir)
+        return self._results
+
     @property
     def gradesheet_dir(self):
         """File path to the assignment's gradesheet repository"""
@@ -205,14 +328,15 @@ class Assignment(DockerClientMixin):
             assignment path, or if the directory for the gradesheet
             repository doesn't exist
 
-        :raises GradeSheetError: if there was an error
-            constructing the Assignment's :class:`GradeSheet`
-
         """
         logger.debug("Loading assignment.")
         self.path = os.path.join(grader.assignment_dir, assignment_name)
         self.name = assignment_name
         self.grader = grader
+        self._index = None
+        self._results = None
+        self._containers = None
+        self._submissions_cache = None
 
         # Verify that paths exist like we expect
         if not os.path.exists(self.path):
@@ -232,61 +356,110 @@ class Assignment(DockerClientMixin):
                 "%s has no gradesheet directory", self.name
             )
 
-        self.gradesheet = GradeSheet(self)
+        self._gradesheet = None
 
     def __str__(self):
         """String representation of an Assignment (i.e., its name)"""
         return self.name
 
-    def build_image(self, nocache=False, pull=False, silent=False):
+    BUILD_HASH_LABEL = "build_hash"
+    """Image label that holds the hash of everything the image was built
+    from; see :func:`~grader.utils.files.hash_build_context`"""
+
+    @property
+    def image_build_hash(self):
+        """The build hash recorded on the assignment's current image, or
+        None if it hasn't been built (or was built without one)
+
+        """
+        try:
+            image = self.docker_cli.inspect_image(self.image_tag)
+        except docker.errors.NotFound:
+            return None
+        labels = (image.get('Config') or {}).get('Labels') or {}
+        return labels.get(self.BUILD_HASH_LABEL)
+
+    def build_hash(self):
+        """Hashes the assignment's gradesheet directory and its
+        ``image-build-options``, the way they'd be built now.
+
+        :rtype: str
+        """
+        options = self.gradesheet.config.get('image-build-options', {})
+        return hash_build_context(self.gradesheet.path, options,
+                                  options.get('dockerfile'))
+
+    def build_image(self, nocache=False, pull=False, silent=False,
+                    force=False):
         """Build's an assignment's docker image using the Dockerfile from its
         :class:`GradeSheet`.
 
         The docker image will be tagged, so that this assignment's
         image is unique from the rest of the assignment images on a
-        given machine.
+        given machine. It's labelled with a hash of its build context
+        and options, and it isn't built again until they change.
 
-        :return: :obj:`None`
+        :param bool force: Whether to build the image even if nothing it's
+            built from has changed. Building without docker's cache
+            always does.
+
+        :return: The ID of the image
 
         """
 
         if pull:
             logger.debug("Attempting to pull gradesheet")
-            self.gradesheet.pull()
+            with timings.phase("pull", assignment=self.name):
+                self.gradesheet.pull()
+
+        # Skip the build if nothing it depends on has changed
+        build_hash = self.build_hash()
+        if not (force or nocache) and self.image_build_hash == build_hash:
+            logger.info("%s's image is up to date", self.name)
+            return self.image_id
 
         # Load build options from the config
-        build_options = self.gradesheet.config.get('image-build-options', {})
+        build_options = dict(
+            self.gradesheet.config.get('image-build-options', {})
+        )
 
         # Override required build options
         build_options.update({
             "path": self.gradesheet.path,
             "tag": self.image_tag,
             "decode": not silent,
-            "nocache": nocache
+            "nocache": nocache,
+            "labels": dict(build_options.get('labels') or {},
+                           **{self.BUILD_HASH_LABEL: build_hash}),
         })
 
         logger.info("Building image...")
         logger.debug("Image options: {}".format(build_options))
 
         # Build
-        try:
-            output = self.docker_cli.build(**build_options)
-
-            # Log output line-by-line to avoid running the build
-            # asynchronously
-            prompt = "building {}>".format(self.name)
-            for line in output:
-                if silent:
-                    continue
-
-                error = 'Error: "{}"\n'.format(line.get('error', ''))
-                stream = line.get('stream', '')
-                print(prompt, stream or error, end="")
-        except docker.errors.APIError as e:
-            logger.debug(str(e))
-            raise AssignmentBuildError(
-                "Unable to build: {}".format(e.explanation)
-            ) from e
+        with timings.phase("build", assignment=self.name):
+            try:
+                output = self.docker_cli.build(**build_options)
+
+                # Log output line-by-line to avoid running the build
+                # asynchronously
+                prompt = "building {}>".format(self.name)
+                for line in output:
+                    if silent:
+                        continue
+
+                    error = 'Error: "{}"\n'.format(line.get('error', ''))
+                    stream = line.get('stream', '')
+                    print(prompt, stream or error, end="")
+            except docker.errors.APIError as e:
+                logger.debug(str(e))
+                raise AssignmentBuildError(
+                    "Unable to build: {}".format(e.explanation)
+                ) from e
+
+        # Containers are checked against the new image from now on
+        if self._containers is not None:
+            self._containers.refresh()
 
         return self.image_id
 
@@ -295,9 +468,14 @@ class Assignment(DockerClientMixin):
         """
         self.docker_cli.remove_image(self.image_tag)
 
-    def import_submission(self, path, submission_type, pattern):
+    def import_submission(self, path, submission_type, pattern, jobs=1):
         importer = Submission.get_importer(submission_type)
-        submissions = importer(self, path, pattern)
+        if submission_type == 'multiple':
+            submissions = importer(self, path, pattern, jobs=jobs)
+        else:
+            submissions = importer(self, path, pattern)
+
+        self.invalidate_submissions()
 
         for submission in submissions:
             if submission:
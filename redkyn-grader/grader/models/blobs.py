@@ -0,0 +1,107 @@
+import logging
+import os
+
+from grader.utils.files import link_or_copy
+
+logger = logging.getLogger(__name__)
+
+
+class BlobStore(object):
+    """A content-addressed store of submission archives, kept in the
+    assignment directory.
+
+    Each distinct archive is stored once, named after its SHA1 sum::
+
+        blobs/
+            3f/
+                3f786850e387550fdab836ed7e6dc881de23001b.tar.gz
+
+    Submissions in ``submissions/`` are links to (or, if linking isn't
+    possible, copies of) blobs, so a student who submits the same
+    archive five times only takes up the space of one.
+
+    """
+
+    SUB_DIR = "blobs"
+    """Name of the store's directory within the assignment directory"""
+
+    EXTENSION = ".tar.gz"
+    """Extension of the archives in the store"""
+
+    def __init__(self, path):
+        """Instantiates a BlobStore.
+
+        :param str path: The directory containing the store (i.e., the
+            assignment directory)
+
+        """
+        self.path = os.path.join(path, self.SUB_DIR)
+
+    def path_for(self, sha1):
+        """Returns the path at which the archive with a given SHA1 sum is
+        stored (whether it's there or not).
+
+        :param str sha1: The archive's SHA1 sum (hex digits)
+
+        :rtype: str
+        """
+        return os.path.join(self.path, sha1[:2], sha1 + self.EXTENSION)
+
+    def incoming_path(self, name):
+        """Returns a path in the store for writing a new archive whose SHA1
+        sum isn't known yet. Pass it to :meth:`add` once it's written.
+
+        :param str name: A unique name for the archive
+
+        :rtype: str
+        """
+        os.makedirs(self.path, exist_ok=True)
+        return os.path.join(self.path, ".incoming-{}{}".format(
+            name, self.EXTENSION))
+
+    def add(self, path, sha1, move=False):
+        """Adds an archive to the store, unless an identical one is already
+        there.
+
+        :param str path: The archive to add
+
+        :param str sha1: The archive's SHA1 sum
+
+        :param bool move: Whether the archive can be moved into the
+            store. Otherwise it's copied (reflinked, if possible, but
+            never hard linked, so later changes to the original don't
+            reach the store) and left alone. If it isn't needed, it's
+            removed.
+
+        :return: The path to the archive in the store
+        :rtype: str
+
+        """
+        blob = self.path_for(sha1)
+        if os.path.isfile(blob):
+            logger.debug("Already have %s", sha1)
+            if move:
+                os.remove(path)
+            return blob
+
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        if move:
+            os.replace(path, blob)
+        else:
+            link_or_copy(path, blob, hardlink=False)
+        logger.debug("Stored %s", sha1)
+        return blob
+
+    def place(self, sha1, dest):
+        """Puts a stored archive at ``dest``.
+
+        :param str sha1: The archive's SHA1 sum
+
+        :param str dest: Where the archive should appear
+
+        :return: How the archive got there (see
+            :func:`~grader.utils.files.link_or_copy`)
+        :rtype: str
+
+        """
+        return link_or_copy(self.path_for(sha1), dest)
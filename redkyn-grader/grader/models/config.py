@@ -1,10 +1,29 @@
+import copy
+import hashlib
+import json
 import jsonschema
 import logging
 import os
+import tempfile
+import time
 import yaml
 
+from .roster import Roster
+
 logger = logging.getLogger(__name__)
 
+CACHE_DIR_ENV = "GRADER_CONFIG_CACHE"
+"""If this environment variable names a directory, validated configs are
+cached there (as JSON), so they're reused across grader commands."""
+
+RACY_WINDOW = 1.0
+"""Files modified less than this many seconds ago aren't cached. A file
+rewritten within the timestamp granularity of the filesystem might
+otherwise look unchanged."""
+
+_validators = {}
+_cache = {}
+
 
 class ConfigValidationError(Exception):
     """An exception thrown when a config file cannot be validated
@@ -58,15 +77,112 @@ class Config(object):
 
         return cls(path)
 
+    @classmethod
+    def _validator(cls):
+        """Returns a validator for :data:`SCHEMA`, compiled the first time
+        it's needed.
+
+        """
+        validator = _validators.get(cls)
+        if validator is None:
+            validator_class = jsonschema.validators.validator_for(cls.SCHEMA)
+            validator_class.check_schema(cls.SCHEMA)
+            validator = _validators[cls] = validator_class(cls.SCHEMA)
+        return validator
+
     @classmethod
     def _validate(cls, obj):
-        try:
-            jsonschema.validate(obj, cls.SCHEMA)
-        except jsonschema.ValidationError as e:
+        error = jsonschema.exceptions.best_match(
+            cls._validator().iter_errors(obj)
+        )
+        if error is not None:
             raise ConfigValidationError(
-                "{} is invalid.\n{}".format(cls.CONFIG_FILE_NAME, str(e))
+                "{} is invalid.\n{}".format(cls.CONFIG_FILE_NAME, str(error))
             )
 
+    @classmethod
+    def _schema_digest(cls):
+        schema = json.dumps(cls.SCHEMA, sort_keys=True).encode()
+        return hashlib.sha1(schema).hexdigest()
+
+    @classmethod
+    def _disk_cache_path(cls, file_path):
+        cache_dir = os.environ.get(CACHE_DIR_ENV)
+        if not cache_dir or not os.path.isdir(cache_dir):
+            return None
+        key = "{}:{}".format(cls.__name__, os.path.abspath(file_path))
+        return os.path.join(
+            cache_dir, hashlib.sha1(key.encode()).hexdigest() + ".json"
+        )
+
+    @classmethod
+    def _read_disk_cache(cls, file_path, stamp):
+        cache_path = cls._disk_cache_path(file_path)
+        if cache_path is None:
+            return None
+        try:
+            with open(cache_path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get('stamp') != list(stamp) or \
+           entry.get('schema') != cls._schema_digest():
+            return None
+        logger.debug("Using cached copy of %s", file_path)
+        return entry['data']
+
+    @classmethod
+    def _write_disk_cache(cls, file_path, stamp, data):
+        cache_path = cls._disk_cache_path(file_path)
+        if cache_path is None:
+            return
+        entry = {'stamp': stamp, 'schema': cls._schema_digest(),
+                 'data': data}
+        temp = None
+        try:
+            fd, temp = tempfile.mkstemp(dir=os.path.dirname(cache_path))
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f)
+            os.replace(temp, cache_path)
+        except (OSError, TypeError, ValueError) as e:
+            # e.g., YAML dates, which JSON can't represent
+            logger.debug("Could not cache %s: %s", file_path, e)
+            if temp is not None and os.path.exists(temp):
+                os.remove(temp)
+
+    @classmethod
+    def _load(cls, file_path):
+        """Loads and validates a config file. Configs are cached (keyed on
+        the file's path, size and modification time), so an unchanged
+        file is only parsed and validated once.
+
+        :return: The config data. It's a copy, so it's safe to modify.
+        :rtype: dict
+        """
+        stat = os.stat(file_path)
+        stamp = (stat.st_size, stat.st_mtime_ns, stat.st_ino,
+                 stat.st_ctime_ns)
+        key = (cls, file_path)
+
+        cached = _cache.get(key)
+        if cached is not None and cached[0] == stamp:
+            return copy.deepcopy(cached[1])
+
+        data = cls._read_disk_cache(file_path, stamp)
+        cacheable = time.time() - stat.st_mtime > RACY_WINDOW
+        if data is None:
+            with open(file_path) as config_file:
+                logger.debug("Loading {}.".format(file_path))
+                data = yaml.safe_load(config_file)
+            logger.debug("Validating {}.".format(file_path))
+            cls._validate(data)
+            if cacheable:
+                cls._write_disk_cache(file_path, stamp, data)
+
+        if cacheable:
+            _cache[key] = (stamp, data)
+        return copy.deepcopy(data)
+
     @property
     def file_path(self):
         """The full file path to the corresponding configuration file.
@@ -88,11 +204,7 @@ class Config(object):
         if not os.path.exists(path):
             raise FileNotFoundError("Cannot open {}".format(path))
 
-        with open(self.file_path) as config_file:
-            logger.debug("Loading {}.".format(self.file_path))
-            self.data = yaml.safe_load(config_file)
-            logger.debug("Validating {}.".format(self.file_path))
-            self.__class__._validate(self.data)
+        self.data = self.__class__._load(self.file_path)
 
     def __getitem__(self, name):
         """Returns the configuration item for key ``name``
@@ -131,7 +243,7 @@ class GraderConfig(Config):
     """The name of the configuration file on disk"""
 
     SCHEMA = {
-        "$schema": "http://json-schema.org/schema#",
+        "$schema": "http://json-schema.org/draft-04/schema#",
 
         "type": "object",
         "properties": {
@@ -166,6 +278,13 @@ class GraderConfig(Config):
             "canvas-host": {
                 "type": "string",
             },
+            # Docker daemons to place submission containers on
+            "docker-endpoints": {
+                "type": "array",
+                "items": {"type": "string"},
+                "minItems": 1,
+                "uniqueItems": True,
+            },
         },
         "required": ["course-id", "course-name"],
         "additionalProperties": False,
@@ -174,13 +293,19 @@ class GraderConfig(Config):
 
     @property
     def roster(self):
+        """The course :class:`Roster`. It's indexed the first time it's
+        used.
+
+        """
         if 'roster' not in self.data:
             self.data['roster'] = []
-        return self.data['roster']
+        roster = getattr(self, '_roster', None)
+        if roster is None or roster.students is not self.data['roster']:
+            roster = self._roster = Roster(self.data['roster'])
+        return roster
 
     def get_student_name(self, student_id):
-        d = {x['id']: x['name'] for x in self.roster}
-        return d[student_id]
+        return self.roster.name_of(student_id)
 
 
 class AssignmentConfig(Config):
@@ -193,7 +318,7 @@ class AssignmentConfig(Config):
     """The name of the configuration file on disk"""
 
     SCHEMA = {
-        "$schema": "http://json-schema.org/schema#",
+        "$schema": "http://json-schema.org/draft-04/schema#",
 
         "type": "object",
         "properties": {
@@ -205,7 +330,23 @@ class AssignmentConfig(Config):
             "shell": {
                 "type": "string"
             },
-            "review-editor": {"type": "string"}
+            "review-editor": {"type": "string"},
+            "container-pool-size": {
+                "type": "integer",
+                "minimum": 0
+            },
+            "legacy-unpack": {"type": "boolean"},
+            # Seconds grade-it may run, and bytes it may print, before
+            # its container is killed
+            "grade-timeout": {
+                "type": "number",
+                "minimum": 0,
+                "exclusiveMinimum": True
+            },
+            "grade-output-limit": {
+                "type": "integer",
+                "minimum": 1
+            }
         },
         "required": ["assignment-name"],
         "additionalProperties": False
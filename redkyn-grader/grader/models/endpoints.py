@@ -0,0 +1,121 @@
+import logging
+import threading
+
+from collections.abc import Sequence
+from contextlib import contextmanager
+
+from .mixins import DEFAULT_ENDPOINT, DockerClientMixin
+
+logger = logging.getLogger(__name__)
+
+
+class DockerEndpoint(object):
+    """A docker daemon that submission containers can be placed on.
+
+    :ivar str url: The daemon's address, e.g.,
+        ``unix://var/run/docker.sock`` or ``tcp://grading-2:2375``
+    :ivar int busy: How many submissions are being graded on it (by
+        this process) right now
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.busy = 0
+        self._client = None
+
+    @property
+    def client(self):
+        """A docker Client object for this daemon. Always returns the
+        same one.
+
+        """
+        if self._client is None:
+            logger.debug("Creating Docker client for %s", self.url)
+            self._client = DockerClientMixin.docker_client_factory(self.url)
+        return self._client
+
+    @property
+    def is_default(self):
+        """Whether this is the local daemon docker uses by default"""
+        return self.url == DEFAULT_ENDPOINT
+
+    def __repr__(self):
+        return "DockerEndpoint({!r})".format(self.url)
+
+
+class DockerEndpoints(Sequence):
+    """Every docker daemon grader can use, from ``docker-endpoints`` in
+    ``grader.yml``. The first one is the primary endpoint: images are
+    built there, and copied to the others when they're needed.
+
+    """
+
+    def __init__(self, urls=None):
+        """Instantiates DockerEndpoints.
+
+        :param list urls: The daemons' addresses. Defaults to just the
+            local daemon.
+
+        """
+        self._endpoints = [DockerEndpoint(url)
+                           for url in urls or [DEFAULT_ENDPOINT]]
+        self._by_url = {e.url: e for e in self._endpoints}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, i):
+        return self._endpoints[i]
+
+    def __len__(self):
+        return len(self._endpoints)
+
+    @property
+    def primary(self):
+        """The first endpoint"""
+        return self._endpoints[0]
+
+    def get(self, url):
+        """Returns the endpoint with an address, or None if there isn't
+        one.
+
+        :param str url: The endpoint's address
+        """
+        return self._by_url.get(url)
+
+    def _least_loaded(self, placed):
+        placed = placed or {}
+        return min(self._endpoints,
+                   key=lambda e: (e.busy, placed.get(e.url, 0)))
+
+    def least_loaded(self, placed=None):
+        """Returns the endpoint with the fewest submissions being graded
+        on it. Ties go to the one with the fewest containers, then to
+        the one listed first.
+
+        :param dict placed: Maps endpoint addresses to how many
+            containers they have
+        """
+        with self._lock:
+            return self._least_loaded(placed)
+
+    @contextmanager
+    def working(self, endpoint=None, placed=None):
+        """Counts a submission as being graded on an endpoint for the
+        duration of a ``with`` block.
+
+        :param DockerEndpoint endpoint: The endpoint. If it's None, the
+            least loaded one is picked (see :meth:`least_loaded`), and
+            counted as busy before anyone else can pick it.
+
+        :param dict placed: Passed to :meth:`least_loaded`
+
+        :return: A context manager that gives the endpoint
+        """
+        with self._lock:
+            if endpoint is None:
+                endpoint = self._least_loaded(placed)
+            endpoint.busy += 1
+        try:
+            yield endpoint
+        finally:
+            with self._lock:
+                endpoint.busy -= 1
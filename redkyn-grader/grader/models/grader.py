@@ -2,8 +2,11 @@ import logging
 import os
 import shutil
 
+from collections.abc import Mapping
+
 from .assignment import Assignment
 from .config import GraderConfig
+from .endpoints import DockerEndpoints
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +23,52 @@ class AssignmentNotFoundError(GraderError):
     pass
 
 
+class AssignmentMap(Mapping):
+    """A read-only dict of a Grader's assignments, keyed by name.
+
+    Listing names only looks at the assignments directory. Each
+    :class:`Assignment` is loaded the first time it's looked up, and
+    reused after that.
+
+    """
+
+    def __init__(self, grader):
+        self.grader = grader
+        self._loaded = {}
+
+    def _path(self, name):
+        return os.path.join(self.grader.assignment_dir, name)
+
+    def __iter__(self):
+        return iter(sorted(
+            name for name in os.listdir(self.grader.assignment_dir)
+            if not name.startswith(".") and os.path.isdir(self._path(name))
+        ))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __contains__(self, name):
+        return (isinstance(name, str) and not name.startswith(".") and
+                os.sep not in name and os.path.isdir(self._path(name)))
+
+    def __getitem__(self, name):
+        if not os.path.isdir(self.grader.assignment_dir):
+            raise FileNotFoundError(
+                "{} doesn't exist.".format(self.grader.assignment_dir)
+            )
+        if name not in self:
+            raise KeyError(name)
+        if name not in self._loaded:
+            logger.debug("Loading assignment %s", name)
+            self._loaded[name] = Assignment(self.grader, name)
+        return self._loaded[name]
+
+    def forget(self, name):
+        """Drops a loaded assignment, so it's loaded again next time."""
+        self._loaded.pop(name, None)
+
+
 class Grader(object):
     """A Grader.
 
@@ -63,17 +112,37 @@ class Grader(object):
 
     @property
     def assignments(self):
-        """All assignments associated with this grader"""
-        names = os.listdir(self.assignment_dir)
-        return {name: Assignment(self, name) for name in names}
+        """All assignments associated with this grader, as a dict-like
+        :class:`AssignmentMap`. Assignments are only loaded when they're
+        looked up.
+
+        """
+        return self._assignments
+
+    @property
+    def assignment_names(self):
+        """The names of all assignments associated with this grader,
+        sorted. Doesn't load any of them.
+
+        """
+        return list(self._assignments)
+
+    @property
+    def endpoints(self):
+        """The :class:`DockerEndpoints` submission containers are placed
+        on
+
+        """
+        if self._endpoints is None:
+            self._endpoints = DockerEndpoints(
+                self.config.get('docker-endpoints')
+            )
+        return self._endpoints
 
     @property
     def student_ids(self):
         """All student IDs from the roster"""
-        try:
-            return [s['id'] for s in self.config['roster']]
-        except KeyError:
-            return []
+        return self.config.roster.ids
 
     def __init__(self, path):
         """Instantiate a Grader.
@@ -94,6 +163,8 @@ class Grader(object):
             raise FileNotFoundError("{} doesn't exist.".format(path))
 
         self.config = GraderConfig(self.path)
+        self._assignments = AssignmentMap(self)
+        self._endpoints = None
 
     def create_assignment(self, name, repo=None):
         """Creates a new assignment directory on disk as well as an associated
@@ -114,6 +185,7 @@ class Grader(object):
 
         logger.debug("Creating assignment")
         Assignment.new(self, name, repo)
+        self._assignments.forget(name)
         logger.info("Created '{}'.".format(name))
 
     def get_assignment(self, name):
@@ -138,3 +210,4 @@ class Grader(object):
         """
         assignment_dir = os.path.join(self.assignment_dir, name)
         shutil.rmtree(assignment_dir, ignore_errors=True)
+        self._assignments.forget(name)
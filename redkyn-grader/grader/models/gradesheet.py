@@ -2,6 +2,7 @@ import git
 import glob
 import logging
 import os
+import threading
 
 from .config import AssignmentConfig
 
@@ -100,6 +101,24 @@ class GradeSheet(object):
         return {os.path.basename(t).split('.')[0].lower(): t
                 for t in templates}
 
+    @property
+    def commit(self):
+        """The SHA of the gradesheet repository's current commit, with
+        ``-dirty`` appended if there are uncommitted changes. None if
+        nothing has been committed yet.
+
+        """
+        # GitPython's repositories can't be used from several threads
+        # at once
+        with self._lock:
+            try:
+                sha = self.repository.head.commit.hexsha
+            except ValueError:
+                return None
+            if self.repository.is_dirty(untracked_files=True):
+                sha += "-dirty"
+            return sha
+
     def __init__(self, assignment):
         """Instantiates a GradeSheet.
 
@@ -116,6 +135,7 @@ class GradeSheet(object):
         self.assignment = assignment
         self.config = AssignmentConfig(self.path)
         self.repository = git.Repo(self.path)
+        self._lock = threading.Lock()
 
         # Verify that paths exist like we expect
         if not os.path.exists(self.dockerfile_path):
@@ -0,0 +1,237 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class AssignmentIndex(object):
+    """An on-disk index of metadata about an assignment's submissions,
+    stored as a SQLite database in the assignment directory.
+
+    Each submission gets a record with these keys:
+
+    ``full_id``, ``user_id``, ``uuid``
+        The submission's identifiers
+
+    ``size``, ``mtime``
+        The size and modification time of the submission archive when
+        it was indexed. If either changes, the record is stale.
+
+    ``import_time``
+        When the submission was imported (as a UNIX timestamp)
+
+    ``data``
+        A dict of metadata that's expensive to compute from the
+        archive (its SHA1, file mtimes, latest commit, ...). Keys are
+        filled in as they're computed.
+
+    It also remembers which result file holds the output of grading a
+    student's archive with a given SHA1 sum, docker image and gradesheet
+    commit, so unchanged submissions needn't be graded again.
+
+    Nothing is lost by deleting the database file (and its ``-wal`` and
+    ``-shm`` files) while grader isn't running. Records are rebuilt from
+    the archives, with import times from
+    :data:`~grader.models.submission.Submission.IMPORT_TIMES_DIR`.
+    Cached results are forgotten, so submissions are graded again.
+
+    """
+
+    FILE_NAME = "index.sqlite3"
+    """The name of the index database in the assignment directory"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS submissions (
+            full_id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            uuid TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            import_time REAL NOT NULL,
+            data TEXT NOT NULL DEFAULT '{}'
+        );
+        CREATE TABLE IF NOT EXISTS grade_results (
+            user_id TEXT NOT NULL,
+            sha1 TEXT NOT NULL,
+            image_id TEXT NOT NULL,
+            gradesheet TEXT NOT NULL,
+            result_file TEXT NOT NULL,
+            PRIMARY KEY (user_id, sha1, image_id, gradesheet)
+        );
+    """
+    """SQL to create the index's tables"""
+
+    FIELDS = ("full_id", "user_id", "uuid", "size", "mtime", "import_time")
+    """Columns of a record, apart from ``data``"""
+
+    def __init__(self, path):
+        """Instantiates an AssignmentIndex.
+
+        :param str path: The directory containing the index database
+            (i.e., the assignment directory)
+
+        """
+        self.path = os.path.join(path, self.FILE_NAME)
+        self._local = threading.local()
+
+    @classmethod
+    def is_stale(cls, record, archive_path):
+        """Checks whether a record still describes a submission archive.
+
+        :param dict record: A record from the index
+
+        :param str archive_path: The path to the submission's archive
+
+        :rtype: bool
+        """
+        stat = os.stat(archive_path)
+        return (record['size'] != stat.st_size or
+                record['mtime'] != stat.st_mtime)
+
+    def _connection(self):
+        # Each thread (and process) gets its own connection, which is
+        # kept open. Opening one per operation is cheap, but closing
+        # the last connection to a database syncs it to disk, which
+        # made every metadata update cost a trip to the disk.
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            connection.executescript(self.SCHEMA)
+            self._local.connection = connection
+            self._local.pid = pid
+        return self._local.connection
+
+    @contextmanager
+    def _connect(self):
+        connection = self._connection()
+        with connection:
+            yield connection
+
+    def close(self):
+        """Closes the calling thread's connection to the database. It's
+        reopened if the index is used again.
+
+        """
+        if getattr(self._local, 'pid', None) == os.getpid():
+            self._local.connection.close()
+        self._local.pid = None
+        self._local.connection = None
+
+    @classmethod
+    def _to_record(cls, row):
+        record = dict(zip(cls.FIELDS, row))
+        record['data'] = json.loads(row[-1])
+        return record
+
+    def records(self):
+        """Returns every record in the index.
+
+        :return: A dict mapping full submission IDs to records
+        :rtype: dict
+        """
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT {}, data FROM submissions".format(
+                    ", ".join(self.FIELDS))
+            ).fetchall()
+        return {row[0]: self._to_record(row) for row in rows}
+
+    def get(self, full_id):
+        """Returns the record for a submission, or None if there isn't one.
+
+        :param str full_id: The submission's full ID
+        """
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT {}, data FROM submissions WHERE full_id = ?".format(
+                    ", ".join(self.FIELDS)), (full_id,)
+            ).fetchone()
+        return self._to_record(row) if row else None
+
+    def put(self, record):
+        """Adds or replaces a record.
+
+        :param dict record: The record to store
+        """
+        values = [record[f] for f in self.FIELDS]
+        values.append(json.dumps(record.get('data', {})))
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO submissions ({}, data) "
+                "VALUES ({})".format(", ".join(self.FIELDS),
+                                     ", ".join("?" * len(values))),
+                values
+            )
+
+    def update_data(self, full_id, **data):
+        """Merges keys into a record's ``data``.
+
+        :param str full_id: The submission's full ID
+        """
+        with self._connect() as db:
+            # Take the write lock before reading, so concurrent updates
+            # to the same record can't clobber each other.
+            db.execute("BEGIN IMMEDIATE")
+            row = db.execute(
+                "SELECT data FROM submissions WHERE full_id = ?", (full_id,)
+            ).fetchone()
+            if row is None:
+                return
+            merged = json.loads(row[0])
+            merged.update(data)
+            db.execute(
+                "UPDATE submissions SET data = ? WHERE full_id = ?",
+                (json.dumps(merged), full_id)
+            )
+
+    def remove(self, *full_ids):
+        """Removes records from the index.
+
+        :param str full_ids: Full IDs of the submissions to remove
+        """
+        with self._connect() as db:
+            db.executemany("DELETE FROM submissions WHERE full_id = ?",
+                           [(i,) for i in full_ids])
+
+    def get_result(self, user_id, sha1, image_id, gradesheet):
+        """Looks up the result of grading a student's archive. Students
+        who hand in identical archives each get their own result.
+
+        :param str user_id: The student who submitted the archive
+
+        :param str sha1: The archive's SHA1 sum
+
+        :param str image_id: The ID of the docker image it was graded in
+
+        :param str gradesheet: The gradesheet commit it was graded with
+
+        :return: The name of the result file, or None if the archive
+            hasn't been graded like that
+        :rtype: str
+        """
+        with self._connect() as db:
+            row = db.execute(
+                "SELECT result_file FROM grade_results WHERE user_id = ? "
+                "AND sha1 = ? AND image_id = ? AND gradesheet = ?",
+                (user_id, sha1, image_id, gradesheet)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put_result(self, user_id, sha1, image_id, gradesheet, result_file):
+        """Records the result of grading an archive. See :meth:`get_result`.
+
+        :param str result_file: The name of the result file
+        """
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO grade_results "
+                "VALUES (?, ?, ?, ?, ?)",
+                (user_id, sha1, image_id, gradesheet, result_file)
+            )
@@ -0,0 +1,274 @@
+import asyncio
+import docker
+import logging
+import threading
+
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+from grader.utils import timings
+
+logger = logging.getLogger(__name__)
+
+
+class ContainerInventory(object):
+    """Every submission container for an assignment, fetched from docker
+    in a single call and kept in memory.
+
+    Looking up a submission's container used to take a couple of calls
+    to the docker daemon per submission. The inventory lists them all
+    at once, the first time one is needed, and keeps track of the
+    containers grader creates and removes after that. It doesn't notice
+    containers changed outside of grader, so it's meant to last for a
+    single command; call :meth:`refresh` to start over.
+
+    Containers are the dicts returned by ``docker_cli.containers()``,
+    which include their ``Id``, ``ImageID``, ``Created`` (a UNIX
+    timestamp) and ``Labels``. Containers can be on any of the grader's
+    :class:`~grader.models.endpoints.DockerEndpoints`; each one's
+    ``Endpoint`` is the address of the daemon it's on.
+
+    """
+
+    LABEL = "submission_uuid"
+    """Label that holds the UUID of a container's submission"""
+
+    ASSIGNMENT_LABEL = "assignment"
+    """Label that holds the image tag of a container's assignment.
+    Containers created by older versions of grader don't have it."""
+
+    def __init__(self, assignment):
+        """Instantiates a ContainerInventory. Nothing is fetched until it's
+        needed.
+
+        :param Assignment assignment: The assignment whose containers
+            to keep track of
+
+        """
+        self.assignment = assignment
+        self._lock = threading.RLock()
+        self._by_uuid = None
+        self._image_id = None
+        self._image_lock = threading.Lock()
+        self._has_image = set()
+        self._loading = None
+
+    @property
+    def endpoints(self):
+        """The :class:`~grader.models.endpoints.DockerEndpoints`
+        containers are placed on"""
+        return self.assignment.grader.endpoints
+
+    def _load(self):
+        with self._lock:
+            if self._by_uuid is not None:
+                return self._by_uuid
+
+            by_uuid = {}
+            for endpoint in self.endpoints:
+                containers = endpoint.client.containers(
+                    all=True, filters={'label': self.LABEL}
+                )
+                self._add_listed(by_uuid, containers, endpoint)
+
+            logger.debug("Found %d submission container(s) for %s",
+                         sum(len(c) for c in by_uuid.values()),
+                         self.assignment)
+            self._by_uuid = by_uuid
+            return by_uuid
+
+    def _add_listed(self, by_uuid, containers, endpoint):
+        """Groups the containers listed by an endpoint's daemon by
+        submission, skipping other assignments'.
+
+        """
+        for container in containers:
+            labels = container.get('Labels') or {}
+            tag = labels.get(self.ASSIGNMENT_LABEL)
+            if tag is not None and tag != self.assignment.image_tag:
+                continue
+            container = dict(container, Endpoint=endpoint.url)
+            by_uuid.setdefault(labels[self.LABEL], []).append(container)
+
+    async def load_async(self, client):
+        """Fetches every container, and the assignment's image ID,
+        through an :class:`~grader.utils.asyncdocker.AsyncDockerClient`
+        for the primary endpoint, so that looking them up later doesn't
+        block an event loop. They're only fetched once, however many
+        coroutines ask at the same time.
+
+        :raises docker.errors.NotFound: if the image hasn't been built
+        """
+        if self._loading is None or self._loading.cancelled():
+            self._loading = asyncio.ensure_future(self._fetch_async(client))
+        await self._loading
+
+    async def _fetch_async(self, client):
+        image = await client.inspect_image(self.assignment.image_tag)
+        containers = await client.containers(
+            all=True, filters={'label': self.LABEL}
+        )
+        by_uuid = {}
+        self._add_listed(by_uuid, containers, self.endpoints.primary)
+        logger.debug("Found %d submission container(s) for %s",
+                     sum(len(c) for c in by_uuid.values()), self.assignment)
+
+        with self._lock:
+            if self._by_uuid is None:
+                self._by_uuid = by_uuid
+            if self._image_id is None:
+                self._image_id = image['Id']
+
+    def refresh(self):
+        """Forgets every container (and the assignment's image ID), so
+        they're fetched again when they're next needed.
+
+        """
+        with self._lock:
+            self._by_uuid = None
+            self._image_id = None
+            self._loading = None
+        with self._image_lock:
+            self._has_image.clear()
+
+    @property
+    def image_id(self):
+        """The ID of the assignment's image, looked up once.
+
+        :raises AssignmentBuildError: if the image hasn't been built
+        """
+        with self._lock:
+            if self._image_id is None:
+                self._image_id = self.assignment.image_id
+            return self._image_id
+
+    def containers(self, uuid):
+        """Returns the containers for a submission. There's usually one,
+        or none if it hasn't been graded yet.
+
+        :param str uuid: The submission's UUID
+
+        :rtype: list
+        """
+        return list(self._load().get(uuid, []))
+
+    def created(self, uuid):
+        """Returns when a submission's container was created, or None if
+        it doesn't have one.
+
+        :param str uuid: The submission's UUID
+
+        :rtype: :class:`datetime.datetime`
+        """
+        containers = self.containers(uuid)
+        if not containers:
+            return None
+        return datetime.fromtimestamp(containers[0]['Created'])
+
+    def endpoint(self, uuid):
+        """Returns the endpoint a submission's container is on, or None
+        if it doesn't have one (or its endpoint isn't in ``grader.yml``
+        any more).
+
+        :param str uuid: The submission's UUID
+
+        :rtype: :class:`~grader.models.endpoints.DockerEndpoint`
+        """
+        containers = self.containers(uuid)
+        if not containers:
+            return None
+        return self.endpoints.get(containers[0]['Endpoint'])
+
+    def client(self, uuid):
+        """Returns a docker Client object for the daemon a submission's
+        container is on, or for the primary endpoint if it doesn't have
+        one.
+
+        :param str uuid: The submission's UUID
+        """
+        endpoint = self.endpoint(uuid) or self.endpoints.primary
+        return endpoint.client
+
+    @contextmanager
+    def checkout(self, uuid):
+        """Picks the endpoint to grade a submission on, and counts it as
+        busy for the duration of a ``with`` block. Submissions that
+        already have a container are graded where it is; new ones go to
+        the least loaded endpoint (see
+        :meth:`~grader.models.endpoints.DockerEndpoints.least_loaded`).
+
+        :param str uuid: The submission's UUID
+
+        :return: A context manager that gives the endpoint
+        """
+        endpoint = self.endpoint(uuid)
+        with self._lock:
+            placed = Counter(c['Endpoint'] for containers in
+                             self._load().values() for c in containers)
+        with self.endpoints.working(endpoint, placed) as endpoint:
+            yield endpoint
+
+    def ensure_image(self, endpoint):
+        """Makes sure an endpoint has the assignment's image, copying it
+        from the primary endpoint if it's missing or out of date. Each
+        endpoint is only checked once.
+
+        :param DockerEndpoint endpoint: The endpoint
+
+        :raises AssignmentBuildError: if the image hasn't been built
+        """
+        image_id = self.image_id
+        with self._image_lock:
+            if endpoint.url in self._has_image:
+                return
+            if endpoint is not self.endpoints.primary:
+                tag = self.assignment.image_tag
+                try:
+                    current = endpoint.client.inspect_image(tag)['Id']
+                except docker.errors.NotFound:
+                    current = None
+                if current != image_id:
+                    logger.info("Copying %s to %s", tag, endpoint.url)
+                    with timings.phase("copy-image",
+                                       assignment=self.assignment.name,
+                                       endpoint=endpoint.url):
+                        endpoint.client.load_image(
+                            self.endpoints.primary.client.get_image(tag)
+                        )
+            self._has_image.add(endpoint.url)
+
+    def add(self, container_id, labels, image_id=None, endpoint=None):
+        """Records a container that was just created.
+
+        :param str container_id: The container's ID
+
+        :param dict labels: The container's labels, including its
+            submission's UUID
+
+        :param str image_id: The ID of the container's image. Defaults
+            to the assignment's image.
+
+        :param DockerEndpoint endpoint: The endpoint the container is
+            on. Defaults to the primary endpoint.
+
+        """
+        container = {
+            'Id': container_id,
+            'ImageID': image_id or self.image_id,
+            'Created': int(datetime.now().timestamp()),
+            'Labels': dict(labels),
+            'Endpoint': (endpoint or self.endpoints.primary).url,
+        }
+        with self._lock:
+            self._load().setdefault(labels[self.LABEL], []).append(container)
+
+    def remove(self, container_id):
+        """Forgets a container that was just removed.
+
+        :param str container_id: The container's ID
+        """
+        with self._lock:
+            for containers in self._load().values():
+                containers[:] = [c for c in containers
+                                 if c['Id'] != container_id]
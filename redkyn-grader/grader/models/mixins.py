@@ -4,18 +4,35 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+DEFAULT_ENDPOINT = "unix://var/run/docker.sock"
+"""The address of the local docker daemon"""
+
+
+def local_docker_client(base_url=DEFAULT_ENDPOINT):
+    """Creates a docker Client object for a docker daemon (by default,
+    the local one).
+
+    """
+    return docker.APIClient(
+        base_url=base_url,
+        version="auto"
+    )
+
+
 class DockerClientMixin(object):
     """A mixin class that gives subclasses access to a docker Client
     object.
     """
 
+    docker_client_factory = staticmethod(local_docker_client)
+    """A callable that creates a docker Client object, given a daemon's
+    address (or nothing, for the local daemon). Tests and benchmarks
+    can swap in a fake one to run without docker."""
+
     @property
     def docker_cli(self):
         """A docker Client object. Always returns the same one."""
         if not hasattr(self, "_docker_cli"):
             logger.debug("Creating Docker client")
-            self._docker_cli = docker.APIClient(
-                base_url="unix://var/run/docker.sock",
-                version="auto"
-            )
+            self._docker_cli = self.docker_client_factory()
         return self._docker_cli
@@ -0,0 +1,247 @@
+import collections
+import docker
+import logging
+import threading
+
+from contextlib import contextmanager
+
+from grader.utils.jobs import run_jobs
+
+logger = logging.getLogger(__name__)
+
+
+class ContainerPoolError(Exception):
+    """An exception thrown when a pooled container can't be created.
+    """
+    pass
+
+
+class PooledContainer(object):
+    """A container checked out of a :class:`ContainerPool`.
+
+    :ivar str id: The container's ID
+    :ivar list scratch: Directories in the container to remove before
+        it's reused
+    :ivar bool killed: Whether the container was killed (e.g., because
+        grading took too long), so it can't be reused
+    """
+
+    def __init__(self, container_id):
+        self.id = container_id
+        self.scratch = []
+        self.killed = False
+
+
+class ContainerPool(object):
+    """A pool of started containers, all running an assignment's image,
+    that are reused to grade one submission after another.
+
+    Each submission is unpacked into its own scratch directory. When
+    it's been graded, the scratch directory is removed and the
+    container goes back into the pool. If anything goes wrong while a
+    container is checked out, it's discarded instead, and a new one is
+    created when it's needed. Containers that were killed, or can't be
+    cleaned up, are replaced right away.
+
+    .. note::
+
+       Pooled containers aren't reset beyond removing their scratch
+       directories, so only use a pool with grading scripts that leave
+       nothing else behind.
+
+    """
+
+    LABEL = "grader_pool"
+    """Label (set to the image's tag) that marks pooled containers"""
+
+    def __init__(self, assignment, size):
+        """Instantiates a ContainerPool. No containers are created until
+        they're needed (or :meth:`warm` is called).
+
+        :param Assignment assignment: The assignment whose image the
+            containers run
+
+        :param int size: The most containers to keep at once
+
+        """
+        if size < 1:
+            raise ValueError("Pool size must be at least 1, not {}"
+                             .format(size))
+        self.assignment = assignment
+        self.size = size
+        # Guards _idle and _containers. Waiting threads are notified
+        # whenever a container comes back, or a spot frees up.
+        self._cond = threading.Condition()
+        self._idle = collections.deque()
+        self._containers = {}
+
+    @property
+    def docker_cli(self):
+        return self.assignment.docker_cli
+
+    def _create(self):
+        try:
+            result = self.docker_cli.create_container(
+                image=self.assignment.image_tag,
+                labels={self.LABEL: self.assignment.image_tag},
+            )
+            self.docker_cli.start(container=result['Id'])
+        except docker.errors.APIError as e:
+            raise ContainerPoolError(
+                "Could not create a pooled container: {}".format(
+                    e.explanation)
+            ) from e
+        logger.debug("Created pooled container %s", result['Id'])
+        return PooledContainer(result['Id'])
+
+    def _create_in(self, placeholder):
+        """Creates a container in a spot held by ``placeholder``, giving
+        the spot back if that fails.
+
+        """
+        try:
+            container = self._create()
+        except BaseException:
+            with self._cond:
+                del self._containers[placeholder]
+                self._cond.notify()
+            raise
+        with self._cond:
+            del self._containers[placeholder]
+            self._containers[container.id] = container
+        return container
+
+    def _add(self):
+        """Creates a container if the pool isn't full.
+
+        :return: The new :class:`PooledContainer`, or None if the pool
+            is full
+        """
+        with self._cond:
+            if len(self._containers) >= self.size:
+                return None
+            # Hold the spot while the container is created
+            placeholder = object()
+            self._containers[placeholder] = None
+        return self._create_in(placeholder)
+
+    def _get(self):
+        """Takes an idle container, or creates one if the pool isn't
+        full. Otherwise, waits until one of those is possible.
+
+        """
+        with self._cond:
+            while True:
+                if self._idle:
+                    return self._idle.popleft()
+                if len(self._containers) < self.size:
+                    placeholder = object()
+                    self._containers[placeholder] = None
+                    break
+                self._cond.wait()
+        return self._create_in(placeholder)
+
+    def _put(self, container):
+        with self._cond:
+            self._idle.append(container)
+            self._cond.notify()
+
+    def _reset(self, container):
+        if not container.scratch:
+            return
+        exec_id = self.docker_cli.exec_create(
+            container=container.id, user="root",
+            cmd=["rm", "-rf"] + container.scratch,
+        )
+        self.docker_cli.exec_start(exec_id=exec_id)
+        exit_code = self.docker_cli.exec_inspect(exec_id)['ExitCode']
+        if exit_code != 0:
+            raise ContainerPoolError(
+                "Could not clean up {} (exit code {})".format(
+                    container.id, exit_code)
+            )
+        container.scratch = []
+
+    def _discard(self, container):
+        logger.debug("Discarding pooled container %s", container.id)
+        with self._cond:
+            self._containers.pop(container.id, None)
+            # A spot is free, so a waiting thread can create a container
+            self._cond.notify()
+        try:
+            self.docker_cli.remove_container(container.id, force=True)
+        except docker.errors.APIError as e:
+            logger.warning("Could not remove %s: %s", container.id, e)
+
+    def _replace(self, container):
+        """Discards a container that can't be reused, and starts a new
+        one in its place, so the pool stays warm.
+
+        """
+        self._discard(container)
+        try:
+            replacement = self._add()
+        except ContainerPoolError as e:
+            logger.warning("Could not replace %s: %s", container.id, e)
+            return
+        if replacement is not None:
+            self._put(replacement)
+
+    @contextmanager
+    def checkout(self):
+        """Checks a container out of the pool, creating one if the pool
+        isn't full yet, and waiting for one to come back if it is.
+
+        Add any directories the container should forget about to its
+        ``scratch`` list. They're removed when it's checked back in.
+
+        :return: A context manager that gives a :class:`PooledContainer`
+        """
+        container = self._get()
+        try:
+            yield container
+        except BaseException:
+            self._discard(container)
+            raise
+
+        if container.killed:
+            logger.debug("Replacing killed container %s", container.id)
+            self._replace(container)
+            return
+
+        try:
+            self._reset(container)
+        except Exception as e:
+            logger.warning("Could not reset %s: %s", container.id, e)
+            self._replace(container)
+        else:
+            self._put(container)
+
+    def warm(self):
+        """Creates and starts containers until the pool is full, a few at
+        a time.
+
+        """
+        missing = self.size - len(self._containers)
+        if missing <= 0:
+            return
+        jobs = [("container {}".format(i), self._add) for i in range(missing)]
+        started = 0
+        for result in run_jobs(jobs, workers=min(missing, 4)):
+            if not result.ok:
+                raise result.error
+            if result.value:
+                self._put(result.value)
+                started += 1
+        logger.info("Started %d pooled container(s)", started)
+
+    def close(self):
+        """Removes every container in the pool. Call it once nothing is
+        checked out.
+
+        """
+        with self._cond:
+            containers = [c for c in self._containers.values() if c]
+            self._idle.clear()
+        for container in containers:
+            self._discard(container)
@@ -0,0 +1,125 @@
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ResultFile(object):
+    """A file in an assignment's results directory.
+
+    :ivar str path: The path to the file
+    :ivar str user_id: The ID of the student it belongs to
+    :ivar int size: Its size in bytes
+    :ivar float mtime: Its modification time
+    """
+
+    def __init__(self, path, user_id, size, mtime):
+        self.path = path
+        self.user_id = user_id
+        self.size = size
+        self.mtime = mtime
+
+    @property
+    def sort_key(self):
+        return (self.mtime, os.path.basename(self.path))
+
+    def __repr__(self):
+        return "ResultFile({!r})".format(self.path)
+
+
+class ResultsIndex(object):
+    """An in-memory index of an assignment's results directory, mapping
+    each student to their result files.
+
+    Result files are named ``<user_id>.<n>.<extension>``. The directory
+    is read once, the first time the index is used, and after that the
+    index is kept up to date by :meth:`add`.
+
+    """
+
+    def __init__(self, path):
+        """Instantiates a ResultsIndex.
+
+        :param str path: The results directory
+
+        """
+        self.path = path
+        self._by_user = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def _user_id(cls, name):
+        user_id, dot, _ = name.partition(".")
+        return user_id if dot and user_id else None
+
+    def _load(self):
+        by_user = {}
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                user_id = self._user_id(entry.name)
+                if user_id is None or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                by_user.setdefault(user_id, []).append(ResultFile(
+                    entry.path, user_id, stat.st_size, stat.st_mtime
+                ))
+
+        for files in by_user.values():
+            files.sort(key=lambda r: r.sort_key)
+        logger.debug("Indexed results for %d students", len(by_user))
+        return by_user
+
+    def _users(self):
+        with self._lock:
+            if self._by_user is None:
+                self._by_user = self._load()
+            return self._by_user
+
+    def refresh(self):
+        """Forgets everything, so the directory is read again the next
+        time the index is used.
+
+        """
+        with self._lock:
+            self._by_user = None
+
+    def files(self, user_id):
+        """Returns a student's result files, oldest first.
+
+        :param str user_id: The student's ID
+
+        :rtype: list
+        """
+        return list(self._users().get(user_id, []))
+
+    def latest(self, user_id):
+        """Returns a student's newest result file, or None if they don't
+        have any.
+
+        :param str user_id: The student's ID
+
+        :rtype: :class:`ResultFile`
+        """
+        files = self._users().get(user_id)
+        return files[-1] if files else None
+
+    def add(self, path):
+        """Adds a newly written result file to the index.
+
+        :param str path: The path to the file
+
+        :return: The new entry
+        :rtype: :class:`ResultFile`
+        """
+        user_id = self._user_id(os.path.basename(path))
+        stat = os.stat(path)
+        result = ResultFile(path, user_id, stat.st_size, stat.st_mtime)
+
+        users = self._users()
+        with self._lock:
+            files = users.setdefault(user_id, [])
+            files[:] = [r for r in files if r.path != path]
+            files.append(result)
+            files.sort(key=lambda r: r.sort_key)
+        return result
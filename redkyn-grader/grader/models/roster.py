@@ -0,0 +1,106 @@
+import logging
+
+from collections.abc import MutableSequence
+
+logger = logging.getLogger(__name__)
+
+
+class Roster(MutableSequence):
+    """A course roster: a list of students, each a dict with an ``id``
+    and a ``name``, that can also be looked up by ID or name.
+
+    The Roster wraps the list stored in the grader's config, so changes
+    to it are saved along with the config, and it's still saved as a
+    plain list. The indexes are built once, and kept up to date as
+    students are added, replaced or removed through the Roster.
+
+    .. note::
+
+       Changing a student's dict in place (e.g.,
+       ``roster[0]['id'] = 'x'``) isn't noticed. Replace the student
+       instead (``roster[0] = {...}``).
+
+    """
+
+    def __init__(self, students):
+        """Instantiates a Roster.
+
+        :param list students: The list of students to wrap. It's
+            modified in place.
+
+        """
+        self.students = students
+        self._reindex()
+
+    def _reindex(self):
+        self._by_id = {}
+        self._by_name = {}
+        for student in self.students:
+            self._add_to_index(student)
+
+    def _add_to_index(self, student):
+        if student['id'] in self._by_id:
+            logger.debug("%s is in the roster more than once", student['id'])
+        self._by_id[student['id']] = student
+        self._by_name.setdefault(student['name'], []).append(student)
+
+    def __getitem__(self, i):
+        return self.students[i]
+
+    def __setitem__(self, i, student):
+        self.students[i] = student
+        self._reindex()
+
+    def __delitem__(self, i):
+        del self.students[i]
+        self._reindex()
+
+    def __len__(self):
+        return len(self.students)
+
+    def insert(self, i, student):
+        self.students.insert(i, student)
+        if i >= len(self.students) - 1:
+            # Appending, which is what happens almost every time
+            self._add_to_index(student)
+        else:
+            self._reindex()
+
+    def __repr__(self):
+        return "Roster({!r})".format(self.students)
+
+    @property
+    def ids(self):
+        """The IDs of every student in the roster. Checking whether an ID
+        is in it is quick.
+
+        """
+        return self._by_id.keys()
+
+    def get(self, student_id, default=None):
+        """Returns the student with a given ID, or ``default`` if there
+        isn't one.
+
+        :param str student_id: The student's ID
+
+        :rtype: dict
+        """
+        return self._by_id.get(student_id, default)
+
+    def by_name(self, name):
+        """Returns every student with a given name.
+
+        :param str name: The student's name
+
+        :rtype: list
+        """
+        return list(self._by_name.get(name, []))
+
+    def name_of(self, student_id):
+        """Returns the name of the student with a given ID.
+
+        :param str student_id: The student's ID
+
+        :raises KeyError: if there's no such student
+        """
+        return self._by_id[student_id]['name']
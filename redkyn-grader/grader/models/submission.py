@@ -1,21 +1,30 @@
+import asyncio
 import docker
+import functools
 import git
 import hashlib
-import io
 import itertools
 import logging
 import os
 import re
 import shutil
+import sys
 import tarfile
 import tempfile
+import threading
+import time
 import uuid
 import yaml
+import zlib
 
+from concurrent.futures import ProcessPoolExecutor
 from contextlib import contextmanager
 from datetime import datetime
 
-from grader.utils.files import make_tarball
+from grader.utils import timings
+from grader.utils.files import rebase_tarball, scan_tarball, write_tarball
+from grader.utils.gitarchive import GitArchiveError, read_latest_commit
+from grader.utils.jobs import run_jobs, summarize_jobs
 
 from .mixins import DockerClientMixin
 
@@ -64,6 +73,14 @@ class Submission(DockerClientMixin):
     )
     """Full submission IDs must match this pattern"""
 
+    UNPACK_DIR = "/tmp"
+    """Directory in containers that submissions are unpacked under"""
+
+    IMPORT_TIMES_DIR = "import-times"
+    """Directory in the assignment directory that records when each
+    submission was imported. Archives are often links to a shared blob,
+    so their mtimes can't be trusted for that."""
+
     @classmethod
     def split_full_id(cls, full_id):
         """Splits a full Submission ID into the student's ID, and the
@@ -124,35 +141,14 @@ class Submission(DockerClientMixin):
         return re.match(r'^(.*?)(?:\.tar\.gz)?$', basename).group(1)
 
     @classmethod
-    def _check_tarball(cls, assignment, path, student_id):
-        with tempfile.TemporaryDirectory() as tmpdir:
-            with tarfile.open(path) as tar:
-                tar.extractall(tmpdir)
-
-            try:
-                # Try to unpack our single folder
-                name, = os.listdir(tmpdir)
-            except ValueError:
-                raise SubmissionImportError(
-                    'Expected exactly one item at the root. '
-                    'Found {}.'.format(os.listdir(tmpdir))
-                )
-
-            if name != student_id:
-                raise SubmissionImportError(
-                    'Inner folder name ({}) does not match '
-                    'tarball name ({}).'.format(name, student_id)
-                )
-
-            if not os.path.isdir(os.path.join(tmpdir, name)):
-                raise SubmissionImportError(
-                    '"{}" in {} should be a directory, '
-                    'not a file.'.format(name, path)
-                )
+    def _check_tarball(cls, scan, student_id):
+        problems = scan.problems(student_id)
+        if problems:
+            raise SubmissionImportError(problems[0])
 
     @classmethod
     def _check_submission_item(cls, assignment, path,
-                               sid_pattern=r"(?P<id>.*)"):
+                               sid_pattern=r"(?P<id>.*)", scan=None):
         """Checks whether the submission item meets the following
         requirements:
 
@@ -165,6 +161,9 @@ class Submission(DockerClientMixin):
         :param str full_id: A full submission ID. See
             :data:`SUBMISSSION_ID_RE`
 
+        :param scan: If the item is a tarball, the results of
+            scanning it with :func:`~grader.utils.files.scan_tarball`
+
         :return: None
 
         :raises SubmissionError: if the submission item doesn't meet
@@ -193,8 +192,8 @@ class Submission(DockerClientMixin):
                 'Expected "{}" to match a student id.'.format(student_id)
             )
 
-        if os.path.isfile(path) and tarfile.is_tarfile(path):
-            cls._check_tarball(assignment, path, student_id)
+        if scan is not None:
+            cls._check_tarball(scan, student_id)
 
     @classmethod
     def import_blackboard_zip(cls, assignment, path,
@@ -216,7 +215,8 @@ class Submission(DockerClientMixin):
         raise NotImplementedError("Blackboard import isn't implemented yet :/")
 
     @classmethod
-    def import_multiple(cls, assignment, path, sid_pattern=r"(?P<id>.*)"):
+    def import_multiple(cls, assignment, path, sid_pattern=r"(?P<id>.*)",
+                        jobs=1):
         """Imports multiple submissions from a folder of ``.tar.gz``'s or
         folders of submission material.
 
@@ -233,7 +233,12 @@ class Submission(DockerClientMixin):
         :param str sid_pattern: An optional pattern to use to convert
             the name of a submission to a submission id
 
-        :return: A list of Submissions
+        :param int jobs: How many items to validate and import at
+            once. If more than 1, items are handled by a pool of
+            processes.
+
+        :return: A list of Submissions (None for items that couldn't
+            be imported)
 
         """
         # Make sure this is actually a folder
@@ -242,35 +247,67 @@ class Submission(DockerClientMixin):
                 "{} is not a directory. Cannot import.".format(path)
             )
 
-        # Make sure we can import all the items in this folder
-        for item in os.listdir(path):
-            item = os.path.join(path, item)
-            if os.path.isfile(item) and tarfile.is_tarfile(item):
-                logger.debug("%s is a tarfile", item)
-                continue
-            elif os.path.isdir(item):
-                logger.debug("%s is a directory", item)
-                continue
-            else:
-                raise SubmissionError(
-                    "{} is neither a directory nor a tarball".format(item)
-                )
+        items = [os.path.join(path, p) for p in sorted(os.listdir(path))]
+
+        # Make sure we can import all the items in this folder. Each
+        # tarball is scanned once, here, and the scan is reused when
+        # it's imported.
+        scans = {}
+        for result in run_jobs([(i, functools.partial(_scan_item, i))
+                                for i in items],
+                               workers=jobs,
+                               executor_class=ProcessPoolExecutor):
+            if not result.ok:
+                raise result.error
+            scans[result.name] = result.value
 
         # Import the items
-        def import_it(submission_path):
-            fullpath = os.path.join(path, submission_path)
-            try:
-                submission, = cls.import_single(
-                    assignment, fullpath, sid_pattern=sid_pattern
-                )
-                return submission
-            except SubmissionError as e:
-                logger.info("Could not import %s. %s", path, e)
+        if jobs > 1:
+            import_jobs = [(i, functools.partial(
+                _import_item, assignment.grader.path, assignment.name, i,
+                sid_pattern, scans[i])) for i in items]
+        else:
+            import_jobs = [(i, functools.partial(
+                cls.import_single, assignment, i, sid_pattern=sid_pattern,
+                scan=scans[i])) for i in items]
+
+        start = time.monotonic()
+        submissions, results = [], []
+        imported = run_jobs(import_jobs, workers=jobs,
+                            executor_class=ProcessPoolExecutor)
+        for n, result in enumerate(imported, 1):
+            results.append(result)
+            progress = "[{}/{}]".format(n, len(items))
+            if not result.ok:
+                if not isinstance(result.error, SubmissionError):
+                    raise result.error
+                logger.info("%s Could not import %s. %s",
+                            progress, result.name, result.error)
+                submissions.append(None)
+                continue
 
-        return [import_it(p) for p in os.listdir(path)]
+            submission, = result.value
+            if not isinstance(submission, cls):
+                # Imported in another process; all we got was its ID
+                tar_name = submission + ".tar.gz"
+                submission = cls(assignment, tar_name,
+                                 assignment.index.get(submission))
+            logger.info("%s Imported %s as %s", progress,
+                        os.path.basename(result.name), submission.full_id)
+            submissions.append(submission)
+
+        logger.info(summarize_jobs(results, time.monotonic() - start))
+        for result in results:
+            if not result.ok:
+                logger.warning("Not imported: %s (%s)",
+                               result.name, result.error)
+
+        assignment.invalidate_submissions()
+        return submissions
 
     @classmethod
-    def import_single(cls, assignment, path, sid_pattern=r"(?P<id>.*)"):
+    def import_single(cls, assignment, path, sid_pattern=r"(?P<id>.*)",
+                      scan=None):
         """Imports a single submission.
 
         The submission may be:
@@ -280,6 +317,10 @@ class Submission(DockerClientMixin):
         * A folder containing files to submit. The folder will be
           compressed as a ``.tar.gz`` then imported.
 
+        Archives are kept in the assignment's
+        :class:`~grader.models.blobs.BlobStore`, so importing the same
+        archive again doesn't use any more space.
+
         By default the name of the submission (minus extensions) will
         be used as its ID. For example, if a folder is named
         ``hsimpson/``, the new Submission with id ``hsimpson`` will be
@@ -295,14 +336,22 @@ class Submission(DockerClientMixin):
         :param str sid_pattern: An optional pattern to use to convert
             the name of a submission to a submission id
 
+        :param scan: The results of scanning the submission with
+            :func:`~grader.utils.files.scan_tarball`, if it's a
+            tarball that has already been scanned
+
         :return: A list containing a single item: the new Submission
 
         """
         # Remove trailing slashes from the path
         source = os.path.normpath(path)
 
+        # Read tarballs once, up front
+        if scan is None and os.path.isfile(source):
+            scan = scan_tarball(source)
+
         # See if it's structured properly
-        cls._check_submission_item(assignment, source, sid_pattern)
+        cls._check_submission_item(assignment, source, sid_pattern, scan)
 
         # Ditch ".tar.gz" file extension (if it's there)
         basename = cls._remove_extension(os.path.basename(source))
@@ -314,29 +363,45 @@ class Submission(DockerClientMixin):
         tar_name = submission_id + ".tar.gz"
         dest = os.path.join(assignment.submissions_dir, tar_name)
 
-        # Prepare the tarball (if necessary)
-        tarball, temp_path = None, None
+        # Store the archive, unless an identical one has been imported
+        # before. Directories are compressed straight into the store;
+        # tarballs are linked in if possible.
+        blobs = assignment.blobs
         if os.path.isdir(source):
             logger.debug("Importing a single directory: %s", source)
-            tarball, temp_path = make_tarball(source, submission_id)
-        elif os.path.isfile(source) and tarfile.is_tarfile(source):
+            incoming = blobs.incoming_path(submission_id)
+            scan = write_tarball(source, incoming)
+            blobs.add(incoming, scan.sha1, move=True)
+        elif scan is not None:
             logger.debug("Importing a single tarball: %s", source)
-            tarball = source
+            blobs.add(source, scan.sha1)
         else:
             logger.debug("Cannot import this thing.")
             raise SubmissionError(
                 "{} is neither a directory nor a tarball.".format(source)
             )
 
-        # Copy it
-        shutil.copyfile(tarball, dest)
-
-        # Clean up if necessary
-        if temp_path:
-            logger.debug("Removing %s", temp_path)
-            shutil.rmtree(temp_path)
+        import_time = int(time.time())
+        cls._save_import_time(assignment, submission_id, import_time)
+        how = blobs.place(scan.sha1, dest)
+        logger.debug("Placed %s with a %s", dest, how)
+
+        # Index it, using what we learned from the scan rather than
+        # reading the archive again
+        record = cls._make_record(dest, submission_id,
+                                  import_time=import_time)
+        record['data'] = {
+            'file_mtimes': scan.members,
+            'sha1sum': scan.sha1,
+            'latest_commit': None,
+        }
+        submission = cls(assignment, tar_name, record)
+        if scan.has_repo:
+            record['data']['latest_commit'] = submission._read_latest_commit()
+        assignment.index.put(record)
+        assignment.invalidate_submissions()
 
-        return [cls(assignment, tar_name)]
+        return [submission]
 
     @classmethod
     def import_repo(cls, assignment, path, sid_pattern=r"(?P<id>.*)"):
@@ -394,14 +459,144 @@ class Submission(DockerClientMixin):
     @property
     def import_time(self):
         """The time stamp on the Submission (as a datetime object)"""
-        return datetime.fromtimestamp(int(os.path.getmtime(self.path)))
+        if self.record is not None:
+            return datetime.fromtimestamp(self.record['import_time'])
+        return datetime.fromtimestamp(self._load_import_time())
+
+    def _indexed(self, key, compute):
+        """Returns a piece of metadata from this submission's index
+        record. If it isn't there yet, it's computed and stored.
+
+        """
+        if self.record is not None and key in self.record['data']:
+            return self.record['data'][key]
+
+        value = compute()
+        self._update_record(**{key: value})
+        return value
+
+    def _update_record(self, **data):
+        """Merges metadata into this submission's index record (if it has
+        one).
+
+        """
+        if self.record is not None:
+            self.record['data'].update(data)
+            self.assignment.index.update_data(self.full_id, **data)
+
+    def _read_file_mtimes(self):
+        with tarfile.open(self.path, "r:gz") as tar:
+            return {info.name: info.mtime for info in tar}
+
+    def _read_sha1sum(self):
+        sha1 = hashlib.sha1()
+        with open(self.path, 'rb') as f:
+            while True:
+                buf = f.read(1024)
+                if not buf:
+                    break
+                sha1.update(buf)
+        return sha1.hexdigest()
+
+    def _read_latest_commit(self):
+        try:
+            return read_latest_commit(self.path)
+        except GitArchiveError as e:
+            logger.debug("Extracting %s to read its commits: %s",
+                         self.path, e)
+        except (tarfile.TarError, EOFError, OSError, zlib.error) as e:
+            # Extracting it wouldn't go any better
+            raise SubmissionError(
+                "{} is corrupt: {}".format(self.path, e)
+            ) from e
+
+        with self.unpacked_repo as repo:
+            if repo:
+                try:
+                    return repo.head.commit.committed_date
+                except ValueError:
+                    # HEAD names a branch that doesn't exist
+                    if repo.heads:
+                        return repo.heads[0].commit.committed_date
+        return None
+
+    def reindex(self, full=False):
+        """Records this submission in its assignment's index, replacing any
+        existing record.
+
+        :param bool full: Whether to compute all metadata up front
+            (which means reading the whole archive). Otherwise, it's
+            computed the first time it's needed.
+
+        """
+        self.record = self._make_record(
+            self.path, self.full_id, import_time=self._load_import_time()
+        )
+        if full:
+            scan = scan_tarball(self.path)
+            self.record['data'] = {
+                'file_mtimes': scan.members,
+                'sha1sum': scan.sha1,
+                'latest_commit': (self._read_latest_commit()
+                                  if scan.has_repo else None),
+            }
+        self.assignment.index.put(self.record)
+
+    @classmethod
+    def _make_record(cls, path, full_id, import_time=None):
+        """Builds a new index record (without any metadata from inside
+        the archive) for the submission archive at ``path``.
+
+        If no ``import_time`` is given, the archive's mtime is used.
+
+        """
+        stat = os.stat(path)
+        user_id, submission_uuid = cls.split_full_id(full_id)
+        return {
+            'full_id': full_id,
+            'user_id': user_id,
+            'uuid': submission_uuid,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'import_time': (int(stat.st_mtime) if import_time is None
+                            else import_time),
+            'data': {},
+        }
+
+    @classmethod
+    def _import_time_path(cls, assignment, full_id):
+        return os.path.join(assignment.path, cls.IMPORT_TIMES_DIR, full_id)
+
+    @classmethod
+    def _save_import_time(cls, assignment, full_id, import_time):
+        """Records when a submission was imported, outside of the index,
+        so it survives the index being deleted.
+
+        """
+        path = cls._import_time_path(assignment, full_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(str(import_time))
+
+    def _load_import_time(self):
+        """Returns the recorded import time of this submission.
+        Submissions with no recorded time (placed by a worker, or
+        imported by an older grader) fall back to their archive's mtime.
+
+        :rtype: int
+        """
+        path = self._import_time_path(self.assignment, self.full_id)
+        try:
+            with open(path) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return int(os.path.getmtime(self.path))
 
     @property
     def file_mtimes(self):
         """A dict mapping file names (from the submission archive) a datetime
         object indicating the last time that file was modified"""
-        with tarfile.open(self.path, "r:gz") as tar:
-            return {info.name: info.mtime for info in tar}
+        return self._indexed('file_mtimes', self._read_file_mtimes)
 
     @property
     def latest_mtime(self):
@@ -414,14 +609,7 @@ class Submission(DockerClientMixin):
     @property
     def sha1sum(self):
         """The SHA1 sum of the submission archive"""
-        sha1 = hashlib.sha1()
-        with open(self.path, 'rb') as f:
-            while True:
-                buf = f.read(1024)
-                if not buf:
-                    break
-                sha1.update(buf)
-        return sha1.hexdigest()
+        return self._indexed('sha1sum', self._read_sha1sum)
 
     @property
     @contextmanager
@@ -459,14 +647,15 @@ class Submission(DockerClientMixin):
 
     @property
     def latest_commit(self):
-        """The time stamp of the default branch of the submission, or None if
+        """The time stamp of the commit ``HEAD`` points to in the
+        submission (usually the tip of the default branch), or None if
         the submission isn't a git repository.
 
         """
-        with self.unpacked_repo as repo:
-            if repo:
-                time = repo.heads[0].commit.committed_date
-                return datetime.fromtimestamp(time)
+        time = self._indexed('latest_commit', self._read_latest_commit)
+        if time is not None:
+            return datetime.fromtimestamp(time)
+        return None
 
     @property
     def container_labels(self):
@@ -476,17 +665,24 @@ class Submission(DockerClientMixin):
         return {
             "user_id": self.user_id,
             "submission_uuid": self.uuid,
+            "assignment": self.assignment.image_tag,
         }
 
+    @property
+    def graded(self):
+        """Whether a grading result has been recorded for this submission
+
+        """
+        return (self.record is not None and
+                'result_file' in self.record['data'])
+
     @property
     def results_files(self):
-        """A list of paths to grading results for this submission.
+        """A list of paths to grading results for this submission, oldest
+        first.
 
         """
-        name_re = re.compile(r"^{}(?:\..*)$".format(self.user_id))
-        results_dir = self.assignment.results_dir
-        return [os.path.join(results_dir, r)
-                for r in os.listdir(results_dir) if name_re.match(r)]
+        return [r.path for r in self.assignment.results.files(self.user_id)]
 
     @property
     def latest_result(self):
@@ -494,15 +690,10 @@ class Submission(DockerClientMixin):
         results, returns None.
 
         """
-        def timestamp(path):
-            return os.stat(path).st_mtime
-
-        results = self.results_files
-        if results:
-            return max(results, key=timestamp)
-        return None
+        latest = self.assignment.results.latest(self.user_id)
+        return latest.path if latest else None
 
-    def __init__(self, assignment, tar_name):
+    def __init__(self, assignment, tar_name, record=None):
         """Instantiates a new Submission.
 
         :param str assignment: The :class:`Assignment` object to which
@@ -511,17 +702,24 @@ class Submission(DockerClientMixin):
         :param str tar_name: The name of the submission's .tar.gz file
             (including extension)
 
+        :param dict record: The submission's record from the
+            assignment's :class:`AssignmentIndex`, if it has one. A
+            submission with a record is trusted to be a valid archive
+            and reads its metadata from the record.
+
         """
         self.path = os.path.join(assignment.submissions_dir, tar_name)
         self.assignment = assignment
         self.grader = assignment.grader
+        self.record = record
 
-        if not os.path.isfile(self.path):
-            logger.debug("Cannot find %s", self.path)
-            raise FileNotFoundError("Submission doesn't exist.")
-        if not tarfile.is_tarfile(self.path):
-            logger.debug("%s is not a tarball", self.path)
-            raise SubmissionError("Submission is screwed up...")
+        if record is None:
+            if not os.path.isfile(self.path):
+                logger.debug("Cannot find %s", self.path)
+                raise FileNotFoundError("Submission doesn't exist.")
+            if not tarfile.is_tarfile(self.path):
+                logger.debug("%s is not a tarball", self.path)
+                raise SubmissionError("Submission is screwed up...")
 
         self.basename = os.path.basename(self.path)
         self.full_id = self.__class__._remove_extension(self.basename)
@@ -532,188 +730,745 @@ class Submission(DockerClientMixin):
         """String representation of a Submission"""
         return "Submission {} ({})".format(self.user_id, self.uuid)
 
-    def _create_container(self):
+    @property
+    def _container_options(self):
         # TODO pull in container config and hostconfig from
         # assignment.yml
-
-        options = {
+        return {
             'image': self.assignment.image_tag,
             'labels': self.container_labels,
             'name': self.full_id,
         }
-        logger.debug("Creating container with options %s", options)
 
-        try:
-            result = self.docker_cli.create_container(**options)
-            if result['Warnings']:
-                logger.warn(result['Warnings'])
-            return result['Id']
-        except docker.errors.NotFound as e:
-            msg = e.explanation.decode("utf-8")
-            if "No such image" in msg:
-                msg += " Did you build the assignment?"
-            raise SubmissionContainerError(msg) from e
+    @classmethod
+    def _container_error(cls, e):
+        msg = e.explanation
+        if isinstance(msg, bytes):
+            msg = msg.decode("utf-8")
+        if "No such image" in msg:
+            msg += " Did you build the assignment?"
+        return SubmissionContainerError(msg)
+
+    def _phase(self, name):
+        """Times a phase of grading this submission; see
+        :func:`grader.utils.timings.phase`.
+
+        """
+        return timings.phase(name, assignment=self.assignment.name,
+                             submission=self.full_id)
+
+    @property
+    def docker_cli(self):
+        """A docker Client object for the daemon this submission's
+        container is on (or the primary endpoint, if it doesn't have one
+        yet).
+
+        """
+        return self.assignment.containers.client(self.uuid)
+
+    def _create_container(self, endpoint=None):
+        inventory = self.assignment.containers
+        endpoint = endpoint or inventory.endpoints.primary
+        options = self._container_options
+        logger.debug("Creating container on %s with options %s",
+                     endpoint.url, options)
+
+        with self._phase("create"):
+            inventory.ensure_image(endpoint)
+            try:
+                result = endpoint.client.create_container(**options)
+            except docker.errors.NotFound as e:
+                raise self._container_error(e) from e
+        if result['Warnings']:
+            logger.warn(result['Warnings'])
+        inventory.add(result['Id'], options['labels'], endpoint=endpoint)
+        return result['Id']
+
+    async def _create_container_async(self, client):
+        options = self._container_options
+        logger.debug("Creating container with options %s", options)
 
-    def get_container_id(self, rebuild=True):
+        with self._phase("create"):
+            try:
+                result = await client.create_container(**options)
+            except docker.errors.NotFound as e:
+                raise self._container_error(e) from e
+        if result['Warnings']:
+            logger.warn(result['Warnings'])
+        self.assignment.containers.add(result['Id'], options['labels'])
+        return result['Id']
+
+    def get_container_id(self, rebuild=True, endpoint=None):
         """Retrieve's this submission's container id
 
         :param bool rebuild: Remove the old container and build a new
             one instead.
 
+        :param DockerEndpoint endpoint: The endpoint to create a new
+            container on. Defaults to the primary endpoint.
+
         :return: The ID of this submission's container
         """
-        # Filter the containers down to the one we want
-        filters = {
-            'label': 'submission_uuid={}'.format(self.uuid)
-        }
-        containers = self.docker_cli.containers(all=True, filters=filters)
+        inventory = self.assignment.containers
+        with self._phase("lookup"):
+            containers = inventory.containers(self.uuid)
         logger.debug("Found matching containers: %s", containers)
 
-        container_id = None
-        if len(containers) < 1:
-            container_id = self._create_container()
-        elif len(containers) == 1:
-            container_id = containers[0]['Id']
-            if rebuild:
-                logger.info("Removing old container %s", container_id)
+        container_id = self._existing_container_id(containers)
+        if container_id is None:
+            container_id = self._create_container(endpoint)
+        elif rebuild:
+            logger.info("Removing old container %s", container_id)
+            with self._phase("remove"):
                 self.docker_cli.remove_container(container_id, force=True)
-                container_id = self._create_container()
-        elif len(containers) > 1:
+            inventory.remove(container_id)
+            container_id = self._create_container(endpoint)
+        else:
+            self._check_image(containers[0]['ImageID'], inventory.image_id)
+
+        return container_id
+
+    async def get_container_id_async(self, client, rebuild=True):
+        """Like :meth:`get_container_id`, but using an
+        :class:`~grader.utils.asyncdocker.AsyncDockerClient`
+
+        """
+        inventory = self.assignment.containers
+        with self._phase("lookup"):
+            containers = inventory.containers(self.uuid)
+        logger.debug("Found matching containers: %s", containers)
+
+        container_id = self._existing_container_id(containers)
+        if container_id is None:
+            container_id = await self._create_container_async(client)
+        elif rebuild:
+            logger.info("Removing old container %s", container_id)
+            with self._phase("remove"):
+                await client.remove_container(container_id, force=True)
+            inventory.remove(container_id)
+            container_id = await self._create_container_async(client)
+        else:
+            self._check_image(containers[0]['ImageID'], inventory.image_id)
+
+        return container_id
+
+    @classmethod
+    def _existing_container_id(cls, containers):
+        if len(containers) > 1:
             raise SubmissionContainerError(
                 "Found multiple containers for submission. "
                 "Needs manual cleanup: {}".format(containers)
             )
+        if containers:
+            return containers[0]['Id']
+        return None
 
-        image_id = self.docker_cli.inspect_container(container_id)['Image']
-        if image_id != self.assignment.image_id:
+    @classmethod
+    def _check_image(cls, image_id, assignment_image_id):
+        if image_id != assignment_image_id:
             logger.warning(
                 "This container is based on an old image (%s instead of %s). "
                 "You may want to delete it and start over.",
-                image_id[:5], self.assignment.image_id[:5]
+                image_id[:5], assignment_image_id[:5]
             )
 
-        return container_id
+    def _unpack_root(self):
+        """Picks a new directory to unpack this submission into.
 
-    def _add_submission_files(self, c_id):
+        :return: The directory's name, and its path in the container
+        :rtype: (str, str)
+        """
+        if self.assignment.gradesheet.config.get('legacy-unpack', False):
+            return None, None
+        name = "grader-{}".format(uuid.uuid4().hex)
+        return name, "{}/{}".format(self.UNPACK_DIR, name)
+
+    def _add_submission_files(self, c_id, client=None):
         """Unpacks this submission into a docker container with id
-        ``c_id``. The unpacked archive is stored in a temporary
-        directory.
+        ``c_id``, in a new directory under :data:`UNPACK_DIR`.
+
+        The archive is streamed into the container with its permissions
+        already fixed, so it takes a single request. If that doesn't
+        work (or ``legacy-unpack`` is set in ``assignment.yml``), it's
+        done the old way instead; see
+        :meth:`_add_submission_files_legacy`.
 
         :param str c_id: The ID of the docker container to store the
             submission in
 
+        :param client: The docker Client object for the container's
+            daemon. Defaults to :attr:`docker_cli`.
+
+        :return: The path where the stuff was unpacked
+        :rtype: str
+
+        """
+        client = client or self.docker_cli
+        name, path = self._unpack_root()
+        if name is not None:
+            logger.debug("Adding submission files to %s", path)
+            try:
+                with self._phase("put_archive"):
+                    client.put_archive(
+                        container=c_id,
+                        path=self.UNPACK_DIR,
+                        data=rebase_tarball(self.path, name)
+                    )
+                return path
+            except docker.errors.NotFound as e:
+                logger.info("Could not unpack into %s, falling back to "
+                            "mktemp: %s", self.UNPACK_DIR, e.explanation)
+        return self._add_submission_files_legacy(c_id, client)
+
+    async def _add_submission_files_async(self, client, c_id):
+        """Like :meth:`_add_submission_files`, but using an
+        :class:`~grader.utils.asyncdocker.AsyncDockerClient`.
+
+        """
+        name, path = self._unpack_root()
+        if name is not None:
+            logger.debug("Adding submission files to %s", path)
+            try:
+                with self._phase("put_archive"):
+                    await client.put_archive(
+                        container=c_id,
+                        path=self.UNPACK_DIR,
+                        data=rebase_tarball(self.path, name)
+                    )
+                return path
+            except docker.errors.NotFound as e:
+                logger.info("Could not unpack into %s, falling back to "
+                            "mktemp: %s", self.UNPACK_DIR, e.explanation)
+        return await self._add_submission_files_legacy_async(client, c_id)
+
+    def _add_submission_files_legacy(self, c_id, client=None):
+        """Unpacks this submission into a docker container with id
+        ``c_id`` the way older versions of grader did: a temporary
+        directory is made with ``mktemp``, and permissions are fixed
+        with ``chmod`` afterwards, each in its own exec.
+
+        :param str c_id: The ID of the docker container to store the
+            submission in
+
+        :param client: The docker Client object for the container's
+            daemon. Defaults to :attr:`docker_cli`.
+
         :return: The temporary path where the stuff was unpacked
         :rtype: str
 
         """
+        client = client or self.docker_cli
+
         # Make a temporary directory in the container to store the
         # unpacked submission
-        tmpdir = self.docker_cli.exec_start(
-            exec_id=self.docker_cli.exec_create(
-                container=c_id,
-                cmd="mktemp -d"
+        with self._phase("mktemp"):
+            tmpdir = client.exec_start(
+                exec_id=client.exec_create(
+                    container=c_id,
+                    cmd="mktemp -d"
+                )
             )
-        )
 
         # Cleanup the return value
         tmpdir = tmpdir.decode('ascii').strip()
         logger.debug("Adding submission files to %s", tmpdir)
         logger.debug("Assignment archive is %s", self.path)
 
-        # Unpack the submission into tmpdir
-        with open(self.path, mode='rb') as tar:
-            self.docker_cli.put_archive(
+        # Unpack the submission into tmpdir. The archive is streamed
+        # from disk, not read into memory.
+        with open(self.path, mode='rb') as tar, self._phase("put_archive"):
+            client.put_archive(
                 container=c_id,
                 path=tmpdir,
-                data=tar.read()
+                data=tar
             )
 
-        output = self.docker_cli.exec_start(
-            exec_id=self.docker_cli.exec_create(
-                container=c_id,
-                user="root",
-                cmd="chmod --recursive +rX {}".format(tmpdir)
+        with self._phase("chmod"):
+            output = client.exec_start(
+                exec_id=client.exec_create(
+                    container=c_id,
+                    user="root",
+                    cmd="chmod --recursive +rX {}".format(tmpdir)
+                )
             )
-        )
 
         if output:
             logger.debug("chmod says: %s", output)
 
         return tmpdir
 
-    def _record_output(self, output):
+    async def _add_submission_files_legacy_async(self, client, c_id):
+        """Like :meth:`_add_submission_files_legacy`, but using an
+        :class:`~grader.utils.asyncdocker.AsyncDockerClient`.
+
+        """
+        with self._phase("mktemp"):
+            tmpdir = await client.exec_start(
+                exec_id=await client.exec_create(
+                    container=c_id,
+                    cmd="mktemp -d"
+                )
+            )
+
+        tmpdir = tmpdir.decode('ascii').strip()
+        logger.debug("Adding submission files to %s", tmpdir)
+
+        with open(self.path, mode='rb') as tar, self._phase("put_archive"):
+            await client.put_archive(container=c_id, path=tmpdir, data=tar)
+
+        with self._phase("chmod"):
+            output = await client.exec_start(
+                exec_id=await client.exec_create(
+                    container=c_id,
+                    user="root",
+                    cmd="chmod --recursive +rX {}".format(tmpdir)
+                )
+            )
+
+        if output:
+            logger.debug("chmod says: %s", output)
+
+        return tmpdir
+
+    def _result_key(self, image_id, gradesheet_commit=None):
+        """The key under which the result of grading this submission is
+        cached: its student and archive, the image it's graded in, and
+        the gradesheet it's graded with. Returns None if results can't be
+        cached.
+
+        :param str gradesheet_commit: The gradesheet commit, if the
+            caller already knows it. Looked up otherwise.
+
+        """
+        if gradesheet_commit is None:
+            gradesheet_commit = self.assignment.gradesheet.commit
+        if gradesheet_commit is None:
+            return None
+        return (self.user_id, self.sha1sum, image_id, gradesheet_commit)
+
+    def _cached_result(self, key, show_output):
+        """Returns the path to the output of a previous grading of this
+        submission with the same key, or None if there isn't one (or its
+        result file is gone).
+
+        If this is the student's newest submission, but something else
+        has been graded since (e.g., they handed in an older archive
+        again), the output is recorded again as a new result, so that
+        it's their latest one.
+
+        """
+        if key is None:
+            return None
+
+        result_file = self.assignment.index.get_result(*key)
+        if result_file is None or \
+           not result_file.startswith(self.user_id + "."):
+            return None
+
+        path = os.path.join(self.assignment.results_dir, result_file)
+        try:
+            f = open(path)
+        except FileNotFoundError:
+            logger.debug("Cached result %s is gone", path)
+            return None
+
+        with f:
+            logger.info("%s hasn't changed since it was graded, reusing %s",
+                        self, path)
+            if show_output:
+                shutil.copyfileobj(f, sys.stdout)
+                print()
+
+            latest = self.assignment.results.latest(self.user_id)
+            if self._is_newest() and (latest is None or latest.path != path):
+                f.seek(0)
+                with self._partial_result() as partial:
+                    shutil.copyfileobj(f, partial)
+                return self._record_result(partial.name, key)
+
+        self._update_record(result_file=result_file)
+        return path
+
+    def _is_newest(self):
+        """Whether this is the last submission its student handed in"""
+        user_submissions = self.assignment.submissions_by_user.get(
+            self.user_id, [self])
+        return user_submissions[-1].full_id == self.full_id
+
+    @contextmanager
+    def _partial_result(self):
+        """Opens a hidden file in the results directory to stream grading
+        output into. It's removed if anything goes wrong; otherwise, hand
+        its name to :meth:`_record_result`.
+
+        """
+        fd, partial = tempfile.mkstemp(dir=self.assignment.results_dir,
+                                       prefix=".{}.".format(self.user_id),
+                                       suffix=".partial")
+        os.close(fd)
+        try:
+            with open(partial, 'w') as f:
+                yield f
+        except BaseException:
+            os.remove(partial)
+            raise
+
+    def _record_result(self, partial, key=None):
+        """Moves a finished result into place under the next free result
+        file name for this submission's student.
+
+        :param str partial: The path to the finished output, from
+            :meth:`_partial_result`
+
+        :return: The path to the result file
+        """
         results_dir = self.assignment.results_dir
 
-        # Attempt to decode the string as YAML. If it works, use the
+        # Attempt to decode the output as YAML. If it works, use the
         # correct file extension.
         extension = "log"
         try:
-            yaml.safe_load(output)
+            with open(partial) as f:
+                yaml.safe_load(f)
             logger.info("Logging %s output as YAML", self.user_id)
             extension = "yml"
         except yaml.YAMLError:
             logger.info("Logging %s output as text", self.user_id)
 
-        # Pick a uniquely numbered file name
-        filename = ''
-        for i in itertools.count(1):
-            if os.path.exists(os.path.join(results_dir, filename)):
+        # Pick a uniquely numbered file name. Names are claimed by
+        # creating the file exclusively, so concurrent grading jobs never
+        # share one, and then the output replaces it in one step.
+        try:
+            for i in itertools.count(1):
                 filename = "{}.{:02}.{}".format(self.user_id, i, extension)
-            else:
-                break
-
-        # Save results to a file
-        path = os.path.join(results_dir, filename)
-        with open(path, 'w') as result_file:
-            result_file.write(output)
+                path = os.path.join(results_dir, filename)
+                try:
+                    open(path, 'x').close()
+                    break
+                except FileExistsError:
+                    continue
+            os.replace(partial, path)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
 
         logger.info("Wrote to %s", path)
+        self.assignment.results.add(path)
+        self._update_record(result_file=filename)
+        if key is not None:
+            self.assignment.index.put_result(*key, result_file=filename)
+        return path
+
+    def record_output(self, output, key=None):
+        """Records grading output that was produced somewhere else (e.g.,
+        by a worker on another machine) as this submission's newest
+        result.
+
+        :param str output: The output
+
+        :param tuple key: The key to cache the output under (see
+            :meth:`_result_key`), if it should be reused
 
-    def grade(self, assignment, rebuild_container=False, show_output=True):
+        :return: The path to the result file
+        """
+        return self._record_output(output, key)
+
+    def _record_output(self, output, key=None):
+        """Records grading output that's already in memory.
+
+        :param str output: The output
+
+        :return: The path to the result file
+        """
+        with self._partial_result() as f:
+            f.write(output)
+        return self._record_result(f.name, key)
+
+    def grade(self, assignment, rebuild_container=False, show_output=True,
+              force=False, pool=None, gradesheet_commit=None):
         """Performs the magic--- prepares the docker container,
         runs the grade command, and writes to logs.
 
+        If this submission has already been graded in the assignment's
+        current image, with the current gradesheet, the earlier output
+        is reused instead. Output is streamed into the result file as
+        it's produced, rather than held in memory.
+
         :param Assignment assignment: The assignment we're grading, used for
             results directory.
         :param bool rebuild_container: Whether to discard the old
             container and build a new one instead. Defaults to False.
         :param bool show_output: Whether to output STDOUT/STDERR from the
             container to STDOUT. Defaults to True.
-
-        :return: None
+        :param bool force: Whether to grade the submission even if
+            it's already been graded. Defaults to False.
+        :param pool: A :class:`~grader.models.pool.ContainerPool` to
+            borrow a container from, instead of using this submission's
+            own container. Defaults to None.
+        :param str gradesheet_commit: The gradesheet commit results are
+            cached under. Callers grading many submissions look it up
+            once and pass it in; otherwise it's looked up here.
+
+        :return: The path to the file the output was recorded in
+        :rtype: str
 
         """
-        c_id = self.get_container_id(rebuild=rebuild_container)
-        logger.debug("Got container ID %s", c_id)
+        key = self._result_key(self.assignment.containers.image_id,
+                               gradesheet_commit)
+        if not force:
+            with self._phase("cache"):
+                path = self._cached_result(key, show_output)
+            if path is not None:
+                return path
+
+        if pool is not None:
+            with pool.checkout() as container:
+                logger.debug("Grading in pooled container %s", container.id)
+                return self._grade_in(container.id, show_output, key,
+                                      pooled=container,
+                                      client=pool.docker_cli)
+
+        with self.assignment.containers.checkout(self.uuid) as endpoint:
+            c_id = self.get_container_id(rebuild=rebuild_container,
+                                         endpoint=endpoint)
+            logger.debug("Got container ID %s on %s", c_id, endpoint.url)
+
+            # Start the container
+            client = endpoint.client
+            with self._phase("start"):
+                client.start(container=c_id)
+
+            path = self._grade_in(c_id, show_output, key, client=client)
+
+            with self._phase("stop"):
+                client.stop(
+                    container=c_id
+                )
+
+        return path
+
+    def _grade_in(self, c_id, show_output, key, pooled=None, client=None):
+        """Grades this submission in a running container.
+
+        :param pooled: The :class:`~grader.models.pool.PooledContainer`,
+            if the container was borrowed from a pool. The directory the
+            submission is unpacked into is added to its ``scratch``
+            list, and it's marked as ``killed`` if grade-it is.
+
+        :param client: The docker Client object for the container's
+            daemon. Defaults to :attr:`docker_cli`.
 
-        # Start the container
-        self.docker_cli.start(container=c_id)
+        :return: The path to the result file
+        """
+        client = client or self.docker_cli
 
         # Add all submission files
-        submission_dir = self._add_submission_files(c_id)
+        submission_dir = self._add_submission_files(c_id, client)
+        if pooled is not None:
+            pooled.scratch.append(submission_dir)
+
+        # grade-it is stopped by killing its container, if it runs
+        # or prints too much
+        timeout, output_limit = self._grade_limits()
+        killed = []
+        # The watchdog can go off after the output has ended but before
+        # it's cancelled; grade-it has finished by then, so it's let be
+        finished = threading.Event()
+        finishing = threading.Lock()
+
+        def kill(reason):
+            with finishing:
+                if finished.is_set():
+                    return
+                killed.append(reason)
+                if pooled is not None:
+                    pooled.killed = True
+                try:
+                    client.kill(container=c_id)
+                except docker.errors.APIError as e:
+                    logger.debug("Could not kill %s: %s", c_id, e)
+
+        watchdog = None
+        if timeout is not None:
+            watchdog = threading.Timer(timeout, kill, [
+                "it ran for more than {} seconds".format(timeout)
+            ])
+            watchdog.daemon = True
+
+        # Grade the submission. Retrieve output, displaying to the
+        # screen and streaming it into the result file
+        with self._phase("grade-it"), self._partial_result() as partial:
+            if watchdog is not None:
+                watchdog.start()
+            try:
+                output = client.exec_start(
+                    exec_id=client.exec_create(
+                        container=c_id,
+                        cmd="grade-it {}".format(submission_dir)
+                    ),
+                    stream=True,
+                )
+                size = 0
+                for line in output:
+                    size += len(line)
+                    if output_limit is not None and size > output_limit:
+                        kill("it printed more than {} bytes".format(
+                            output_limit))
+                        break
+                    self._collect_output(line, partial, show_output)
+            except Exception:
+                # Killing the container can cut the stream off
+                if not killed:
+                    raise
+            finally:
+                with finishing:
+                    finished.set()
+                if watchdog is not None:
+                    watchdog.cancel()
+
+            if killed:
+                self._note_killed(partial, killed[0])
+                key = None
+
+        with self._phase("record"):
+            return self._record_result(partial.name, key)
+
+    def _grade_limits(self):
+        """The ``grade-timeout`` (in seconds) and ``grade-output-limit``
+        (in bytes) from ``assignment.yml``. Either is None if it isn't
+        set.
 
-        # Grade the submission
-        output = self.docker_cli.exec_start(
-            exec_id=self.docker_cli.exec_create(
-                container=c_id,
-                cmd="grade-it {}".format(submission_dir)
-            ),
-            stream=True,
+        """
+        config = self.assignment.gradesheet.config
+        return config.get('grade-timeout'), config.get('grade-output-limit')
+
+    def _note_killed(self, partial, reason):
+        """Notes at the end of a result that grade-it was killed, and
+        why. Results like that aren't reused; the submission is graded
+        again next time.
+
+        """
+        logger.warning("Killed grade-it for %s: %s", self.user_id, reason)
+        partial.write("\n[grader] grade-it was killed: {}\n".format(reason))
+
+    async def grade_async(self, assignment, client, rebuild_container=False,
+                          show_output=True, force=False,
+                          gradesheet_commit=None):
+        """Like :meth:`grade`, but drives docker through an
+        :class:`~grader.utils.asyncdocker.AsyncDockerClient`, so that
+        many submissions can be graded from one event loop.
+
+        :return: The path to the file the output was recorded in
+        :rtype: str
+
+        """
+        # Containers and the image ID are fetched through the async
+        # client once, rather than by docker-py (which would block the
+        # event loop) for every submission
+        inventory = self.assignment.containers
+        try:
+            await inventory.load_async(client)
+        except docker.errors.NotFound as e:
+            raise self._container_error(e) from e
+
+        key = self._result_key(inventory.image_id, gradesheet_commit)
+        if not force:
+            with self._phase("cache"):
+                path = self._cached_result(key, show_output)
+            if path is not None:
+                return path
+
+        c_id = await self.get_container_id_async(
+            client, rebuild=rebuild_container
         )
+        logger.debug("Got container ID %s", c_id)
 
-        # Retrieve output, displaying to the screen and saving to a
-        # string buffer for later
-        output_text = io.StringIO()
-        for line in output:
-            line = line.decode("utf-8").rstrip('\n')
-            if line.endswith('Error: ""'):
-                continue
-            if show_output:
-                print(line)
-            output_text.write(line)
+        with self._phase("start"):
+            await client.start(container=c_id)
+        submission_dir = await self._add_submission_files_async(client, c_id)
+
+        timeout, output_limit = self._grade_limits()
+        killed = []
+
+        async def collect(partial):
+            output = await client.exec_start(
+                exec_id=await client.exec_create(
+                    container=c_id,
+                    cmd="grade-it {}".format(submission_dir)
+                ),
+                stream=True,
+            )
+            size = 0
+            async for line in output:
+                size += len(line)
+                if output_limit is not None and size > output_limit:
+                    killed.append("it printed more than {} bytes".format(
+                        output_limit))
+                    return
+                self._collect_output(line, partial, show_output)
+
+        with self._phase("grade-it"), self._partial_result() as partial:
+            try:
+                await asyncio.wait_for(collect(partial), timeout)
+            except asyncio.TimeoutError:
+                killed.append("it ran for more than {} seconds".format(
+                    timeout))
 
-        self._record_output(output_text.getvalue())
+            if killed:
+                try:
+                    await client.kill(container=c_id)
+                except docker.errors.APIError as e:
+                    logger.debug("Could not kill %s: %s", c_id, e)
+                self._note_killed(partial, killed[0])
+                key = None
 
-        self.docker_cli.stop(
-            container=c_id
+        with self._phase("record"):
+            path = self._record_result(partial.name, key)
+
+        with self._phase("stop"):
+            await client.stop(container=c_id)
+
+        return path
+
+    @classmethod
+    def _collect_output(cls, line, output_text, show_output):
+        line = line.decode("utf-8").rstrip('\n')
+        if line.endswith('Error: ""'):
+            return
+        if show_output:
+            print(line)
+        output_text.write(line)
+
+
+def _scan_item(path):
+    """Scans an item to be imported by :meth:`Submission.import_multiple`.
+
+    :return: The scan, or None if the item is a directory
+    """
+    if os.path.isdir(path):
+        logger.debug("%s is a directory", path)
+        return None
+
+    scan = scan_tarball(path) if os.path.isfile(path) else None
+    if scan is None:
+        raise SubmissionError(
+            "{} is neither a directory nor a tarball".format(path)
         )
+    logger.debug("%s is a tarfile", path)
+    return scan
+
+
+def _import_item(grader_path, assignment_name, path, sid_pattern, scan):
+    """Imports a single submission in a worker process. Only names are
+    passed in and out, since models can't be pickled.
+
+    :return: A list containing the new submission's full ID
+    """
+    from .grader import Grader
+
+    assignment = Grader(grader_path).get_assignment(assignment_name)
+    submission, = Submission.import_single(
+        assignment, path, sid_pattern=sid_pattern, scan=scan
+    )
+    return [submission.full_id]
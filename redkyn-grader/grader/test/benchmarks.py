@@ -0,0 +1,289 @@
+"""Benchmarks for grader's startup time, and for loading assignments and
+submissions from classes of various sizes.
+
+Each benchmark runs against a synthetic class built in a temporary
+directory, with a fake docker client, so no network access or docker
+daemon is needed. Results are compared against the baselines stored in
+``benchmarks.json``, next to this file::
+
+    # Compare against the stored baselines
+    python grader/test/benchmarks.py
+
+    # Only run the smaller classes, and fail if anything regressed
+    python grader/test/benchmarks.py --sizes 10 100 --check
+
+    # Record new baselines
+    python grader/test/benchmarks.py --save
+
+Timings depend heavily on the machine, so only compare against
+baselines recorded on the same one. The baselines in the repository
+are from whoever last saved them; ``--check`` refuses to use baselines
+from another machine, so run with ``--save`` on a clean checkout first.
+
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Make sure the grader being benchmarked is the one in this checkout
+SOURCE_ROOT = os.path.dirname(os.path.dirname(HERE))
+sys.path.insert(0, SOURCE_ROOT)
+
+from grader.models import Grader                          # NOQA
+
+from fakeclass import (                                   # NOQA
+    ASSIGNMENT, load_assignment, make_class, student_id
+)
+from fakedocker import fake_docker                        # NOQA
+
+BASELINES_PATH = os.path.join(HERE, "benchmarks.json")
+"""Where baselines are stored"""
+
+SIZES = [10, 100, 1000, 10000]
+"""Numbers of submissions in the synthetic classes"""
+
+GRADE_SIZE_LIMIT = 1000
+"""Grading isn't benchmarked for classes bigger than this"""
+
+CLI = "import sys, grader; sys.argv[0] = 'grader'; grader.run()"
+"""Runs grader's entry point in a fresh interpreter"""
+
+
+def measure(func, repeat, setup=None):
+    """Runs ``func`` ``repeat`` times, and returns the median time it
+    took. If there's a ``setup`` function, it's run (untimed) before each
+    run, and whatever it returns is passed to ``func``.
+
+    """
+    times = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        func(arg) if setup else func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def run_cli(*args):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [SOURCE_ROOT] + env.get('PYTHONPATH', '').split(os.pathsep)
+    ).rstrip(os.pathsep)
+    subprocess.run([sys.executable, "-c", CLI] + list(args), check=True,
+                   env=env, stdout=subprocess.DEVNULL,
+                   stderr=subprocess.DEVNULL)
+
+
+def touch_properties(submissions):
+    for s in submissions:
+        s.sha1sum
+        s.latest_mtime
+        s.latest_commit
+        s.import_time
+        s.student_name
+        s.latest_result
+
+
+def grade_all(submissions):
+    for s in submissions:
+        s.grade(s.assignment, show_output=False, force=True)
+
+
+def class_benchmarks(root, size):
+    """Yields ``(name, func, setup)`` for every benchmark of a class."""
+    index_path = os.path.join(root, "assignments", ASSIGNMENT,
+                              "index.sqlite3")
+
+    def cold_assignment():
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(index_path + suffix):
+                os.remove(index_path + suffix)
+        return load_assignment(root)
+
+    def submissions():
+        return load_assignment(root).submissions
+
+    yield ("cli list", lambda: run_cli("--path", root, "list"), None)
+    yield ("cli cat",
+           lambda: run_cli("--path", root, "cat", ASSIGNMENT, student_id(0)),
+           None)
+    yield ("Grader.assignments",
+           lambda: [a.gradesheet for a in Grader(root).assignments.values()],
+           None)
+    yield ("Grader.get_assignment",
+           lambda: load_assignment(root).gradesheet, None)
+    yield ("submissions_by_user (cold index)",
+           lambda a: a.submissions_by_user, cold_assignment)
+    yield ("submissions_by_user (warm index)",
+           lambda a: a.submissions_by_user,
+           lambda: load_assignment(root))
+    yield ("Submission properties", touch_properties, submissions)
+    if size <= GRADE_SIZE_LIMIT:
+        yield ("grade (fake docker)", grade_all, submissions)
+
+
+def run_benchmarks(sizes=SIZES, repeat=3, report=print):
+    """Runs every benchmark.
+
+    :param list sizes: Class sizes to benchmark
+
+    :param int repeat: How many times to run each benchmark. The
+        median time is kept.
+
+    :param report: Called with a line of text as each benchmark
+        finishes
+
+    :return: A dict mapping benchmark names to dicts mapping class
+        sizes (as strings) to seconds
+    """
+    results = {}
+
+    def record(name, size, seconds):
+        results.setdefault(name, {})[str(size)] = round(seconds, 6)
+        report("{:<36} {:>6} {:>10.4f}s".format(name, size, seconds))
+
+    record("cli help", "-", measure(lambda: run_cli("help"), repeat))
+
+    for size in sizes:
+        root = tempfile.mkdtemp(prefix="grader-bench-")
+        try:
+            with fake_docker() as client:
+                make_class(root, size)
+                a = load_assignment(root)
+                a.build_image(silent=True)
+                client.calls.clear()
+
+                for name, func, setup in class_benchmarks(root, size):
+                    record(name, size, measure(func, repeat, setup))
+        finally:
+            shutil.rmtree(root)
+
+    return results
+
+
+def load_baselines(path=BASELINES_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'results': {}}
+
+
+def this_machine():
+    """Describes the machine baselines are recorded on"""
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+    }
+
+
+def save_baselines(results, path=BASELINES_PATH):
+    baselines = load_baselines(path)
+    for name, by_size in results.items():
+        baselines['results'].setdefault(name, {}).update(by_size)
+    baselines['machine'] = this_machine()
+    with open(path, "w") as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(results, baselines, threshold=0.25, noise=0.005):
+    """Compares results against baselines.
+
+    :param float threshold: How much slower (as a fraction of the
+        baseline) a benchmark has to be to count as a regression
+
+    :param float noise: Differences smaller than this many seconds
+        are never regressions
+
+    :return: A list of rows: (name, size, seconds, baseline seconds or
+        None, change as a fraction or None, whether it regressed)
+    """
+    rows = []
+    for name, by_size in results.items():
+        for size, seconds in by_size.items():
+            baseline = baselines['results'].get(name, {}).get(size)
+            if baseline is None:
+                rows.append((name, size, seconds, None, None, False))
+                continue
+            change = (seconds - baseline) / baseline if baseline else 0.0
+            regressed = (change > threshold and
+                         seconds - baseline > noise)
+            rows.append((name, size, seconds, baseline, change, regressed))
+    return rows
+
+
+def format_report(rows):
+    from prettytable import PrettyTable
+
+    table = PrettyTable(["Benchmark", "Size", "Time (s)", "Baseline (s)",
+                         "Change", ""])
+    table.align["Benchmark"] = "l"
+    for name, size, seconds, baseline, change, regressed in rows:
+        table.add_row([
+            name, size, "{:.4f}".format(seconds),
+            "--" if baseline is None else "{:.4f}".format(baseline),
+            "--" if change is None else "{:+.0%}".format(change),
+            "REGRESSED" if regressed else "",
+        ])
+    return table.get_string()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES,
+                        help='Class sizes to benchmark')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Runs per benchmark (the median is kept)')
+    parser.add_argument('--baselines', default=BASELINES_PATH,
+                        help='Baselines file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Slowdown (as a fraction) that counts as a '
+                             'regression')
+    parser.add_argument('--save', action='store_true',
+                        help='Store the results as the new baselines')
+    parser.add_argument('--check', action='store_true',
+                        help='Exit with an error if anything regressed')
+    args = parser.parse_args(argv)
+
+    # Models log a lot at INFO
+    logging.basicConfig(level=logging.WARNING)
+
+    baselines = load_baselines(args.baselines)
+    machine = baselines.get('machine')
+    if machine is not None and machine != this_machine():
+        message = ("{} was recorded on another machine ({}, Python {}), "
+                   "so the comparison means little. Record your own "
+                   "baselines with --save first.".format(
+                       args.baselines, machine.get('platform'),
+                       machine.get('python')))
+        if args.check:
+            parser.error(message)
+        print("Warning: " + message)
+
+    results = run_benchmarks(args.sizes, args.repeat)
+    rows = compare(results, baselines, args.threshold)
+    print()
+    print(format_report(rows))
+
+    if args.save:
+        save_baselines(results, args.baselines)
+        print("Saved baselines to {}".format(args.baselines))
+
+    if args.check and any(row[-1] for row in rows):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
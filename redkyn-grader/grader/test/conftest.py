@@ -5,6 +5,9 @@ import os
 
 from grader import make_parser
 
+from fakeclass import make_class, load_assignment
+from fakedocker import fake_docker
+
 
 @pytest.fixture
 def clean_dir(request):
@@ -38,3 +41,31 @@ def parse_and_run(request):
 
     request.addfinalizer(cleanup)
     return _parse_and_run
+
+
+@pytest.fixture
+def docker_client():
+    """A :class:`~fakedocker.FakeDockerClient` that every model uses"""
+    with fake_docker() as client:
+        yield client
+
+
+@pytest.fixture
+def class_size():
+    """How many submissions :func:`built_class` makes. Override it in a
+    test module to change it.
+
+    """
+    return 4
+
+
+@pytest.fixture
+def built_class(clean_dir, docker_client, class_size):
+    """A synthetic class in ``clean_dir``, with its assignment's image
+    built. Returns the assignment and the fake docker client.
+
+    """
+    make_class(clean_dir, class_size)
+    a = load_assignment(clean_dir)
+    a.build_image(silent=True)
+    return a, docker_client
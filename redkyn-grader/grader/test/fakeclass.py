@@ -0,0 +1,68 @@
+"""Synthetic classes for tests and benchmarks: a grader directory with
+one assignment and any number of tiny submissions, built without
+importing anything.
+
+"""
+import io
+import os
+import tarfile
+import uuid
+
+from grader.models import Grader
+
+ASSIGNMENT = "a1"
+"""The name of the synthetic assignment"""
+
+
+def student_id(i):
+    return "student{:05}".format(i)
+
+
+def make_submission(submissions_dir, user_id):
+    """Writes a tiny submission archive straight into the submissions
+    directory, as if it had been imported.
+
+    """
+    full_id = "{}--{}".format(user_id, uuid.uuid4())
+    content = "print('{}')\n".format(user_id).encode()
+    path = os.path.join(submissions_dir, full_id + ".tar.gz")
+    with tarfile.open(path, "w:gz") as tar:
+        info = tarfile.TarInfo(user_id)
+        info.type = tarfile.DIRTYPE
+        info.mode = 0o755
+        tar.addfile(info)
+
+        info = tarfile.TarInfo("{}/main.py".format(user_id))
+        info.size = len(content)
+        tar.addfile(info, io.BytesIO(content))
+    return path
+
+
+def make_class(root, size):
+    """Builds a grader in ``root`` with a single assignment and ``size``
+    submissions, two per student. Every student has one result.
+
+    :return: The path to the grader
+    """
+    students = max(1, size // 2)
+    g = Grader.new(root, "bench", "bench-course")
+    g.config.roster.extend(
+        {'id': student_id(i), 'name': "Student {}".format(i)}
+        for i in range(students)
+    )
+    g.config.save()
+
+    g = Grader(root)
+    g.create_assignment(ASSIGNMENT)
+    a = g.get_assignment(ASSIGNMENT)
+    for i in range(size):
+        make_submission(a.submissions_dir, student_id(i % students))
+    for i in range(students):
+        path = os.path.join(a.results_dir, "{}.01.yml".format(student_id(i)))
+        with open(path, "w") as f:
+            f.write("score: 10\n")
+    return root
+
+
+def load_assignment(root):
+    return Grader(root).get_assignment(ASSIGNMENT)
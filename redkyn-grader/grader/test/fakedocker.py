@@ -0,0 +1,244 @@
+"""A fake docker client, standing in for :class:`docker.APIClient` in
+tests and benchmarks, so they run without a docker daemon.
+
+Only the calls grader makes are implemented. Containers and images
+live in memory, and ``exec`` calls return canned output.
+
+"""
+import contextlib
+import docker
+import hashlib
+import itertools
+import json
+import time
+
+from grader.models.mixins import DockerClientMixin
+
+
+class FakeDockerClient(object):
+    """An in-memory stand-in for :class:`docker.APIClient`.
+
+    :ivar dict images: Maps image tags to image IDs. Images are
+        "built" by :meth:`build`.
+    :ivar dict containers_by_id: Maps container IDs to containers
+    :ivar list calls: The name of every method called, in order
+    :ivar bool hang: Whether ``grade-it`` keeps running after printing
+        its output, until its container is stopped
+    """
+
+    GRADE_OUTPUT = [b"score: 10\n", b"comments: Looks good\n"]
+    """What ``grade-it`` prints"""
+
+    def __init__(self, images=None, grade_output=None):
+        self.images = dict(images or {})
+        self.image_labels = {}
+        self.containers_by_id = {}
+        self.execs = {}
+        self.calls = []
+        self.grade_output = list(grade_output or self.GRADE_OUTPUT)
+        self.hang = False
+        self._exec_containers = {}
+        self._ids = itertools.count(1)
+
+    def _new_id(self, kind):
+        self.calls.append(kind)
+        seed = "{}-{}".format(kind, next(self._ids)).encode()
+        return hashlib.sha256(seed).hexdigest()
+
+    def _container(self, container):
+        self.calls.append("container")
+        for c in self.containers_by_id.values():
+            if container in (c['Id'], c['Name']):
+                return c
+        raise docker.errors.NotFound(
+            "No such container: {}".format(container),
+            explanation="No such container: {}".format(container)
+        )
+
+    def build(self, path=None, tag=None, decode=False, labels=None,
+              **kwargs):
+        self.images[tag] = "sha256:" + self._new_id("build")
+        self.image_labels[tag] = dict(labels or {})
+        return iter([{'stream': "Successfully built {}\n".format(tag)}])
+
+    def inspect_image(self, image):
+        self.calls.append("inspect_image")
+        if image not in self.images:
+            raise docker.errors.NotFound(
+                "No such image: {}".format(image),
+                explanation="No such image: {}".format(image)
+            )
+        return {'Id': self.images[image],
+                'Config': {'Labels': self.image_labels.get(image)}}
+
+    def get_image(self, image):
+        self.inspect_image(image)
+        self.calls.append("get_image")
+        # Stands in for the tarball docker would send
+        return iter([json.dumps({image: self.images[image]}).encode()])
+
+    def load_image(self, data):
+        self.calls.append("load_image")
+        self.images.update(json.loads(b"".join(data).decode()))
+
+    def remove_image(self, image):
+        self.calls.append("remove_image")
+        self.images.pop(image, None)
+
+    def containers(self, all=False, filters=None):
+        self.calls.append("containers")
+        labels = (filters or {}).get('label', [])
+        if isinstance(labels, str):
+            labels = [labels]
+
+        found = []
+        for c in self.containers_by_id.values():
+            if not all and not c['Running']:
+                continue
+            for label in labels:
+                key, _, value = label.partition("=")
+                if key not in c['Labels'] or \
+                   (value and c['Labels'][key] != value):
+                    break
+            else:
+                found.append(c)
+        return found
+
+    def create_container(self, image, labels=None, name=None, **kwargs):
+        self.inspect_image(image)
+        container_id = self._new_id("create_container")
+        self.containers_by_id[container_id] = {
+            'Id': container_id,
+            'Name': name,
+            'Image': self.images[image],
+            'ImageID': self.images[image],
+            'Labels': dict(labels or {}),
+            'Created': int(time.time()),
+            'Running': False,
+            'Files': [],
+        }
+        return {'Id': container_id, 'Warnings': None}
+
+    def inspect_container(self, container):
+        c = self._container(container)
+        return {'Id': c['Id'], 'Image': c['Image'], 'Created': c['Created'],
+                'State': {'Running': c['Running']}}
+
+    def remove_container(self, container, force=False):
+        c = self._container(container)
+        del self.containers_by_id[c['Id']]
+
+    def start(self, container):
+        self._container(container)['Running'] = True
+
+    def stop(self, container, timeout=None):
+        self._container(container)['Running'] = False
+
+    def kill(self, container, signal=None):
+        self.stop(container)
+
+    def put_archive(self, container, path, data):
+        if hasattr(data, 'read'):
+            data = data.read()
+        elif not isinstance(data, bytes):
+            data = b"".join(data)
+        self._container(container)['Files'].append((path, len(data)))
+        return True
+
+    def exec_create(self, container, cmd, user=None, **kwargs):
+        c = self._container(container)
+        if not c['Running']:
+            raise docker.errors.APIError(
+                "Container {} is not running".format(c['Id']),
+                explanation="Container {} is not running".format(c['Id'])
+            )
+        exec_id = self._new_id("exec_create")
+        self.execs[exec_id] = cmd
+        self._exec_containers[exec_id] = c
+        return {'Id': exec_id}
+
+    def _hang(self, container, output):
+        yield from output
+        while container['Running']:
+            time.sleep(0.01)
+
+    def exec_start(self, exec_id, stream=False, **kwargs):
+        self.calls.append("exec_start")
+        cmd = self.execs[exec_id['Id']]
+        if isinstance(cmd, list):
+            cmd = " ".join(cmd)
+
+        if cmd.startswith("mktemp"):
+            output = [b"/tmp/tmp.fake\n"]
+        elif cmd.startswith("grade-it"):
+            output = self.grade_output
+            if self.hang:
+                container = self._exec_containers[exec_id['Id']]
+                return self._hang(container, output)
+        else:
+            output = []
+
+        if stream:
+            return iter(output)
+        return b"".join(output)
+
+    def exec_inspect(self, exec_id):
+        self.calls.append("exec_inspect")
+        self.execs[exec_id['Id']]
+        return {'ExitCode': 0, 'Running': False}
+
+
+class FakeAsyncDockerClient(object):
+    """Stands in for :class:`~grader.utils.asyncdocker.AsyncDockerClient`
+    by running a :class:`FakeDockerClient`'s methods as coroutines.
+
+    :ivar FakeDockerClient sync: The client that does the work
+    """
+
+    def __init__(self, sync=None):
+        self.sync = sync or FakeDockerClient()
+
+    def __getattr__(self, name):
+        method = getattr(self.sync, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+    async def exec_start(self, exec_id, stream=False):
+        output = self.sync.exec_start(exec_id, stream=stream)
+        if not stream:
+            return output
+
+        async def frames():
+            for line in output:
+                yield line
+        return frames()
+
+
+@contextlib.contextmanager
+def fake_docker(endpoints=None):
+    """Makes every model use a :class:`FakeDockerClient`.
+
+    :param list endpoints: Docker endpoint URLs, each of which gets its
+        own client. The first is used when no URL is given.
+
+    :return: The client, or with ``endpoints``, a dict mapping each URL
+        to its client
+    """
+    if endpoints:
+        clients = {url: FakeDockerClient() for url in endpoints}
+
+        def factory(base_url=endpoints[0]):
+            return clients[base_url]
+    else:
+        clients = FakeDockerClient()
+
+        def factory(base_url=None):
+            return clients
+    original = DockerClientMixin.docker_client_factory
+    DockerClientMixin.docker_client_factory = staticmethod(factory)
+    try:
+        yield clients
+    finally:
+        DockerClientMixin.docker_client_factory = original
@@ -0,0 +1,171 @@
+import asyncio
+import json
+import os
+import struct
+import tempfile
+import threading
+
+import docker
+import pytest
+
+from grader.utils.asyncdocker import AsyncDockerClient
+
+
+class FakeDaemon(object):
+    """Just enough of the Docker Engine API, served on a unix socket
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.uploads = {}
+
+    async def handle(self, reader, writer):
+        request_line = (await reader.readline()).decode().strip()
+        method, path, _ = request_line.split(" ")
+        headers = {}
+        while True:
+            line = (await reader.readline()).decode().strip()
+            if not line:
+                break
+            key, _, value = line.partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        body = b''
+        if headers.get('transfer-encoding') == 'chunked':
+            while True:
+                size = int(await reader.readline(), 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                body += await reader.readexactly(size)
+                await reader.readline()
+        elif int(headers.get('content-length', 0)):
+            body = await reader.readexactly(int(headers['content-length']))
+
+        self.requests.append((method, path))
+        status, payload = self.route(method, path, body)
+        writer.write("HTTP/1.1 {} Whatever\r\n".format(status).encode())
+        if isinstance(payload, bytes):
+            # Raw exec stream; no length, the connection just closes
+            writer.write(b"Content-Type: application/vnd.docker.raw-stream"
+                         b"\r\n\r\n" + payload)
+        else:
+            data = json.dumps(payload).encode()
+            writer.write("Content-Length: {}\r\n\r\n".format(len(data))
+                         .encode() + data)
+        await writer.drain()
+        writer.close()
+
+    def route(self, method, path, body):
+        path, _, query = path.partition("?")
+        if path == "/version":
+            return 200, {"ApiVersion": "1.40"}
+        if path == "/v1.40/containers/json":
+            return 200, [{"Id": "abc", "Labels": {}}]
+        if path == "/v1.40/containers/create":
+            return 201, {"Id": "new", "Warnings": []}
+        if path == "/v1.40/containers/missing/json":
+            return 404, {"message": "No such container: missing"}
+        if path == "/v1.40/containers/abc/archive":
+            self.uploads[query] = body
+            return 200, {}
+        if path == "/v1.40/containers/abc/kill":
+            return 204, {}
+        if path == "/v1.40/containers/abc/exec":
+            return 201, {"Id": "exec1"}
+        if path == "/v1.40/exec/exec1/start":
+            frames = b''
+            for text in (b"hello ", b"world"):
+                frames += struct.pack('>BxxxL', 1, len(text)) + text
+            return 200, frames
+        return 500, {"message": "unexpected {} {}".format(method, path)}
+
+
+@pytest.fixture
+def daemon():
+    loop = asyncio.new_event_loop()
+    fake = FakeDaemon()
+    tmpdir = tempfile.mkdtemp()
+    socket_path = os.path.join(tmpdir, "docker.sock")
+    server = loop.run_until_complete(
+        asyncio.start_unix_server(fake.handle, socket_path)
+    )
+    fake.client = AsyncDockerClient("unix://" + socket_path)
+    fake.run = loop.run_until_complete
+    yield fake
+    server.close()
+    loop.run_until_complete(server.wait_closed())
+    loop.close()
+    os.remove(socket_path)
+    os.rmdir(tmpdir)
+
+
+def test_containers(daemon):
+    """Test a simple JSON round trip
+    """
+    containers = daemon.run(daemon.client.containers(
+        all=True, filters={'label': 'submission_uuid=1234'}
+    ))
+    assert containers == [{"Id": "abc", "Labels": {}}]
+    assert daemon.requests[0] == ("GET", "/version")
+
+
+def test_not_found(daemon):
+    """Test that errors come back as docker-py exceptions
+    """
+    with pytest.raises(docker.errors.NotFound) as err:
+        daemon.run(daemon.client.inspect_container("missing"))
+    assert err.value.explanation == "No such container: missing"
+
+
+def test_put_archive_streams_file(daemon):
+    """Test uploading an archive straight from a file
+    """
+    with tempfile.TemporaryFile() as f:
+        f.write(b"x" * 200000)
+        f.seek(0)
+        daemon.run(daemon.client.put_archive("abc", "/tmp/stuff", f))
+
+    assert daemon.uploads["path=%2Ftmp%2Fstuff"] == b"x" * 200000
+
+
+def test_put_archive_iterable_off_loop(daemon):
+    """Test that an iterable of chunks is produced outside the event
+    loop's thread
+    """
+    threads = set()
+
+    def chunks():
+        for _ in range(3):
+            threads.add(threading.get_ident())
+            yield b"x" * 1000
+
+    daemon.run(daemon.client.put_archive("abc", "/tmp/stuff", chunks()))
+
+    assert daemon.uploads["path=%2Ftmp%2Fstuff"] == b"x" * 3000
+    assert threading.get_ident() not in threads
+
+
+def test_exec_output(daemon):
+    """Test demultiplexing exec output, streamed and not
+    """
+    client = daemon.client
+    exec_id = daemon.run(client.exec_create("abc", "grade-it /tmp"))
+    assert daemon.run(client.exec_start(exec_id)) == b"hello world"
+
+    async def stream():
+        output = await client.exec_start(exec_id, stream=True)
+        return [chunk async for chunk in output]
+
+    assert daemon.run(stream()) == [b"hello ", b"world"]
+
+
+def test_kill(daemon):
+    """Test killing a container, with and without a signal
+    """
+    daemon.run(daemon.client.kill("abc"))
+    daemon.run(daemon.client.kill("abc", signal="SIGTERM"))
+    assert daemon.requests[-2:] == [
+        ("POST", "/v1.40/containers/abc/kill"),
+        ("POST", "/v1.40/containers/abc/kill?signal=SIGTERM"),
+    ]
@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+import benchmarks
+
+
+def test_benchmarks_run():
+    """Test that the benchmarks run (on a tiny class)
+    """
+    results = benchmarks.run_benchmarks(sizes=[4], repeat=1,
+                                        report=lambda line: None)
+    assert set(results["cli help"]) == {"-"}
+    assert set(results["grade (fake docker)"]) == {"4"}
+    assert all(s >= 0 for r in results.values() for s in r.values())
+
+
+def test_benchmarks_compare():
+    """Test comparing results against baselines
+    """
+    baselines = {'results': {'a': {'10': 1.0}, 'b': {'10': 0.001}}}
+    results = {'a': {'10': 2.0, '100': 5.0}, 'b': {'10': 0.002}}
+    rows = benchmarks.compare(results, baselines, threshold=0.25)
+    regressed = {(name, size): r for name, size, _, _, _, r in rows}
+    assert regressed == {
+        ('a', '10'): True,
+        ('a', '100'): False,    # No baseline
+        ('b', '10'): False,     # Slower, but within the noise
+    }
+    assert "REGRESSED" in benchmarks.format_report(rows)
+
+
+def test_benchmarks_check_other_machine(tmpdir):
+    """Test that --check won't compare against another machine's
+    baselines
+    """
+    path = str(tmpdir.join("benchmarks.json"))
+    benchmarks.save_baselines({'a': {'10': 1.0}}, path)
+    baselines = benchmarks.load_baselines(path)
+    assert baselines['machine'] == benchmarks.this_machine()
+
+    baselines['machine']['platform'] = "elsewhere"
+    with open(path, "w") as f:
+        json.dump(baselines, f)
+    with pytest.raises(SystemExit) as exit:
+        benchmarks.main(["--check", "--baselines", path, "--sizes", "4"])
+    assert exit.value.code == 2
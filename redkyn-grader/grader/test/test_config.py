@@ -1,9 +1,11 @@
 import os
 import pytest
+import time
 import uuid
 import yaml
 
 from grader.models import Grader, AssignmentConfig, ConfigValidationError
+from grader.models import config
 
 
 def write_config(path, name, config):
@@ -197,3 +199,95 @@ def test_bad_assignment_name(clean_dir):
 
     with pytest.raises(ConfigValidationError):
         AssignmentConfig(clean_dir)
+
+
+def age(path, seconds=60):
+    """Backdates a file, so that it's old enough to be cached"""
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def test_config_cached(clean_dir, monkeypatch):
+    """Test that unchanged configs aren't parsed again, and that changed
+    ones are
+    """
+    write_config(clean_dir, "grader.yml", {
+        "course-name": "cs2001",
+        "course-id": str(uuid.uuid4()),
+    })
+    config_path = os.path.join(clean_dir, "grader.yml")
+    age(config_path)
+    g = Grader(clean_dir)
+
+    loads = []
+    real_load = yaml.safe_load
+    monkeypatch.setattr(yaml, "safe_load",
+                        lambda f: loads.append(f) or real_load(f))
+
+    # Changing a loaded config doesn't change the cached copy
+    g.config.data['course-name'] = "nope"
+    assert Grader(clean_dir).config['course-name'] == "cs2001"
+    assert loads == []
+
+    write_config(clean_dir, "grader.yml", {
+        "course-name": "cs2002",
+        "course-id": str(uuid.uuid4()),
+    })
+    age(config_path, 30)
+    assert Grader(clean_dir).config['course-name'] == "cs2002"
+    assert len(loads) == 1
+
+
+def test_config_disk_cache(clean_dir, monkeypatch):
+    """Test that validated configs are cached on disk, if asked
+    """
+    cache_dir = os.path.join(clean_dir, "cache")
+    os.mkdir(cache_dir)
+    monkeypatch.setenv(config.CACHE_DIR_ENV, cache_dir)
+
+    write_config(clean_dir, "grader.yml", {
+        "course-name": "cs2001",
+        "course-id": str(uuid.uuid4()),
+    })
+    age(os.path.join(clean_dir, "grader.yml"))
+    Grader(clean_dir)
+    assert len(os.listdir(cache_dir)) == 1
+
+    # A new process wouldn't have the in-memory cache
+    monkeypatch.setattr(config, "_cache", {})
+    monkeypatch.setattr(yaml, "safe_load", None)
+    assert Grader(clean_dir).config['course-name'] == "cs2001"
+
+
+def test_roster_lookups(clean_dir):
+    """Test looking students up in the roster, and that lookups keep
+    up with changes to it
+    """
+    write_config(clean_dir, "grader.yml", {
+        "course-name": "cs2001",
+        "course-id": str(uuid.uuid4()),
+        "roster": [
+            {"name": "Finn Mertens", "id": "fmmmm4"},
+            {"name": "Jake the Dog", "id": "jtdbb9"}
+        ],
+    })
+    g = Grader(clean_dir)
+    roster = g.config.roster
+
+    assert "jtdbb9" in g.student_ids
+    assert g.config.get_student_name("fmmmm4") == "Finn Mertens"
+    assert roster.by_name("Jake the Dog") == [roster[1]]
+    with pytest.raises(KeyError):
+        g.config.get_student_name("pbubble")
+
+    roster.append({"name": "Princess Bubblegum", "id": "pbubble"})
+    del roster[0]
+    assert "fmmmm4" not in g.student_ids
+    assert g.config.get_student_name("pbubble") == "Princess Bubblegum"
+    assert roster.by_name("Finn Mertens") == []
+
+    # It's still saved as a plain list
+    g.config.save()
+    with open(os.path.join(clean_dir, "grader.yml")) as f:
+        ids = [s['id'] for s in yaml.safe_load(f)['roster']]
+    assert ids == ["jtdbb9", "pbubble"]
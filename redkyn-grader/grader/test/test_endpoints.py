@@ -0,0 +1,67 @@
+import pytest
+
+from fakeclass import make_class, load_assignment
+from fakedocker import fake_docker
+from grader.models import DockerEndpoints, Grader
+
+ENDPOINTS = ["unix://var/run/docker.sock", "tcp://grading-2:2375"]
+
+
+@pytest.fixture
+def two_daemons(clean_dir):
+    with fake_docker(ENDPOINTS) as clients:
+        make_class(clean_dir, 4)
+        g = Grader(clean_dir)
+        g.config.data['docker-endpoints'] = ENDPOINTS
+        g.config.save()
+        load_assignment(clean_dir).build_image(silent=True)
+        yield clean_dir, clients
+
+
+def test_least_loaded():
+    """Test that the endpoint with the fewest submissions being graded
+    (then the fewest containers) is picked
+    """
+    endpoints = DockerEndpoints(ENDPOINTS)
+    first, second = endpoints
+    assert endpoints.primary is first
+    assert endpoints.least_loaded() is first
+    assert endpoints.least_loaded({first.url: 2}) is second
+
+    with endpoints.working() as busy:
+        assert busy is first
+        assert endpoints.least_loaded() is second
+        with endpoints.working() as also_busy:
+            assert also_busy is second
+    assert first.busy == second.busy == 0
+
+
+def test_containers_spread_across_endpoints(two_daemons):
+    """Test that containers are spread across daemons, the image is
+    copied where it's needed, and containers are found on whichever
+    daemon they're on
+    """
+    path, clients = two_daemons
+    primary, other = (clients[url] for url in ENDPOINTS)
+    assert other.images == {}
+
+    a = load_assignment(path)
+    for s in a.submissions:
+        with open(s.grade(a, show_output=False)) as f:
+            assert "score: 10" in f.read()
+
+    half = len(a.submissions) // 2
+    assert len(primary.containers_by_id) == half
+    assert len(other.containers_by_id) == half
+    assert other.images == primary.images
+    assert other.calls.count("load_image") == 1
+
+    # A new command grades each submission where its container is
+    a = load_assignment(path)
+    for s in a.submissions:
+        s.grade(a, show_output=False, force=True)
+        endpoint = a.containers.endpoint(s.uuid)
+        assert s.docker_cli is clients[endpoint.url]
+    assert len(primary.containers_by_id) == half
+    assert len(other.containers_by_id) == half
+    assert other.calls.count("load_image") == 1
@@ -0,0 +1,152 @@
+import gzip
+import hashlib
+import io
+import os
+import tarfile
+
+from grader.utils.files import (
+    link_or_copy, rebase_tarball, scan_tarball, write_tarball
+)
+
+
+def make_tarball(path, entries):
+    """Make a tarball from (arcname, is_dir) pairs
+    """
+    with tarfile.open(path, "w:gz") as tar:
+        for name, is_dir in entries:
+            info = tarfile.TarInfo(name)
+            info.mtime = 1234
+            if is_dir:
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+            else:
+                tar.addfile(info, open(os.devnull, 'rb'))
+    return path
+
+
+def test_scan_tarball(clean_dir):
+    """Test scanning a well-formed tarball
+    """
+    path = make_tarball(os.path.join(clean_dir, "jtd111.tar.gz"), [
+        ("jtd111", True), ("jtd111/main.py", False),
+        ("jtd111/.git/HEAD", False),
+    ])
+    scan = scan_tarball(path)
+
+    with open(path, 'rb') as f:
+        content = f.read()
+    assert scan.sha1 == hashlib.sha1(content).hexdigest()
+    assert scan.size == len(content)
+    assert scan.members == {"jtd111": 1234, "jtd111/main.py": 1234,
+                            "jtd111/.git/HEAD": 1234}
+    assert scan.roots == {"jtd111": True}
+    assert scan.has_repo
+    assert scan.problems("jtd111") == []
+
+
+def test_scan_tarball_problems(clean_dir):
+    """Test the problems found in badly-formed tarballs
+    """
+    path = os.path.join(clean_dir, "t.tar.gz")
+
+    make_tarball(path, [("jtd111/main.py", False)])
+    assert scan_tarball(path).problems("jtd111") == []
+    assert not scan_tarball(path).has_repo
+
+    make_tarball(path, [("a", True), ("b", True)])
+    problem, = scan_tarball(path).problems("jtd111")
+    assert "exactly one item" in problem
+
+    make_tarball(path, [("wrong", True)])
+    problem, = scan_tarball(path).problems("jtd111")
+    assert "Inner folder" in problem
+
+    make_tarball(path, [("jtd111", False)])
+    problem, = scan_tarball(path).problems("jtd111")
+    assert "should be a directory" in problem
+
+
+def test_scan_not_a_tarball(clean_dir):
+    """Test scanning something that isn't a tarball
+    """
+    path = os.path.join(clean_dir, "nope.tar.gz")
+    with open(path, 'w') as f:
+        f.write("nope")
+    assert scan_tarball(path) is None
+
+
+def test_write_tarball(clean_dir):
+    """Test writing a tarball straight to its destination
+    """
+    source = os.path.join(clean_dir, "jtd111")
+    os.mkdir(source)
+    with open(os.path.join(source, "main.py"), "w") as f:
+        f.write("print('hi')")
+
+    dest = os.path.join(clean_dir, "out.tar.gz")
+    written = write_tarball(source, dest)
+
+    # It's all there, and nothing's left lying around
+    assert sorted(os.listdir(clean_dir)) == ["jtd111", "out.tar.gz"]
+
+    # What we learned while writing matches what a scan finds
+    scan = scan_tarball(dest)
+    assert written.sha1 == scan.sha1
+    assert written.size == scan.size
+    assert written.members == scan.members
+    assert written.roots == scan.roots == {"jtd111": True}
+
+
+def test_link_or_copy(clean_dir):
+    """Test placing a file by link (or copy)
+    """
+    source = os.path.join(clean_dir, "a")
+    with open(source, "w") as f:
+        f.write("stuff")
+
+    dest = os.path.join(clean_dir, "b")
+    assert link_or_copy(source, dest) in ("reflink", "link", "copy")
+    with open(dest) as f:
+        assert f.read() == "stuff"
+    assert sorted(os.listdir(clean_dir)) == ["a", "b"]
+
+    dest = os.path.join(clean_dir, "c")
+    assert link_or_copy(source, dest, hardlink=False) in ("reflink", "copy")
+    assert not os.path.samefile(source, dest)
+
+
+def test_rebase_tarball(clean_dir):
+    """Test moving a tarball's contents into a new, readable directory
+    """
+    long_name = "jtd111/" + "x" * 150
+    path = os.path.join(clean_dir, "jtd111.tar.gz")
+    with tarfile.open(path, "w:gz") as tar:
+        info = tarfile.TarInfo("jtd111")
+        info.type = tarfile.DIRTYPE
+        info.mode = 0o700
+        tar.addfile(info)
+
+        info = tarfile.TarInfo(long_name)
+        info.mode = 0o600
+        info.size = 1000
+        tar.addfile(info, io.BytesIO(b"a" * 1000))
+
+        info = tarfile.TarInfo("jtd111/run.sh")
+        info.mode = 0o700
+        tar.addfile(info, open(os.devnull, 'rb'))
+
+    data = b"".join(rebase_tarball(path, "grader-1", chunk_size=64))
+    assert data[:2] == b"\x1f\x8b"
+    raw = b"".join(rebase_tarball(path, "grader-1", compression=None))
+    assert gzip.decompress(data) == raw
+    with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+        modes = {m.name: m.mode for m in tar}
+        content = tar.extractfile("grader-1/" + long_name).read()
+
+    assert modes == {
+        "grader-1": 0o1777,
+        "grader-1/jtd111": 0o755,
+        "grader-1/" + long_name: 0o644,
+        "grader-1/jtd111/run.sh": 0o755,
+    }
+    assert content == b"a" * 1000
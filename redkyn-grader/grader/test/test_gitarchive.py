@@ -0,0 +1,88 @@
+import os
+import subprocess
+import tarfile
+
+import pytest
+
+from grader.utils.gitarchive import read_latest_commit
+
+
+def git(repo, *args, date=None):
+    env = dict(os.environ,
+               GIT_AUTHOR_NAME="Finn", GIT_AUTHOR_EMAIL="finn@ooo",
+               GIT_COMMITTER_NAME="Finn", GIT_COMMITTER_EMAIL="finn@ooo")
+    if date:
+        env["GIT_AUTHOR_DATE"] = env["GIT_COMMITTER_DATE"] = date
+    subprocess.check_call(["git", "-C", repo] + list(args), env=env,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+@pytest.fixture
+def repo(clean_dir):
+    path = os.path.join(clean_dir, "jtd111")
+    os.mkdir(path)
+    git(path, "init", "-q", "-b", "main")
+    for i, date in enumerate(["1500000000 +0000", "1600000000 -0500"]):
+        with open(os.path.join(path, "main.py"), "w") as f:
+            f.write("print({})\n".format(i))
+        git(path, "add", "main.py")
+        git(path, "commit", "-q", "-m", "Commit {}".format(i), date=date)
+    return path
+
+
+def make_tarball(source, name="jtd111.tar.gz"):
+    tar_path = os.path.join(os.path.dirname(source), name)
+    with tarfile.open(tar_path, "w:gz") as tar:
+        tar.add(source, os.path.basename(source))
+    return tar_path
+
+
+def test_loose_objects(repo):
+    """Test reading a commit stored as a loose object
+    """
+    assert read_latest_commit(make_tarball(repo)) == 1600000000
+
+
+def test_packed_objects(repo):
+    """Test reading a commit out of a pack file, with packed refs
+    """
+    git(repo, "gc", "-q", "--aggressive")
+    objects = os.path.join(repo, ".git", "objects")
+    assert os.listdir(os.path.join(objects, "pack"))
+    assert not os.path.exists(os.path.join(repo, ".git", "refs", "heads",
+                                           "main"))
+
+    assert read_latest_commit(make_tarball(repo)) == 1600000000
+
+
+def test_head_is_followed(repo):
+    """Test that HEAD decides which commit is read
+    """
+    git(repo, "checkout", "-q", "-b", "aaa", "HEAD~1")
+    assert read_latest_commit(make_tarball(repo)) == 1500000000
+
+    git(repo, "checkout", "-q", "--detach", "main")
+    assert read_latest_commit(make_tarball(repo)) == 1600000000
+
+
+def test_bare_repo(repo, clean_dir):
+    """Test reading a bare repository
+    """
+    bare = os.path.join(clean_dir, "bare", "jtd111")
+    subprocess.check_call(["git", "clone", "-q", "--bare", repo, bare])
+    assert read_latest_commit(make_tarball(bare)) == 1600000000
+
+
+def test_not_a_repo(clean_dir):
+    """Test tarballs that don't contain a single repository
+    """
+    folder = os.path.join(clean_dir, "jtd111")
+    os.mkdir(folder)
+    with open(os.path.join(folder, "main.py"), "w") as f:
+        f.write("")
+    assert read_latest_commit(make_tarball(folder)) is None
+
+    empty = os.path.join(clean_dir, "empty")
+    os.mkdir(empty)
+    git(empty, "init", "-q")
+    assert read_latest_commit(make_tarball(empty, "empty.tar.gz")) is None
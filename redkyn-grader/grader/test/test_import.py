@@ -1,10 +1,15 @@
+import hashlib
 import os
 import pytest
+import shutil
 import tarfile
 import tempfile
+import time
 import yaml
 
-from grader.models.submission import SubmissionImportError
+from grader.commands.grade import skip_duplicates
+from grader.models import Grader, Submission
+from grader.models.submission import SubmissionError, SubmissionImportError
 
 
 def init_and_build_roster(p_and_r):
@@ -220,3 +225,280 @@ def test_import_tarball_name_mismatch(clean_dir, parse_and_run):
         parse_and_run(["import", "--kind=single",  "a1", student_tarball])
 
     assert "Inner folder" in str(err)
+
+
+def test_import_indexes_submission(clean_dir, parse_and_run, monkeypatch):
+    """Test that imported submissions are indexed, and that their
+    metadata is read from the index rather than the archive
+    """
+    student_tarball = make_student_tarball(clean_dir, "jtd111")
+
+    path = init_and_build_roster(parse_and_run)
+    parse_and_run(["new", "a1"])
+    parse_and_run(["import", "--kind=single",  "a1", student_tarball])
+
+    a = Grader(path).get_assignment("a1")
+    record, = a.index.records().values()
+    assert record['user_id'] == "jtd111"
+    assert set(record['data']) == {'file_mtimes', 'sha1sum', 'latest_commit'}
+
+    # Listing submissions shouldn't need to open any archives
+    def nope(*args, **kwargs):
+        raise AssertionError("Opened an archive")
+    monkeypatch.setattr(tarfile, "open", nope)
+    monkeypatch.setattr(tarfile, "is_tarfile", nope)
+
+    submission, = a.submissions
+    with open(submission.path, 'rb') as f:
+        assert submission.sha1sum == hashlib.sha1(f.read()).hexdigest()
+    assert sorted(submission.file_mtimes) == ["jtd111", "jtd111/main.py"]
+    assert submission.latest_commit is None
+
+
+def test_corrupt_archive(clean_dir, parse_and_run):
+    """Test that a truncated archive's commits can't be read
+    """
+    student_tarball = make_student_tarball(clean_dir, "jtd111")
+
+    path = init_and_build_roster(parse_and_run)
+    parse_and_run(["new", "a1"])
+    parse_and_run(["import", "--kind=single",  "a1", student_tarball])
+
+    submission, = Grader(path).get_assignment("a1").submissions
+    with open(submission.path, 'rb') as f:
+        data = f.read()
+    os.remove(submission.path)
+    with open(submission.path, 'wb') as f:
+        f.write(data[:len(data) // 2])
+
+    with pytest.raises(SubmissionError):
+        submission._read_latest_commit()
+
+
+def test_index_rebuilt(clean_dir, parse_and_run):
+    """Test that submissions missing from the index are indexed, and
+    that removed submissions are forgotten
+    """
+    student_tarball = make_student_tarball(clean_dir, "jtd111")
+
+    path = init_and_build_roster(parse_and_run)
+    parse_and_run(["new", "a1"])
+    parse_and_run(["import", "--kind=single",  "a1", student_tarball])
+
+    a = Grader(path).get_assignment("a1")
+    os.remove(a.index.path)
+
+    submission, = a.submissions
+    assert list(a.index.records()) == [submission.full_id]
+    # Reading the SHA1 records it in the index
+    sha1sum = submission.sha1sum
+    assert sha1sum == a.index.get(submission.full_id)['data']['sha1sum']
+
+    os.remove(submission.path)
+    assert a.submissions == []
+    assert a.index.records() == {}
+
+
+def test_import_time_kept(clean_dir, parse_and_run):
+    """Test that an imported tarball's import time survives the index
+    being deleted, and that the stored archive isn't linked to the
+    original
+    """
+    student_tarball = make_student_tarball(clean_dir, "jtd111")
+    os.utime(student_tarball, (1500000000, 1500000000))
+
+    path = init_and_build_roster(parse_and_run)
+    parse_and_run(["new", "a1"])
+    parse_and_run(["import", "--kind=single",  "a1", student_tarball])
+
+    a = Grader(path).get_assignment("a1")
+    submission, = a.submissions
+    imported = submission.import_time
+    assert imported.timestamp() > 1500000000
+    assert not os.path.samefile(student_tarball, submission.path)
+
+    os.remove(a.index.path)
+    a = Grader(path).get_assignment("a1")
+    submission, = a.submissions
+    assert submission.import_time == imported
+
+
+def test_import_deduplicates(clean_dir, parse_and_run):
+    """Test that importing the same submission twice only stores its
+    archive once, and that duplicates can be skipped when grading
+    """
+    student_dir = make_student_folder(clean_dir, "jtd111")
+
+    path = init_and_build_roster(parse_and_run)
+    parse_and_run(["new", "a1"])
+    parse_and_run(["import", "--kind=single",  "a1", student_dir])
+    parse_and_run(["import", "--kind=single",  "a1", student_dir])
+
+    a = Grader(path).get_assignment("a1")
+    first, second = a.submissions_by_user["jtd111"]
+    assert first.sha1sum == second.sha1sum
+    assert os.path.isfile(a.blobs.path_for(first.sha1sum))
+    blobs = [f for _, _, files in os.walk(a.blobs.path) for f in files]
+    assert blobs == [first.sha1sum + ".tar.gz"]
+
+    assert skip_duplicates([first, second]) == [first]
+
+    first._record_output("all good")
+    a = Grader(path).get_assignment("a1")
+    submissions = a.submissions_by_user["jtd111"]
+    graded = {s.full_id: s.graded for s in submissions}
+    assert graded == {first.full_id: True, second.full_id: False}
+    assert skip_duplicates(submissions) == []
+
+
+def test_result_cache(clean_dir, parse_and_run):
+    """Test that grading results are reused until the submission, image
+    or gradesheet changes
+    """
+    student_dir = make_student_folder(clean_dir, "jtd111")
+
+    path = init_and_build_roster(parse_and_run)
+    parse_and_run(["new", "a1"])
+    parse_and_run(["import", "--kind=single",  "a1", student_dir])
+
+    a = Grader(path).get_assignment("a1")
+    submission, = a.submissions
+    key = submission._result_key("image1")
+    assert key == ("jtd111", submission.sha1sum, "image1",
+                   a.gradesheet.commit)
+    assert submission._cached_result(key, show_output=False) is None
+
+    path = submission._record_output("all good", key)
+    assert submission._cached_result(key, show_output=False) == path
+    assert submission._cached_result(submission._result_key("image2"),
+                                     show_output=False) is None
+
+    # Once something else is graded, a cached result is recorded again
+    # so that it's the latest
+    other = submission._record_output("other", ("jtd111", "0" * 40,
+                                                "image1", key[3]))
+    assert submission.latest_result == other
+    again = submission._cached_result(key, show_output=False)
+    assert again not in (path, other)
+    assert submission.latest_result == again
+    with open(again) as f:
+        assert f.read() == "all good"
+    assert submission._cached_result(key, show_output=False) == again
+    path = again
+
+    # Uncommitted gradesheet changes count as a different gradesheet
+    with open(os.path.join(a.gradesheet_dir, "Dockerfile"), "a") as f:
+        f.write("# changed\n")
+    assert a.gradesheet.commit == key[3] + "-dirty"
+    assert submission._result_key("image1") != key
+
+    # Results that have been deleted aren't reused
+    os.remove(submission.latest_result)
+    assert submission._cached_result(key, show_output=False) is None
+
+
+def test_result_cache_per_student(clean_dir, parse_and_run):
+    """Test that students who hand in identical archives each get their
+    own cached result
+    """
+    student_dir = make_student_folder(clean_dir, "jtd111")
+
+    path = init_and_build_roster(parse_and_run)
+    parse_and_run(["new", "a1"])
+    parse_and_run(["import", "--kind=single",  "a1", student_dir])
+
+    a = Grader(path).get_assignment("a1")
+    jake, = a.submissions
+    copy_name = jake.full_id.replace("jtd111", "fmm000", 1) + ".tar.gz"
+    shutil.copy(jake.path, os.path.join(a.submissions_dir, copy_name))
+    a.invalidate_submissions()
+    finn = a.submissions_by_user["fmm000"][0]
+    assert finn.sha1sum == jake.sha1sum
+
+    commit = a.gradesheet.commit
+    jake_path = jake._record_output("jake's", jake._result_key("1", commit))
+    finn_path = finn._record_output("finn's", finn._result_key("1", commit))
+    assert jake._cached_result(jake._result_key("1"), False) == jake_path
+    assert finn._cached_result(finn._result_key("1"), False) == finn_path
+
+
+def test_submissions_memoized(clean_dir, parse_and_run):
+    """Test that submissions are only loaded again when the submissions
+    directory changes
+    """
+    def age(path):
+        then = time.time() - 60
+        os.utime(path, (then, then))
+
+    path = init_and_build_roster(parse_and_run)
+    parse_and_run(["new", "a1"])
+    a = Grader(path).get_assignment("a1")
+    Submission.import_single(a, make_student_folder(clean_dir, "jtd111"))
+    age(a.submissions_dir)
+
+    first, = a.submissions_by_user["jtd111"]
+    assert a.submissions_by_user["jtd111"][0] is first
+    assert a.submissions[0] is first
+
+    # Imports let the assignment know
+    Submission.import_single(a, make_student_tarball(clean_dir, "fmm000"))
+    age(a.submissions_dir)
+    assert sorted(a.submissions_by_user) == ["fmm000", "jtd111"]
+    assert a.submissions_by_user["jtd111"][0] is not first
+
+    # ... and other changes show up in the directory's mtime
+    os.remove(a.submissions_by_user["fmm000"][0].path)
+    assert sorted(a.submissions_by_user) == ["jtd111"]
+
+
+def test_import_multiple(clean_dir, parse_and_run):
+    """Test importing a folder of folders and tarballs
+    """
+    source = os.path.join(clean_dir, "source")
+    os.mkdir(source)
+    make_student_tarball(source, "jtd111")
+    make_student_folder(source, "fmm000")
+    make_student_folder(source, "nope")
+
+    path = init_and_build_roster(parse_and_run)
+    parse_and_run(["new", "a1"])
+    parse_and_run(["import", "--kind=multiple",  "a1", source])
+
+    a = Grader(path).get_assignment("a1")
+    assert sorted(a.submissions_by_user) == ["fmm000", "jtd111"]
+
+
+def test_import_multiple_parallel(clean_dir, parse_and_run):
+    """Test importing a folder of submissions with a pool of processes
+    """
+    source = os.path.join(clean_dir, "source")
+    os.mkdir(source)
+    make_student_tarball(source, "jtd111")
+    make_student_folder(source, "fmm000")
+    make_student_folder(source, "nope")
+
+    path = init_and_build_roster(parse_and_run)
+    parse_and_run(["new", "a1"])
+    parse_and_run(["import", "--kind=multiple", "--jobs=3", "a1", source])
+
+    a = Grader(path).get_assignment("a1")
+    assert sorted(a.submissions_by_user) == ["fmm000", "jtd111"]
+    assert len(a.index.records()) == 2
+
+
+def test_import_multiple_not_a_tarball(clean_dir, parse_and_run):
+    """Test that nothing is imported if an item isn't importable
+    """
+    source = os.path.join(clean_dir, "source")
+    os.mkdir(source)
+    make_student_tarball(source, "jtd111")
+    with open(os.path.join(source, "fmm000.txt"), "w") as f:
+        f.write("nope")
+
+    path = init_and_build_roster(parse_and_run)
+    parse_and_run(["new", "a1"])
+    with pytest.raises(SubmissionError) as err:
+        parse_and_run(["import", "--kind=multiple", "--jobs=2", "a1", source])
+    assert "neither a directory nor a tarball" in str(err)
+
+    assert Grader(path).get_assignment("a1").submissions == []
@@ -0,0 +1,52 @@
+import pytest
+
+from fakeclass import load_assignment
+
+
+@pytest.fixture
+def built(clean_dir, built_class):
+    _, client = built_class
+    client.calls.clear()
+    return clean_dir, client
+
+
+def test_containers_listed_once(built):
+    """Test that submission containers are found with a single call to
+    docker, however many submissions are graded
+    """
+    path, client = built
+    a = load_assignment(path)
+    for s in a.submissions:
+        s.grade(a, show_output=False, force=True)
+    assert client.calls.count("containers") == 1
+    assert client.calls.count("inspect_container") == 0
+    created = client.calls.count("create_container")
+    assert created == len(a.submissions)
+    # The fake client checks the image when creating a container
+    assert client.calls.count("inspect_image") == 1 + created
+
+    # Containers are found again in a new command
+    a = load_assignment(path)
+    for s in a.submissions:
+        s.grade(a, show_output=False, force=True)
+        assert a.containers.created(s.uuid) is not None
+    assert client.calls.count("containers") == 2
+    assert client.calls.count("create_container") == created
+
+
+def test_containers_by_assignment(built):
+    """Test that containers belonging to other assignments are ignored,
+    but ones made before containers were labelled by assignment aren't
+    """
+    path, client = built
+    a = load_assignment(path)
+    first, second = a.submissions[:2]
+    client.create_container(a.image_tag, labels={
+        'submission_uuid': first.uuid,
+    })
+    client.create_container(a.image_tag, labels={
+        'submission_uuid': second.uuid, 'assignment': "some-other-image",
+    })
+
+    assert len(a.containers.containers(first.uuid)) == 1
+    assert a.containers.containers(second.uuid) == []
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from grader.utils.jobs import run_async_jobs, run_jobs, summarize_jobs
+
+
+def test_run_jobs_keeps_order():
+    """Test that results come back in submission order
+    """
+    def job(n):
+        # Later jobs finish first
+        time.sleep(0.01 * (5 - n))
+        return n
+
+    jobs = [(str(n), lambda n=n: job(n)) for n in range(5)]
+    results = list(run_jobs(jobs, workers=5))
+
+    assert [r.name for r in results] == ["0", "1", "2", "3", "4"]
+    assert [r.value for r in results] == [0, 1, 2, 3, 4]
+    assert all(r.ok for r in results)
+
+
+def test_run_jobs_is_bounded():
+    """Test that no more than ``workers`` jobs run at once
+    """
+    lock = threading.Lock()
+    running, peak = [0], [0]
+
+    def job():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+
+    list(run_jobs([(str(n), job) for n in range(12)], workers=3))
+    assert peak[0] <= 3
+
+
+def test_run_jobs_failure():
+    """Test that a failed job doesn't stop the others
+    """
+    def boom():
+        raise RuntimeError("boom")
+
+    jobs = [("a", lambda: 1), ("b", boom), ("c", lambda: 3)]
+    for workers in (1, 2):
+        results = list(run_jobs(jobs, workers=workers))
+        assert [r.ok for r in results] == [True, False, True]
+        assert isinstance(results[1].error, RuntimeError)
+        assert "2 of 3 jobs" in summarize_jobs(results, 1.0)
+
+
+def test_run_jobs_bad_workers():
+    """Test that at least one worker is required
+    """
+    with pytest.raises(ValueError):
+        list(run_jobs([("a", lambda: 1)], workers=0))
+
+
+def test_run_async_jobs():
+    """Test coroutine jobs: ordered, bounded, and failures kept apart
+    """
+    running, peak = [0], [0]
+
+    async def job(n):
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        await asyncio.sleep(0.01 * (5 - n))
+        running[0] -= 1
+        if n == 2:
+            raise RuntimeError("boom")
+        return n
+
+    jobs = [(str(n), lambda n=n: job(n)) for n in range(5)]
+    results = list(run_async_jobs(jobs, workers=2))
+
+    assert [r.value for r in results] == [0, 1, None, 3, 4]
+    assert [r.ok for r in results] == [True, True, False, True, True]
+    assert peak[0] == 2
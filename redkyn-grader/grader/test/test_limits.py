@@ -0,0 +1,101 @@
+import threading
+
+import pytest
+
+from grader.models import (
+    AssignmentConfig, ConfigValidationError, ContainerPool
+)
+
+
+def test_grade_timeout(built_class):
+    """Test that grade-it is killed when it runs too long, that the
+    result says so, and that it isn't reused next time
+    """
+    a, client = built_class
+    a.gradesheet.config.data['grade-timeout'] = 0.2
+    client.hang = True
+
+    s = a.submissions[0]
+    with open(s.grade(a, show_output=False)) as f:
+        output = f.read()
+    assert "score: 10" in output
+    assert "killed: it ran for more than 0.2 seconds" in output
+    container, = client.containers_by_id.values()
+    assert not container['Running']
+
+    client.hang = False
+    with open(s.grade(a, show_output=False)) as f:
+        assert "killed" not in f.read()
+    assert len(a.results.files(s.user_id)) == 3
+
+
+def test_grade_timeout_after_output(built_class, monkeypatch):
+    """Test that a watchdog that goes off once grade-it's output has
+    ended doesn't kill it
+    """
+    a, client = built_class
+    a.gradesheet.config.data['grade-timeout'] = 0.2
+
+    class LateTimer(object):
+        """Goes off just as it's cancelled"""
+        def __init__(self, interval, function, args):
+            self.function = function
+            self.args = args
+
+        def start(self):
+            pass
+
+        def cancel(self):
+            self.function(*self.args)
+
+    monkeypatch.setattr(threading, "Timer", LateTimer)
+    s = a.submissions[0]
+    path = s.grade(a, show_output=False)
+    with open(path) as f:
+        assert "killed" not in f.read()
+    # ... so its result is reused
+    assert s.grade(a, show_output=False) == path
+
+
+def test_grade_output_limit(built_class):
+    """Test that grade-it is killed when it prints too much"""
+    a, client = built_class
+    a.gradesheet.config.data['grade-output-limit'] = 1000
+    client.grade_output = [b"x" * 99 + b"\n"] * 50
+
+    s = a.submissions[0]
+    with open(s.grade(a, show_output=False)) as f:
+        output = f.read()
+    assert "killed: it printed more than 1000 bytes" in output
+    assert output.count("x") == 99 * 10
+
+
+def test_timeout_in_pool(built_class):
+    """Test that a pooled container that was killed is replaced"""
+    a, client = built_class
+    a.gradesheet.config.data['grade-timeout'] = 0.2
+    client.hang = True
+
+    pool = ContainerPool(a, 1)
+    first, second = a.submissions[:2]
+    first.grade(a, show_output=False, pool=pool)
+    # The killed container was replaced straight away
+    replacement, = client.containers_by_id.values()
+    assert replacement['Running']
+    assert client.calls.count("create_container") == 2
+
+    client.hang = False
+    with open(second.grade(a, show_output=False, pool=pool)) as f:
+        assert "killed" not in f.read()
+    assert client.calls.count("create_container") == 2
+    pool.close()
+    assert client.containers_by_id == {}
+
+
+def test_grade_timeout_must_be_positive():
+    """Test that a grade-timeout of 0 is rejected"""
+    with pytest.raises(ConfigValidationError):
+        AssignmentConfig._validate({'assignment-name': "a1",
+                                    'grade-timeout': 0})
+    AssignmentConfig._validate({'assignment-name': "a1",
+                                'grade-timeout': 0.5})
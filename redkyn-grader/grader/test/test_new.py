@@ -2,7 +2,8 @@ import os
 import pytest
 import yaml
 
-from grader.models.gradesheet import GradeSheetError
+from grader.models import AssignmentNotFoundError, Grader
+from grader.models.gradesheet import GradeSheet, GradeSheetError
 from grader.models.config import ConfigValidationError
 
 
@@ -110,3 +111,34 @@ def test_new_without_init(parse_and_run):
 
     a_path = os.path.join(path, "assignments", "assignment1")
     assert not os.path.exists(a_path)
+
+
+def test_assignments_loaded_lazily(parse_and_run, monkeypatch):
+    """Test that listing assignments doesn't load them, and that looking
+    one up only loads that one
+    """
+    path = parse_and_run(["init", "cpl"])
+    parse_and_run(["new", "a1"])
+    parse_and_run(["new", "a2"])
+
+    loaded = []
+    real_init = GradeSheet.__init__
+
+    def spy(self, assignment):
+        loaded.append(assignment.name)
+        real_init(self, assignment)
+    monkeypatch.setattr(GradeSheet, "__init__", spy)
+
+    g = Grader(path)
+    assert g.assignment_names == ["a1", "a2"]
+    assert "a2" in g.assignments and "nope" not in g.assignments
+    assert loaded == []
+
+    a = g.get_assignment("a2")
+    assert g.get_assignment("a2") is a
+    a.gradesheet
+    a.gradesheet
+    assert loaded == ["a2"]
+
+    with pytest.raises(AssignmentNotFoundError):
+        g.get_assignment("nope")
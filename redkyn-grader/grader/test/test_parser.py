@@ -0,0 +1,45 @@
+import subprocess
+import sys
+
+from grader import make_parser, subcommands
+
+
+def imported_after(code):
+    """Runs some code in a fresh interpreter, and returns which grader
+    modules it imported.
+    """
+    script = "import sys, grader\n{}\nprint(' '.join(sys.modules))".format(
+        code
+    )
+    output = subprocess.check_output([sys.executable, "-c", script])
+    return {m for m in output.decode().split() if m.startswith("grader.")}
+
+
+def test_help_imports_nothing():
+    """Test that building the parser and showing help doesn't import any
+    subcommands
+    """
+    modules = imported_after("grader.make_parser().format_help()")
+    assert modules == set()
+
+
+def test_subcommand_imported_when_used():
+    """Test that only the chosen subcommand's module is imported
+    """
+    modules = imported_after(
+        "grader.make_parser().parse_args(['cat', 'a1', 'jtd111'])"
+    )
+    assert "grader.commands.cat" in modules
+    assert "grader.commands.grade" not in modules
+
+
+def test_subcommands_listed():
+    """Test that every subcommand shows up in the help screen
+    """
+    help_text = make_parser().format_help()
+    for name in subcommands:
+        assert name in help_text
+
+    args = make_parser().parse_args(["grade", "--jobs", "2", "a1"])
+    assert args.jobs == 2
+    assert args.run.__module__ == "grader.commands.grade"
@@ -0,0 +1,122 @@
+import threading
+import time
+
+import pytest
+
+from fakeclass import ASSIGNMENT, load_assignment
+from grader import make_parser
+from grader.models import ContainerPool
+
+
+def test_pool_reuses_containers(built_class):
+    """Test that submissions are graded one after another in the same
+    pooled container, which is cleaned up in between
+    """
+    a, client = built_class
+    pool = ContainerPool(a, 1)
+    pool.warm()
+    container_id, = client.containers_by_id
+
+    outputs = []
+    for s in a.submissions:
+        with open(s.grade(a, show_output=False, pool=pool)) as f:
+            outputs.append(f.read())
+    assert all("score: 10" in output for output in outputs)
+    assert set(client.containers_by_id) == {container_id}
+    assert client.calls.count("create_container") == 1
+
+    # Each submission's scratch directory was removed afterwards
+    cleanups = [cmd for cmd in client.execs.values()
+                if cmd[:2] == ["rm", "-rf"]]
+    assert len(cleanups) == len(outputs)
+
+    pool.close()
+    assert client.containers_by_id == {}
+
+
+def test_pool_discards_broken_containers(built_class):
+    """Test that a container is thrown away if grading fails in it
+    """
+    a, client = built_class
+    pool = ContainerPool(a, 1)
+    with pytest.raises(RuntimeError):
+        with pool.checkout():
+            raise RuntimeError("grading blew up")
+    assert client.containers_by_id == {}
+
+    with pool.checkout() as container:
+        assert container.id in client.containers_by_id
+    pool.close()
+
+
+def test_discard_wakes_waiters(built_class):
+    """Test that a thread waiting for a container gets one when the
+    container it was waiting on is discarded
+    """
+    a, client = built_class
+    pool = ContainerPool(a, 1)
+    checked_out = threading.Event()
+    got = []
+
+    def wait_for_container():
+        checked_out.wait()
+        with pool.checkout() as container:
+            got.append(container.id)
+
+    waiter = threading.Thread(target=wait_for_container)
+    waiter.start()
+    with pytest.raises(RuntimeError):
+        with pool.checkout() as broken:
+            checked_out.set()
+            time.sleep(0.1)
+            raise RuntimeError("grading blew up")
+    waiter.join(5)
+
+    assert not waiter.is_alive()
+    assert got and got[0] != broken.id
+    pool.close()
+    assert client.containers_by_id == {}
+
+
+def test_pool_with_rebuild(built_class):
+    """Test that --rebuild can't be combined with a pool
+    """
+    a, client = built_class
+    args = make_parser().parse_args([
+        "--path", a.grader.path, "grade", "--pool", "1", "--rebuild",
+        "--suppress_output", ASSIGNMENT
+    ])
+    args.run(args)
+    assert client.calls.count("create_container") == 0
+
+
+def test_grade_with_pool(built_class):
+    """Test grading with --pool
+    """
+    a, client = built_class
+    args = make_parser().parse_args([
+        "--path", a.grader.path, "grade", "--pool", "2", "--suppress_output",
+        ASSIGNMENT
+    ])
+    args.run(args)
+    assert client.calls.count("create_container") == 2
+    assert client.containers_by_id == {}
+    assert all(s.graded for s in load_assignment(a.grader.path).submissions)
+
+
+def test_grade_takes_one_exec(built_class):
+    """Test that unpacking and grading a submission takes a single exec,
+    unless the assignment asks for the old way
+    """
+    a, client = built_class
+    s = a.submissions[0]
+    client.calls.clear()
+    s.grade(a, show_output=False, force=True)
+    assert client.calls.count("exec_create") == 1
+    (path, _), = client.containers_by_id[s.get_container_id(False)]['Files']
+    assert path == s.UNPACK_DIR
+
+    a.gradesheet.config.data['legacy-unpack'] = True
+    client.calls.clear()
+    s.grade(a, show_output=False, force=True)
+    assert client.calls.count("exec_create") == 3
@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+from fakeclass import load_assignment
+from grader import make_parser
+from grader.models import Grader
+from grader.utils.files import hash_build_context
+
+
+@pytest.fixture
+def class_size():
+    return 2
+
+
+def build(path, *args):
+    args = make_parser().parse_args(["--path", path, "build"] + list(args))
+    args.run(args)
+
+
+def test_unchanged_image_not_rebuilt(clean_dir, built_class):
+    """Test that an image is only built again when its gradesheet or
+    build options change, or when it's forced to be
+    """
+    _, client = built_class
+    path = clean_dir
+    a = load_assignment(path)
+    image_id = a.image_id
+
+    assert a.build_image(silent=True) == image_id
+    assert client.calls.count("build") == 1
+
+    build(path, "--force", "--silent", a.name)
+    assert client.calls.count("build") == 2
+
+    with open(a.gradesheet.dockerfile_path, 'a') as f:
+        f.write("\nRUN true\n")
+    build(path, "--all", "--silent")
+    assert client.calls.count("build") == 3
+    build(path, "--all", "--silent")
+    assert client.calls.count("build") == 3
+
+    a.gradesheet.config.data['image-build-options'] = {'rm': True}
+    assert a.build_image(silent=True) != image_id
+    assert client.calls.count("build") == 4
+
+
+def test_build_all_keeps_going(clean_dir, built_class):
+    """Test that an assignment that can't be loaded or built doesn't stop
+    the rest from being built, but does make the command fail
+    """
+    _, client = built_class
+    g = Grader(clean_dir)
+    g.create_assignment("a0")
+    os.remove(g.get_assignment("a0").gradesheet.dockerfile_path)
+    a = load_assignment(clean_dir)
+    with open(a.gradesheet.dockerfile_path, 'a') as f:
+        f.write("\nRUN true\n")
+
+    with pytest.raises(SystemExit) as exit:
+        build(clean_dir, "--all", "--silent")
+    assert exit.value.code == 1
+    assert client.calls.count("build") == 2
+
+
+def test_hash_build_context(tmpdir):
+    """Test that ignored files and .git don't affect the hash, but
+    everything else does
+    """
+    path = str(tmpdir)
+    with open(os.path.join(path, "Dockerfile"), 'w') as f:
+        f.write("FROM busybox\n")
+    with open(os.path.join(path, ".dockerignore"), 'w') as f:
+        f.write("# Scratch files\n*.tmp\n")
+    os.mkdir(os.path.join(path, ".git"))
+    original = hash_build_context(path)
+
+    for name in ("notes.tmp", os.path.join(".git", "HEAD")):
+        with open(os.path.join(path, name), 'w') as f:
+            f.write("whatever")
+    assert hash_build_context(path) == original
+    assert hash_build_context(path, {'rm': True}) != original
+
+    os.chmod(os.path.join(path, "Dockerfile"), 0o755)
+    assert hash_build_context(path) != original
@@ -0,0 +1,167 @@
+import itertools
+import os
+import time
+
+from grader.commands import grade
+from grader.models import ResultsIndex
+
+from fakeclass import load_assignment, make_class, make_submission, \
+    student_id
+from fakedocker import FakeAsyncDockerClient, FakeDockerClient
+
+
+def write_result(results_dir, name, content="", mtime=None):
+    path = os.path.join(results_dir, name)
+    with open(path, "w") as f:
+        f.write(content)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_results_index(clean_dir):
+    """Test that results are grouped by student, oldest first
+    """
+    now = time.time()
+    write_result(clean_dir, "jtd111.02.yml", "b", mtime=now)
+    write_result(clean_dir, "jtd111.01.log", "a", mtime=now - 60)
+    write_result(clean_dir, "fmm000.01.yml", "ccc", mtime=now - 30)
+    write_result(clean_dir, ".jtd111.03.partial")
+    os.mkdir(os.path.join(clean_dir, "jtd111.d"))
+
+    results = ResultsIndex(clean_dir)
+    jtd = results.files("jtd111")
+    assert [os.path.basename(r.path) for r in jtd] == [
+        "jtd111.01.log", "jtd111.02.yml"
+    ]
+    assert results.latest("fmm000").size == 3
+    assert results.latest("nobody") is None
+    assert results.files("nobody") == []
+
+
+def test_results_index_add(clean_dir):
+    """Test that new results are added without reading the directory
+    again
+    """
+    write_result(clean_dir, "jtd111.01.log", mtime=time.time() - 60)
+    results = ResultsIndex(clean_dir)
+    assert len(results.files("jtd111")) == 1
+
+    # Written behind the index's back, so it isn't noticed...
+    write_result(clean_dir, "fmm000.01.log")
+    assert results.files("fmm000") == []
+
+    # ... unlike results that are added
+    path = write_result(clean_dir, "jtd111.02.log")
+    results.add(path)
+    assert results.latest("jtd111").path == path
+
+    results.refresh()
+    assert len(results.files("fmm000")) == 1
+
+
+def test_grade_streams_to_result_file(built_class):
+    """Test that grading output is streamed into a result file, and that
+    nothing is left behind if grading fails part way through
+    """
+    a, client = built_class
+    s = a.submissions[0]
+
+    path = s.grade(a, show_output=False)
+    assert os.path.dirname(path) == a.results_dir
+    assert os.path.basename(path).startswith(s.user_id + ".")
+    with open(path) as f:
+        assert "score: 10" in f.read()
+    assert a.results.latest(s.user_id).path == path
+
+    exec_start = client.exec_start
+
+    def broken(exec_id, stream=False, **kwargs):
+        if not stream:
+            return exec_start(exec_id, stream=stream, **kwargs)
+
+        def lines():
+            yield b"score: 5\n"
+            raise ConnectionError("lost the daemon")
+        return lines()
+
+    client.exec_start = broken
+    try:
+        s.grade(a, show_output=False, force=True)
+    except ConnectionError:
+        pass
+    assert not [n for n in os.listdir(a.results_dir) if n.startswith(".")]
+    assert a.results.latest(s.user_id).path == path
+
+
+def test_grade_jobs_keep_submission_order(parse_and_run, docker_client):
+    """Test that a student's newest submission has their latest result,
+    even when its older submissions take longer to grade
+    """
+    root = os.getcwd()
+    make_class(root, 1)
+    a = load_assignment(root)
+    for _ in range(2):
+        make_submission(a.submissions_dir, student_id(0))
+    a.build_image(silent=True)
+
+    # Imported a few seconds apart
+    now = time.time()
+    paths = sorted(os.path.join(a.submissions_dir, n)
+                   for n in os.listdir(a.submissions_dir))
+    for age, path in zip((30, 20, 10), paths):
+        os.utime(path, (now - age, now - age))
+
+    calls = itertools.count(1)
+    exec_start = docker_client.exec_start
+
+    def numbered(exec_id, stream=False, **kwargs):
+        if not docker_client.execs[exec_id['Id']].startswith("grade-it"):
+            return exec_start(exec_id, stream=stream, **kwargs)
+        n = next(calls)
+        if n == 1:
+            # The first submission graded is the slowest
+            time.sleep(0.2)
+        return iter(["score: {}\n".format(n).encode()])
+
+    docker_client.exec_start = numbered
+    parse_and_run(["grade", "--jobs", "3", "--force", a.name])
+
+    a = load_assignment(root)
+    newest = a.submissions_by_user[student_id(0)][-1]
+    assert newest.full_id in paths[-1]
+    latest = newest.latest_result
+    assert os.path.basename(latest) == newest.record['data']['result_file']
+    with open(latest) as f:
+        assert f.read().strip() == "score: 3"
+
+
+def test_grade_async(parse_and_run, docker_client, monkeypatch):
+    """Test grading from an event loop, looking containers and the image
+    up once and never through docker-py, which would block the loop
+    """
+    root = os.getcwd()
+    make_class(root, 4)
+    a = load_assignment(root)
+    a.build_image(silent=True)
+
+    async_client = FakeAsyncDockerClient(
+        FakeDockerClient(images=docker_client.images)
+    )
+    monkeypatch.setattr(grade, "AsyncDockerClient",
+                        lambda base_url: async_client)
+    del docker_client.calls[:]
+    parse_and_run(["grade", "--async", "--jobs", "2", a.name])
+
+    assert docker_client.calls == []
+    calls = async_client.sync.calls
+    assert calls.count("containers") == 1
+    # Creating a (fake) container looks its image up too
+    assert calls.count("inspect_image") == 1 + calls.count("create_container")
+    assert calls.count("create_container") == 4
+
+    a = load_assignment(root)
+    for user_id, submissions in a.submissions_by_user.items():
+        assert len(a.results.files(user_id)) == 1 + len(submissions)
+        with open(submissions[-1].latest_result) as f:
+            assert "score: 10" in f.read()
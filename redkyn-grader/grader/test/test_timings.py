@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+from fakeclass import make_class, load_assignment
+from grader import make_parser
+from grader.utils import timings
+
+
+@pytest.fixture
+def timed(clean_dir):
+    jsonl = os.path.join(clean_dir, "timings.jsonl")
+    textfile = os.path.join(clean_dir, "grader.prom")
+    timings.start(jsonl, textfile)
+    try:
+        yield clean_dir, jsonl, textfile
+    finally:
+        timings.stop()
+
+
+def test_grading_phases_recorded(timed, docker_client, capsys):
+    """Test that each phase of building and grading is recorded, and
+    summarized by ``grader timings``
+    """
+    path, jsonl, textfile = timed
+    make_class(path, 4)
+    a = load_assignment(path)
+    a.build_image(silent=True)
+    for s in a.submissions:
+        s.grade(a, show_output=False, force=True)
+    timings.stop()
+
+    records = list(timings.read_records(jsonl))
+    phases = {r['phase'] for r in records}
+    assert phases == {"build", "lookup", "create", "start", "put_archive",
+                      "grade-it", "record", "stop"}
+    graded = [r for r in records if r['phase'] == "grade-it"]
+    assert len(graded) == len(a.submissions)
+    assert {r['submission'] for r in graded} == \
+        {s.full_id for s in a.submissions}
+
+    with open(textfile) as f:
+        prom = f.read()
+    assert 'grader_phase_seconds_count{{phase="grade-it"}} {}'.format(
+        len(a.submissions)) in prom
+
+    args = make_parser().parse_args(["timings", jsonl])
+    args.run(args)
+    out = capsys.readouterr().out
+    assert out.splitlines()[0].split() == [
+        "phase", "count", "total", "p50", "p90", "p99", "max"
+    ]
+    assert "grade-it" in out
+
+
+def test_summarize():
+    """Test that percentiles are picked by nearest rank"""
+    records = [{'phase': "start", 'seconds': s} for s in range(1, 11)]
+    stats = timings.summarize(records)["start"]
+    assert stats['count'] == 10
+    assert stats['total'] == 55
+    assert (stats['p50'], stats['p90'], stats['p99']) == (5, 9, 10)
+    assert stats['max'] == 10
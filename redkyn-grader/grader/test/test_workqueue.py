@@ -0,0 +1,216 @@
+import argparse
+import os
+import shutil
+import threading
+import time
+import urllib.error
+import urllib.request
+import xmlrpc.client
+
+import pytest
+
+from fakeclass import make_class, load_assignment
+from grader.commands.grade import parse_address, serve
+from grader.commands.worker import JobGrader
+from grader.models import Grader
+from grader.utils import workqueue
+from grader.utils.workqueue import Coordinator, Job, WorkQueue, Worker
+
+
+class Clock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_work_queue_leases():
+    """Test that jobs whose leases run out are handed to someone else,
+    and given up on after too many attempts
+    """
+    clock = Clock()
+    queue = WorkQueue([Job("a", "a.tar.gz"), Job("b", "b.tar.gz")],
+                      lease_timeout=10, max_attempts=2, clock=clock)
+
+    first = queue.lease("w1")
+    assert first.name == "a"
+    token = first.token
+    clock.now = 5
+    assert queue.renew("a", token)
+
+    # w1 goes quiet, so "a" goes to w2
+    clock.now = 16
+    second = queue.lease("w2")
+    assert second.name == "a"
+    assert queue.take("a", token) is None
+    assert queue.take("a", second.token) is second
+    queue.succeeded(second, "done")
+
+    # "b" fails too many times
+    for worker in ("w1", "w2"):
+        job = queue.lease(worker)
+        assert job.name == "b"
+        queue.failed(queue.take("b", job.token), "broken")
+    assert queue.lease("w1") is None
+    assert queue.finished.is_set()
+
+    a, b = queue.results
+    assert a.ok and a.value == "done"
+    assert not b.ok and "broken; broken" in str(b.error)
+
+
+def test_distributed_grading(tmpdir, docker_client):
+    """Test grading with a coordinator and workers on one machine,
+    including a worker that disappears with a submission
+    """
+    coordinator_path = str(tmpdir.mkdir("coordinator"))
+    worker_path = str(tmpdir.join("worker"))
+
+    make_class(coordinator_path, 4)
+    # The same gradesheet, at the same commit
+    shutil.copytree(coordinator_path, worker_path)
+    a = load_assignment(coordinator_path)
+    submissions = {s.full_id: s for s in a.submissions}
+
+    jobs = [Job(s.full_id, s.path, {
+        'assignment': a.name, 'full_id': s.full_id, 'sha1': s.sha1sum,
+        'gradesheet': a.gradesheet.commit, 'force': False,
+        'rebuild': False,
+    }) for s in submissions.values()]
+    queue = WorkQueue(jobs, lease_timeout=0.5)
+
+    def record(job, output, details):
+        assert details == {'gradesheet': a.gradesheet.commit,
+                           'build_hash': a.build_hash()}
+        return submissions[job.name].record_output(output.decode())
+
+    coordinator = Coordinator(queue, record, "127.0.0.1", 0)
+    url = coordinator.url
+
+    # This worker leases a submission and is never heard from again
+    server = threading.Thread(target=coordinator.serve)
+    server.start()
+    lost = Worker(url, None, token=coordinator.token)._proxy().lease("lost")
+    assert lost['name'] in submissions
+
+    grade = JobGrader(Grader(worker_path))
+    workers = [threading.Thread(target=Worker(
+        url, grade, "w{}".format(i), poll_interval=0.1,
+        token=coordinator.token).run) for i in range(2)]
+    for worker in workers:
+        worker.start()
+    server.join(30)
+    for worker in workers:
+        worker.join(30)
+
+    results = queue.results
+    assert len(results) == len(submissions)
+    assert all(r.ok for r in results)
+    assert queue.jobs[lost['name']].attempts == 2
+    for full_id, submission in submissions.items():
+        assert os.path.exists(os.path.join(
+            worker_path, "assignments", a.name, "submissions",
+            full_id + ".tar.gz"))
+        with open(load_assignment(coordinator_path).results
+                  .latest(submission.user_id).path) as f:
+            assert "score: 10" in f.read()
+
+
+def test_coordinator_needs_token(tmpdir):
+    """Test that calls and downloads without the token are refused"""
+    path = tmpdir.join("a.tar.gz")
+    path.write("stuff")
+    queue = WorkQueue([Job("a", str(path))])
+    coordinator = Coordinator(queue, lambda job, output, details: None)
+    assert coordinator.server.server_address[0] == "127.0.0.1"
+    assert parse_address("8000") == ("127.0.0.1", 8000)
+
+    server = threading.Thread(target=coordinator.serve)
+    server.start()
+    try:
+        url = coordinator.url
+        with pytest.raises(xmlrpc.client.ProtocolError) as err:
+            xmlrpc.client.ServerProxy(url + "RPC2").lease("stranger")
+        assert err.value.errcode == 403
+        with pytest.raises(urllib.error.HTTPError) as err:
+            urllib.request.urlopen(url + "files/a")
+        assert err.value.code == 403
+        assert queue.jobs["a"].attempts == 0
+
+        worker = Worker(url, lambda info, path: open(path, 'rb').read(),
+                        token=coordinator.token)
+        assert worker.run() == 1
+    finally:
+        queue.finished.set()
+        server.join(30)
+
+
+def test_serve_skips_cached(clean_dir, docker_client):
+    """Test that the coordinator doesn't hand out submissions it already
+    has results for
+    """
+    args = argparse.Namespace(force=False, rebuild=False,
+                              suppress_output=False, lease_timeout=1,
+                              serve="127.0.0.1:0")
+    make_class(clean_dir, 2)
+    a = load_assignment(clean_dir)
+    image = "build:" + a.build_hash()
+    for s in a.submissions:
+        s.record_output("score: 10", s._result_key(image))
+    counts = {s.user_id: len(a.results.files(s.user_id))
+              for s in a.submissions}
+
+    # Returns straight away, with nothing to hand out
+    serve(a, a.submissions, args)
+    assert counts == {s.user_id: len(a.results.files(s.user_id))
+                      for s in a.submissions}
+
+
+def test_serve_rejects_other_gradesheets(tmpdir, docker_client,
+                                         monkeypatch):
+    """Test that output from a worker whose gradesheet isn't the
+    coordinator's is neither recorded nor cached
+    """
+    coordinator_path = str(tmpdir.mkdir("coordinator"))
+    worker_path = str(tmpdir.join("worker"))
+    make_class(coordinator_path, 2)
+    shutil.copytree(coordinator_path, worker_path)
+    a = load_assignment(coordinator_path)
+    with open(load_assignment(worker_path).gradesheet.dockerfile_path,
+              'a') as f:
+        f.write("\nRUN true\n")
+    counts = {s.user_id: len(a.results.files(s.user_id))
+              for s in a.submissions}
+
+    coordinators = []
+
+    class Recording(Coordinator):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            coordinators.append(self)
+
+    monkeypatch.setattr(workqueue, "Coordinator", Recording)
+    args = argparse.Namespace(force=False, rebuild=False,
+                              suppress_output=False, lease_timeout=5,
+                              serve="127.0.0.1:0")
+    exits = []
+
+    def run_serve():
+        try:
+            serve(a, a.submissions, args)
+        except SystemExit as e:
+            exits.append(e.code)
+
+    server = threading.Thread(target=run_serve)
+    server.start()
+    while not coordinators:
+        time.sleep(0.01)
+    coordinator, = coordinators
+    Worker(coordinator.url, JobGrader(Grader(worker_path)), poll_interval=0.1,
+           token=coordinator.token).run()
+    server.join(30)
+
+    assert exits == [1]
+    assert counts == {s.user_id: len(a.results.files(s.user_id))
+                      for s in a.submissions}
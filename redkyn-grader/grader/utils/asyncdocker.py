@@ -0,0 +1,310 @@
+"""A small asyncio client for the parts of the Docker Engine API that
+grader uses to run submissions.
+
+The method names and arguments mirror :class:`docker.APIClient`, so
+code written against one reads the same against the other. Errors are
+raised as the same :mod:`docker.errors` exceptions, too.
+
+"""
+import asyncio
+import json
+import logging
+import shlex
+import struct
+
+from urllib.parse import quote, urlencode
+
+import docker
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+"""How many bytes to read or write at a time when streaming"""
+
+
+class _Response(object):
+    """The status, headers and (unread) body of an HTTP response."""
+
+    def __init__(self, status, reason, headers, reader, writer):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self._reader = reader
+        self._writer = writer
+
+    async def iter_chunks(self):
+        """Yields the body of the response as it arrives."""
+        reader = self._reader
+        try:
+            if self.headers.get('transfer-encoding') == 'chunked':
+                while True:
+                    size = int((await reader.readline()).split(b';')[0], 16)
+                    if size == 0:
+                        await reader.readline()
+                        break
+                    yield await reader.readexactly(size)
+                    await reader.readline()
+            elif 'content-length' in self.headers:
+                remaining = int(self.headers['content-length'])
+                while remaining > 0:
+                    chunk = await reader.read(min(remaining, CHUNK_SIZE))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+            else:
+                while True:
+                    chunk = await reader.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+        finally:
+            self.close()
+
+    async def read(self):
+        """Reads and returns the whole body of the response."""
+        return b''.join([chunk async for chunk in self.iter_chunks()])
+
+    async def json(self):
+        body = await self.read()
+        return json.loads(body.decode('utf-8')) if body else None
+
+    def close(self):
+        self._writer.close()
+
+
+async def _demux(chunks):
+    """Strips the 8-byte frame headers from a multiplexed (non-TTY)
+    exec stream, yielding the payload of each frame.
+
+    """
+    buf = b''
+    async for chunk in chunks:
+        buf += chunk
+        while len(buf) >= 8:
+            _, size = struct.unpack('>BxxxL', buf[:8])
+            if len(buf) < 8 + size:
+                break
+            yield buf[8:8 + size]
+            buf = buf[8 + size:]
+
+
+class AsyncDockerClient(object):
+    """An asyncio Docker client that talks to the daemon's unix socket.
+
+    Every request uses its own connection, so any number of them may
+    be in flight at once from a single event loop.
+
+    :param str base_url: The daemon's address. Only ``unix://``
+        addresses are supported.
+
+    :param str version: The API version to use, or ``"auto"`` to ask
+        the daemon for its version on first use.
+
+    """
+
+    def __init__(self, base_url="unix://var/run/docker.sock",
+                 version="auto"):
+        if not base_url.startswith("unix://"):
+            raise ValueError("Only unix sockets are supported, "
+                             "not {}".format(base_url))
+        self.socket_path = "/" + base_url[len("unix://"):].lstrip("/")
+        self.version = version
+
+    async def _prefix(self):
+        if self.version == "auto":
+            response = await self._request("GET", "/version", versioned=False)
+            self.version = (await response.json())['ApiVersion']
+            logger.debug("Using Docker API version %s", self.version)
+        return "/v{}".format(self.version)
+
+    async def _request(self, method, path, params=None, body=None,
+                       data=None, content_type=None, versioned=True):
+        if versioned:
+            path = await self._prefix() + path
+        if params:
+            path += "?" + urlencode(params)
+
+        headers = {"Host": "docker", "Connection": "close"}
+        if body is not None:
+            data = json.dumps(body).encode('utf-8')
+            content_type = "application/json"
+        if content_type:
+            headers["Content-Type"] = content_type
+        if data is None or isinstance(data, bytes):
+            headers["Content-Length"] = str(len(data or b''))
+        else:
+            headers["Transfer-Encoding"] = "chunked"
+
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        head = "{} {} HTTP/1.1\r\n".format(method, path)
+        head += "".join("{}: {}\r\n".format(k, v) for k, v in headers.items())
+        writer.write((head + "\r\n").encode('latin-1'))
+
+        if isinstance(data, bytes):
+            writer.write(data)
+        elif data is not None:
+            async for chunk in self._iter_data(data):
+                writer.write("{:x}\r\n".format(len(chunk)).encode('ascii'))
+                writer.write(chunk + b"\r\n")
+                await writer.drain()
+            writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+        status_line = await reader.readline()
+        try:
+            _, status, reason = status_line.decode('latin-1').split(" ", 2)
+        except ValueError:
+            writer.close()
+            raise docker.errors.APIError(
+                "Bad response from Docker: {!r}".format(status_line)
+            )
+        response_headers = {}
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            key, _, value = line.partition(":")
+            response_headers[key.strip().lower()] = value.strip()
+
+        response = _Response(int(status), reason.strip(), response_headers,
+                             reader, writer)
+        if response.status >= 400:
+            await self._raise_for_status(method, path, response)
+        return response
+
+    async def _iter_data(self, data):
+        """Reads a file object or iterable of bytes in chunks, without
+        blocking the event loop on disk reads. Iterables (e.g.,
+        generators that read and compress files) are advanced in an
+        executor too.
+
+        """
+        loop = asyncio.get_event_loop()
+        if hasattr(data, 'read'):
+            while True:
+                chunk = await loop.run_in_executor(None, data.read,
+                                                   CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+        else:
+            chunks = iter(data)
+            done = object()
+            while True:
+                chunk = await loop.run_in_executor(None, next, chunks, done)
+                if chunk is done:
+                    break
+                if chunk:
+                    yield chunk
+
+    async def _raise_for_status(self, method, path, response):
+        body = (await response.read()).decode('utf-8', 'replace')
+        try:
+            explanation = json.loads(body).get('message', body)
+        except (ValueError, AttributeError):
+            explanation = body
+        message = "{} Client Error for {} {}: {}".format(
+            response.status, method, path, response.reason
+        )
+        if response.status == 404:
+            raise docker.errors.NotFound(message, explanation=explanation)
+        raise docker.errors.APIError(message, explanation=explanation)
+
+    async def _json(self, method, path, **kwargs):
+        response = await self._request(method, path, **kwargs)
+        return await response.json()
+
+    async def _discard(self, method, path, **kwargs):
+        response = await self._request(method, path, **kwargs)
+        await response.read()
+
+    async def containers(self, all=False, filters=None):
+        params = {"all": int(all)}
+        if filters:
+            params["filters"] = json.dumps(
+                {k: v if isinstance(v, list) else [v]
+                 for k, v in filters.items()}
+            )
+        return await self._json("GET", "/containers/json", params=params)
+
+    async def create_container(self, image, name=None, labels=None,
+                               command=None):
+        body = {"Image": image, "Labels": labels or {}}
+        if command:
+            body["Cmd"] = (shlex.split(command)
+                           if isinstance(command, str) else command)
+        params = {"name": name} if name else None
+        return await self._json("POST", "/containers/create",
+                                params=params, body=body)
+
+    async def inspect_container(self, container):
+        return await self._json(
+            "GET", "/containers/{}/json".format(quote(container))
+        )
+
+    async def inspect_image(self, image):
+        return await self._json(
+            "GET", "/images/{}/json".format(quote(image, safe=":/"))
+        )
+
+    async def remove_container(self, container, force=False):
+        await self._discard("DELETE", "/containers/{}".format(
+            quote(container)), params={"force": int(force)})
+
+    async def start(self, container):
+        await self._discard("POST", "/containers/{}/start".format(
+            quote(container)))
+
+    async def stop(self, container, timeout=10):
+        await self._discard("POST", "/containers/{}/stop".format(
+            quote(container)), params={"t": timeout})
+
+    async def kill(self, container, signal=None):
+        params = {"signal": signal} if signal is not None else None
+        await self._discard("POST", "/containers/{}/kill".format(
+            quote(container)), params=params)
+
+    async def put_archive(self, container, path, data):
+        """Uploads a tar archive into a container. ``data`` may be bytes,
+        a file object (which is streamed from disk in chunks), or an
+        iterable of bytes.
+
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        await self._discard(
+            "PUT", "/containers/{}/archive".format(quote(container)),
+            params={"path": path}, data=data, content_type="application/x-tar"
+        )
+        return True
+
+    async def exec_create(self, container, cmd, user=''):
+        if isinstance(cmd, str):
+            cmd = shlex.split(cmd)
+        body = {
+            "AttachStdin": False,
+            "AttachStdout": True,
+            "AttachStderr": True,
+            "Tty": False,
+            "Cmd": cmd,
+            "User": user,
+        }
+        return await self._json("POST", "/containers/{}/exec".format(
+            quote(container)), body=body)
+
+    async def exec_start(self, exec_id, stream=False):
+        """Starts an exec instance. Returns its output as bytes, or if
+        ``stream`` is True, as an async iterator of bytes.
+
+        """
+        if isinstance(exec_id, dict):
+            exec_id = exec_id.get('Id')
+        response = await self._request(
+            "POST", "/exec/{}/start".format(quote(exec_id)),
+            body={"Detach": False, "Tty": False}
+        )
+        frames = _demux(response.iter_chunks())
+        if stream:
+            return frames
+        return b''.join([frame async for frame in frames])
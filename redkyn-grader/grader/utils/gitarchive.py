@@ -0,0 +1,286 @@
+"""Reads commit information straight out of a tarball containing a git
+repository, without extracting it.
+
+Only what's needed to find the commit that ``HEAD`` points to is
+read: ``HEAD``, branch refs, loose objects and pack indexes. If that
+commit is stored in a pack file, the tarball is streamed a second time
+up to the commit's offset in the pack.
+
+"""
+import bisect
+import binascii
+import logging
+import re
+import struct
+import tarfile
+import zlib
+
+logger = logging.getLogger(__name__)
+
+LOOSE_OBJECT_LIMIT = 64 * 1024
+"""Loose objects larger than this (compressed) aren't kept in memory.
+Commits are almost always much smaller."""
+
+_LOOSE_RE = re.compile(r"^objects/([0-9a-f]{2})/([0-9a-f]{38})$")
+_IDX_RE = re.compile(r"^objects/pack/(pack-[0-9a-f]{40})\.idx$")
+_SHA_RE = re.compile(r"^[0-9a-f]{40}$")
+
+_OBJ_COMMIT = 1
+
+
+class GitArchiveError(Exception):
+    """An exception thrown when a repository can't be read from a
+    tarball without extracting it (e.g., the commit is stored as a
+    delta, or the repository uses a ``.git`` file).
+
+    """
+    pass
+
+
+class _GitDir(object):
+    """The bits of one candidate git directory found in a tarball."""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.head = None
+        self.refs = {}
+        self.packed_refs = None
+        self.loose = {}
+        self.indexes = {}
+
+    def add(self, name, tar, info):
+        rel = name[len(self.prefix):]
+        if rel == "HEAD":
+            self.head = self._read(tar, info).decode('utf-8').strip()
+        elif rel == "packed-refs":
+            self.packed_refs = self._read(tar, info).decode('utf-8')
+        elif rel.startswith("refs/heads/"):
+            sha = self._read(tar, info).decode('utf-8').strip()
+            self.refs[rel] = sha
+        elif _LOOSE_RE.match(rel):
+            match = _LOOSE_RE.match(rel)
+            sha = match.group(1) + match.group(2)
+            # Remember big objects exist, but don't keep them around
+            self.loose[sha] = (self._read(tar, info)
+                               if info.size <= LOOSE_OBJECT_LIMIT else None)
+        elif _IDX_RE.match(rel):
+            pack = _IDX_RE.match(rel).group(1)
+            self.indexes[pack] = self._read(tar, info)
+
+    @classmethod
+    def _read(cls, tar, info):
+        f = tar.extractfile(info)
+        return f.read() if f else b''
+
+    def all_refs(self):
+        refs = {}
+        if self.packed_refs:
+            for line in self.packed_refs.splitlines():
+                if not line or line[0] in "#^":
+                    continue
+                sha, _, ref = line.partition(" ")
+                refs[ref.strip()] = sha
+        refs.update(self.refs)
+        return refs
+
+    def head_sha(self):
+        """The SHA of the commit HEAD points to. Falls back to the first
+        branch if HEAD is missing or names a branch that doesn't exist.
+
+        """
+        refs = self.all_refs()
+        head = self.head or ""
+        if _SHA_RE.match(head):
+            return head
+        if head.startswith("ref: "):
+            ref = head[len("ref: "):].strip()
+            if ref in refs:
+                return refs[ref]
+        heads = sorted(r for r in refs if r.startswith("refs/heads/"))
+        return refs[heads[0]] if heads else None
+
+
+def _split_name(name):
+    while name.startswith("./"):
+        name = name[2:]
+    return name.split("/", 1)
+
+
+def _scan(path):
+    """Streams through the tarball once, collecting everything that
+    might be needed to find the HEAD commit.
+
+    :return: The git directory found, or None if there isn't exactly
+        one root directory containing a repository
+
+    """
+    roots = set()
+    gitdirs = {}
+    with tarfile.open(path, "r|*") as tar:
+        for info in tar:
+            parts = _split_name(info.name)
+            roots.add(parts[0])
+            if len(parts) < 2:
+                continue
+
+            root, rel = parts
+            name = "{}/{}".format(root, rel)
+            if rel == ".git" and info.isfile():
+                raise GitArchiveError("{}/.git is a file".format(root))
+
+            # Either a working tree with a .git directory, or a bare
+            # repository at the root
+            for prefix in ("{}/.git/".format(root), "{}/".format(root)):
+                if name.startswith(prefix) and info.isfile():
+                    gitdirs.setdefault(prefix, _GitDir(prefix)) \
+                           .add(name, tar, info)
+                    break
+
+    if len(roots) != 1:
+        return None
+
+    root, = roots
+    for prefix in ("{}/.git/".format(root), "{}/".format(root)):
+        gitdir = gitdirs.get(prefix)
+        if gitdir is not None and gitdir.head is not None:
+            return gitdir
+    return None
+
+
+def _find_in_index(index, sha):
+    """Looks a SHA up in a pack index (version 1 or 2).
+
+    :return: The offset of the object in the pack, or None
+    """
+    binsha = binascii.unhexlify(sha)
+    if index[:4] == b"\xfftOc":
+        version, = struct.unpack(">L", index[4:8])
+        if version != 2:
+            raise GitArchiveError("Unknown pack index version {}"
+                                  .format(version))
+        fanout_at = 8
+    else:
+        fanout_at = 0
+
+    fanout = struct.unpack(">256L", index[fanout_at:fanout_at + 1024])
+    count = fanout[255]
+    lo = fanout[binsha[0] - 1] if binsha[0] else 0
+    hi = fanout[binsha[0]]
+    table_at = fanout_at + 1024
+
+    if fanout_at == 0:
+        # Version 1: (offset, sha) pairs
+        shas = [index[table_at + i * 24 + 4:table_at + i * 24 + 24]
+                for i in range(lo, hi)]
+        pos = bisect.bisect_left(shas, binsha)
+        if pos == len(shas) or shas[pos] != binsha:
+            return None
+        at = table_at + (lo + pos) * 24
+        return struct.unpack(">L", index[at:at + 4])[0]
+
+    # Version 2: shas, then crcs, then offsets, then large offsets
+    shas = [index[table_at + i * 20:table_at + i * 20 + 20]
+            for i in range(lo, hi)]
+    pos = bisect.bisect_left(shas, binsha)
+    if pos == len(shas) or shas[pos] != binsha:
+        return None
+    offsets_at = table_at + count * 24
+    at = offsets_at + (lo + pos) * 4
+    offset, = struct.unpack(">L", index[at:at + 4])
+    if offset & 0x80000000:
+        at = offsets_at + count * 4 + (offset & 0x7fffffff) * 8
+        offset, = struct.unpack(">Q", index[at:at + 8])
+    return offset
+
+
+def _read_packed_commit(path, pack_name, offset):
+    """Streams through the tarball again, reading a commit object out
+    of a pack file.
+
+    """
+    with tarfile.open(path, "r|*") as tar:
+        for info in tar:
+            if not info.name.endswith("/objects/pack/{}.pack"
+                                      .format(pack_name)):
+                continue
+
+            pack = tar.extractfile(info)
+            remaining = offset
+            while remaining:
+                skipped = len(pack.read(min(remaining, 1024 * 1024)))
+                if not skipped:
+                    break
+                remaining -= skipped
+
+            # Object header: type in bits 4-6 of the first byte, then
+            # a variable-length size
+            byte = pack.read(1)[0]
+            obj_type = (byte >> 4) & 7
+            while byte & 0x80:
+                byte = pack.read(1)[0]
+            if obj_type != _OBJ_COMMIT:
+                raise GitArchiveError(
+                    "Commit is stored as a type {} object".format(obj_type)
+                )
+
+            decompressor = zlib.decompressobj()
+            data = b''
+            while not decompressor.eof:
+                chunk = pack.read(4096)
+                if not chunk:
+                    break
+                data += decompressor.decompress(chunk)
+            return data
+
+    raise GitArchiveError("Could not find {}.pack".format(pack_name))
+
+
+def _committed_date(body):
+    for line in body.decode('utf-8', 'replace').splitlines():
+        if not line:
+            break
+        if line.startswith("committer "):
+            return int(line.rsplit(" ", 2)[-2])
+    raise GitArchiveError("Commit has no committer")
+
+
+def read_latest_commit(path):
+    """Reads the commit time of ``HEAD`` from a tarball containing a
+    single directory that is a git repository (either a working tree
+    with a ``.git`` directory, or a bare repository).
+
+    :param str path: Path to the tarball
+
+    :return: The committer timestamp (seconds since the epoch), or None
+        if the tarball doesn't contain a repository with any commits
+
+    :raises GitArchiveError: if the repository can't be read without
+        extracting it
+
+    """
+    gitdir = _scan(path)
+    if gitdir is None:
+        return None
+
+    sha = gitdir.head_sha()
+    if sha is None:
+        return None
+
+    if sha in gitdir.loose:
+        compressed = gitdir.loose[sha]
+        if compressed is None:
+            raise GitArchiveError("Loose object {} is too big".format(sha))
+        header, _, body = zlib.decompress(compressed).partition(b"\0")
+        if not header.startswith(b"commit "):
+            raise GitArchiveError("{} isn't a commit".format(sha))
+        return _committed_date(body)
+
+    for pack_name, index in gitdir.indexes.items():
+        offset = _find_in_index(index, sha)
+        if offset is not None:
+            logger.debug("Found %s in %s at %d", sha, pack_name, offset)
+            return _committed_date(
+                _read_packed_commit(path, pack_name, offset)
+            )
+
+    raise GitArchiveError("Could not find commit {}".format(sha))
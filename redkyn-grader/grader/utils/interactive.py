@@ -12,8 +12,8 @@ def submission_choice(assignment, user_id, subs):
         i = 1
         print("Index\tCreated")
         for s in subs:
-            info = assignment.docker_cli.inspect_container(s.full_id)
-            print("{0}\t{1}".format(i, info['Created']))
+            created = assignment.containers.created(s.uuid)
+            print("{0}\t{1}".format(i, created or "No container"))
             i += 1
         choice = -1
         while choice < 0 or choice >= len(subs):
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class JobResult(object):
+    """The outcome of a single job run by :func:`run_jobs`.
+
+    :ivar str name: The name the job was submitted with
+    :ivar value: Whatever the job returned (None if it failed)
+    :ivar error: The exception the job raised (None if it succeeded)
+    :ivar float elapsed: Wall-clock seconds spent running the job
+    """
+
+    def __init__(self, name, value=None, error=None, elapsed=0.0):
+        self.name = name
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        """True if the job finished without raising an exception"""
+        return self.error is None
+
+    def __str__(self):
+        status = "ok" if self.ok else "failed ({})".format(self.error)
+        return "{} {} in {:.2f}s".format(self.name, status, self.elapsed)
+
+
+def _timed(func):
+    start = time.monotonic()
+    try:
+        return func(), None, time.monotonic() - start
+    except Exception as e:
+        logger.debug("Job raised %r", e)
+        return None, e, time.monotonic() - start
+
+
+def run_jobs(jobs, workers=1, executor_class=ThreadPoolExecutor):
+    """Runs jobs on a bounded pool of workers.
+
+    Results are yielded in the order the jobs were given, regardless
+    of the order in which they finish, so that output from one job
+    never interleaves with output from another.
+
+    :param jobs: An iterable of ``(name, callable)`` pairs. Each
+        callable is called with no arguments.
+
+    :param int workers: The maximum number of jobs to run at once. If
+        it's 1, jobs run one after another in the calling thread.
+
+    :param executor_class: The :mod:`concurrent.futures` executor to
+        use for running jobs in parallel.
+
+    :return: A generator of :class:`JobResult`, one per job
+
+    """
+    if workers < 1:
+        raise ValueError("Need at least one worker, not {}".format(workers))
+
+    if workers == 1:
+        for name, func in jobs:
+            yield JobResult(name, *_timed(func))
+        return
+
+    with executor_class(max_workers=workers) as executor:
+        futures = [(name, executor.submit(_timed, func))
+                   for name, func in jobs]
+        for name, future in futures:
+            yield JobResult(name, *future.result())
+
+
+async def _timed_async(semaphore, func):
+    async with semaphore:
+        start = time.monotonic()
+        try:
+            return await func(), None, time.monotonic() - start
+        except Exception as e:
+            logger.debug("Job raised %r", e)
+            return None, e, time.monotonic() - start
+
+
+def run_async_jobs(jobs, workers=1):
+    """Runs coroutine jobs on a fresh event loop, with at most
+    ``workers`` of them in flight at once.
+
+    Like :func:`run_jobs`, results are yielded in the order the jobs
+    were given.
+
+    :param jobs: An iterable of ``(name, coroutine function)`` pairs.
+        Each coroutine function is called with no arguments.
+
+    :param int workers: The maximum number of jobs to run at once.
+
+    :return: A generator of :class:`JobResult`, one per job
+
+    """
+    if workers < 1:
+        raise ValueError("Need at least one worker, not {}".format(workers))
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    tasks = []
+    try:
+        semaphore = asyncio.Semaphore(workers)
+        tasks = [(name, loop.create_task(_timed_async(semaphore, func)))
+                 for name, func in jobs]
+        for name, task in tasks:
+            yield JobResult(name, *loop.run_until_complete(task))
+    finally:
+        for _, task in tasks:
+            task.cancel()
+        loop.run_until_complete(
+            asyncio.gather(*[t for _, t in tasks], return_exceptions=True)
+        )
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def summarize_jobs(results, elapsed):
+    """Builds a one-line summary of a batch of jobs.
+
+    :param list results: The :class:`JobResult` objects for the batch
+
+    :param float elapsed: Wall-clock seconds the whole batch took
+
+    :rtype: str
+    """
+    failed = [r for r in results if not r.ok]
+    return "Finished {} of {} jobs in {:.2f}s ({} failed)".format(
+        len(results) - len(failed), len(results), elapsed, len(failed)
+    )
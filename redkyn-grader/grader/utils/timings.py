@@ -0,0 +1,230 @@
+"""Timing of the phases of grading (and building), for finding out
+where a slow grading run spends its time.
+
+Timing is off until :func:`start` is called, which is what the
+``--timings`` and ``--metrics`` options do. While it's on, every
+:func:`phase` block is recorded as a line of JSON like::
+
+    {"run": "3f2a9c1e", "time": 1700000000.0, "phase": "grade-it",
+     "seconds": 1.93, "assignment": "hw1", "submission": "abc123--..."}
+
+When it's stopped, totals for each phase are written to a
+Prometheus-style textfile (e.g., for node_exporter's textfile
+collector). ``grader timings`` summarizes a JSONL file.
+
+"""
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+METRIC = "grader_phase_seconds"
+"""The name of the metric written to Prometheus textfiles"""
+
+PERCENTILES = (50, 90, 99)
+"""The percentiles :func:`summarize` reports"""
+
+_recorder = None
+
+
+class TimingRecorder(object):
+    """Records how long phases take: as JSON lines, appended to a file
+    as they happen, and as running totals that are written to a
+    Prometheus textfile by :meth:`close`.
+
+    """
+
+    def __init__(self, jsonl_path=None, textfile_path=None,
+                 clock=time.time):
+        """Instantiates a TimingRecorder.
+
+        :param str jsonl_path: The file to append JSON lines to, if any
+
+        :param str textfile_path: The Prometheus textfile to write, if
+            any. It's replaced, not appended to.
+
+        :param clock: Returns the current (wall-clock) time, in seconds
+        """
+        self.run = uuid.uuid4().hex[:8]
+        self.textfile_path = textfile_path
+        self.clock = clock
+        self.totals = OrderedDict()
+        self._lock = threading.Lock()
+        self._jsonl = None
+        if jsonl_path is not None:
+            self._jsonl = open(jsonl_path, 'a', buffering=1)
+
+    def record(self, phase, seconds, **labels):
+        """Records one phase.
+
+        :param str phase: The phase's name, e.g., ``start``
+
+        :param float seconds: How long it took
+
+        :param labels: Anything else to record about it, e.g., the
+            submission being graded
+        """
+        record = OrderedDict([
+            ('run', self.run),
+            ('time', self.clock()),
+            ('phase', phase),
+            ('seconds', seconds),
+        ])
+        record.update(labels)
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            count, total = self.totals.get(phase, (0, 0.0))
+            self.totals[phase] = (count + 1, total + seconds)
+            if self._jsonl is not None:
+                self._jsonl.write(line)
+
+    def write_textfile(self):
+        """Writes the count and total time of each phase to the
+        Prometheus textfile. The file is replaced in one go, so it's
+        never read half-written.
+
+        """
+        if self.textfile_path is None:
+            return
+        with self._lock:
+            totals = list(self.totals.items())
+
+        lines = [
+            "# HELP {} Time spent in each phase of grading.".format(METRIC),
+            "# TYPE {} summary".format(METRIC),
+        ]
+        for phase, (count, total) in totals:
+            lines.append('{}_sum{{phase="{}"}} {:.6f}'.format(
+                METRIC, phase, total))
+            lines.append('{}_count{{phase="{}"}} {}'.format(
+                METRIC, phase, count))
+
+        directory = os.path.dirname(os.path.abspath(self.textfile_path))
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".timings")
+        os.fchmod(fd, 0o644)
+        with os.fdopen(fd, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, self.textfile_path)
+
+    def close(self):
+        """Writes the Prometheus textfile and closes the JSONL file."""
+        self.write_textfile()
+        with self._lock:
+            if self._jsonl is not None:
+                self._jsonl.close()
+                self._jsonl = None
+
+
+def start(jsonl_path=None, textfile_path=None):
+    """Turns timing on for the rest of the process.
+
+    :param str jsonl_path: The file to append JSON lines to, if any
+
+    :param str textfile_path: The Prometheus textfile to write when
+        timing is stopped, if any
+
+    :return: The new :class:`TimingRecorder`
+    """
+    global _recorder
+    stop()
+    _recorder = TimingRecorder(jsonl_path, textfile_path)
+    return _recorder
+
+
+def stop():
+    """Turns timing off, writing out anything that's still pending."""
+    global _recorder
+    recorder, _recorder = _recorder, None
+    if recorder is not None:
+        recorder.close()
+
+
+@contextmanager
+def phase(name, **labels):
+    """Times a ``with`` block as a phase, if timing is on. Phases that
+    raise an exception are recorded too, with ``error`` set.
+
+    :param str name: The phase's name
+
+    :param labels: Anything else to record about it
+    """
+    recorder = _recorder
+    if recorder is None:
+        yield
+        return
+
+    began = time.monotonic()
+    try:
+        yield
+    except BaseException:
+        labels['error'] = True
+        raise
+    finally:
+        recorder.record(name, time.monotonic() - began, **labels)
+
+
+def read_records(path):
+    """Reads the records in a JSONL file written by a
+    :class:`TimingRecorder`, skipping any lines that aren't JSON (e.g.,
+    one cut short when grader was killed).
+
+    :param str path: The file's path
+
+    :return: A generator of dicts
+    """
+    with open(path) as f:
+        for n, line in enumerate(f, 1):
+            try:
+                yield json.loads(line)
+            except ValueError:
+                logger.debug("Skipping line %d of %s", n, path)
+
+
+def percentile(values, q):
+    """Returns the ``q``-th percentile of some values, by the nearest
+    rank method.
+
+    :param list values: The values, sorted
+
+    :param float q: The percentile, from 0 to 100
+    """
+    if not values:
+        return None
+    rank = max(1, int(math.ceil(q / 100 * len(values))))
+    return values[rank - 1]
+
+
+def summarize(records):
+    """Summarizes how long each phase took.
+
+    :param records: Dicts with a ``phase`` and ``seconds``
+
+    :return: An OrderedDict that maps each phase, in the order it was
+        first seen, to a dict with its ``count``, ``total``, ``max``
+        and percentiles (``p50``, etc.)
+    """
+    by_phase = OrderedDict()
+    for record in records:
+        by_phase.setdefault(record['phase'], []).append(record['seconds'])
+
+    summary = OrderedDict()
+    for name, values in by_phase.items():
+        values.sort()
+        stats = {
+            'count': len(values),
+            'total': sum(values),
+            'max': values[-1],
+        }
+        for q in PERCENTILES:
+            stats['p{}'.format(q)] = percentile(values, q)
+        summary[name] = stats
+    return summary
@@ -0,0 +1,544 @@
+"""Hands jobs out to workers, on this machine or others, over XML-RPC.
+
+A :class:`Coordinator` serves a :class:`WorkQueue` of jobs, each with a
+file (e.g., a submission archive) for workers to download. A
+:class:`Worker` leases a job, downloads its file, does it, and sends
+the output back. Leases have to be renewed while a job is being done,
+so if a worker dies (or loses its network), its lease runs out and the
+job goes back into the queue for another worker.
+
+Every request (including downloads) has to carry the coordinator's
+token, as a bearer token in its ``Authorization`` header. It keeps
+strangers from leasing jobs or downloading files, but it's sent in the
+clear, so still only serve a queue on a trusted network.
+
+"""
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import uuid
+import xmlrpc.client
+
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from socketserver import ThreadingMixIn
+from urllib.parse import quote, unquote
+from urllib.request import Request, urlopen
+from xmlrpc.server import SimpleXMLRPCRequestHandler, SimpleXMLRPCServer
+
+from grader.utils.jobs import JobResult
+
+logger = logging.getLogger(__name__)
+
+LEASE_TIMEOUT = 300.0
+"""Seconds a worker has to finish (or renew) a job before it's requeued"""
+
+MAX_ATTEMPTS = 3
+"""How many times a job is tried before it's given up on"""
+
+CHUNK_SIZE = 64 * 1024
+"""Bytes of a job's file to send or receive at once"""
+
+
+class WorkQueueError(Exception):
+    """An exception thrown when a job can't be done, or a worker can't
+    reach its coordinator.
+
+    """
+    pass
+
+
+class Job(object):
+    """A job in a :class:`WorkQueue`.
+
+    :ivar str name: A name for the job, unique within its queue
+    :ivar str path: The file workers download to do the job
+    :ivar dict info: Anything else workers need to know about the job.
+        It has to be sendable over XML-RPC.
+    :ivar int attempts: How many times the job has been leased
+    :ivar list errors: Why each failed attempt failed
+    """
+
+    def __init__(self, name, path, info=None):
+        self.name = name
+        self.path = path
+        self.info = dict(info or {})
+        self.attempts = 0
+        self.errors = []
+        self.worker = None
+        self.token = None
+        self.deadline = None
+        self.started = None
+
+
+class WorkQueue(object):
+    """A queue of :class:`Job` objects that are leased out to workers.
+
+    A lease is identified by a random token, so a worker whose lease
+    ran out can't finish a job that's since been given to someone else.
+    It's safe to use from several threads.
+
+    """
+
+    def __init__(self, jobs, lease_timeout=LEASE_TIMEOUT,
+                 max_attempts=MAX_ATTEMPTS, clock=time.monotonic):
+        """Instantiates a WorkQueue.
+
+        :param list jobs: The :class:`Job` objects to hand out, in order
+
+        :param float lease_timeout: Seconds a lease lasts unless it's
+            renewed
+
+        :param int max_attempts: How many times a job is tried before
+            it's given up on
+
+        :param clock: Returns the current time in seconds
+
+        """
+        self.jobs = OrderedDict((job.name, job) for job in jobs)
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.finished = threading.Event()
+        """Set once every job has succeeded or been given up on"""
+
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._pending = deque(self.jobs.values())
+        self._leased = {}
+        self._results = {}
+        if not self.jobs:
+            self.finished.set()
+
+    @property
+    def results(self):
+        """A :class:`~grader.utils.jobs.JobResult` for every job that's
+        finished, in the order the jobs were given.
+
+        """
+        with self._lock:
+            return [self._results[name] for name in self.jobs
+                    if name in self._results]
+
+    def _finish(self, job, value=None, error=None):
+        elapsed = self._clock() - job.started
+        self._results[job.name] = JobResult(job.name, value, error, elapsed)
+        if len(self._results) == len(self.jobs):
+            self.finished.set()
+
+    def _retry(self, job, error):
+        job.token = None
+        job.errors.append(error)
+        if job.attempts >= self.max_attempts:
+            logger.error("Giving up on %s after %d attempt(s)",
+                         job.name, job.attempts)
+            self._finish(job, error=WorkQueueError("; ".join(job.errors)))
+        else:
+            # Retry it before anything else
+            self._pending.appendleft(job)
+
+    def _expire(self):
+        now = self._clock()
+        for job in list(self._leased.values()):
+            if job.deadline <= now:
+                logger.warning("%s's lease on %s ran out",
+                               job.worker, job.name)
+                del self._leased[job.name]
+                self._retry(job, "{}'s lease ran out".format(job.worker))
+
+    def expire(self):
+        """Requeues (or gives up on) jobs whose leases have run out."""
+        with self._lock:
+            self._expire()
+
+    def lease(self, worker):
+        """Leases the next job to a worker.
+
+        :param str worker: The worker's name, for log messages
+
+        :return: The :class:`Job`, with a new ``token``, or None if
+            there's nothing to do right now
+        """
+        with self._lock:
+            self._expire()
+            if not self._pending:
+                return None
+            job = self._pending.popleft()
+            job.attempts += 1
+            job.worker = worker
+            job.token = uuid.uuid4().hex
+            job.started = self._clock()
+            job.deadline = job.started + self.lease_timeout
+            self._leased[job.name] = job
+            return job
+
+    def renew(self, name, token):
+        """Extends a lease.
+
+        :return: Whether the lease was still held
+        :rtype: bool
+        """
+        with self._lock:
+            self._expire()
+            job = self._leased.get(name)
+            if job is None or job.token != token:
+                return False
+            job.deadline = self._clock() + self.lease_timeout
+            return True
+
+    def take(self, name, token):
+        """Ends a lease, because its worker is done with the job. Follow
+        up with :meth:`succeeded` or :meth:`failed`.
+
+        :return: The :class:`Job`, or None if the lease wasn't held
+            (e.g., it ran out and the job went to someone else)
+        """
+        with self._lock:
+            job = self._leased.get(name)
+            if job is None or job.token != token:
+                return None
+            del self._leased[name]
+            return job
+
+    def succeeded(self, job, value=None):
+        """Records that a job taken with :meth:`take` is done."""
+        with self._lock:
+            self._finish(job, value=value)
+
+    def failed(self, job, error):
+        """Records that an attempt at a job taken with :meth:`take`
+        failed. It's tried again, unless it's been tried too many times.
+
+        :param str error: What went wrong
+        """
+        with self._lock:
+            self._retry(job, error)
+
+
+class _RequestHandler(SimpleXMLRPCRequestHandler):
+    """Handles XML-RPC calls, and downloads of jobs' files."""
+
+    rpc_paths = ('/RPC2',)
+
+    FILES_PATH = '/files/'
+
+    def parse_request(self):
+        if not super().parse_request():
+            return False
+        if not self.server.coordinator.authorized(
+                self.headers.get("Authorization")):
+            self.send_error(403)
+            return False
+        return True
+
+    def do_GET(self):
+        queue = self.server.coordinator.queue
+        job = None
+        if self.path.startswith(self.FILES_PATH):
+            job = queue.jobs.get(unquote(self.path[len(self.FILES_PATH):]))
+        if job is None:
+            self.report_404()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(os.path.getsize(job.path)))
+        self.end_headers()
+        with open(job.path, 'rb') as f:
+            shutil.copyfileobj(f, self.wfile, CHUNK_SIZE)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class _TokenTransport(xmlrpc.client.Transport):
+    """Sends extra headers (i.e., the coordinator's token) with every
+    XML-RPC call. ``ServerProxy`` only takes headers itself from Python
+    3.8 on.
+
+    """
+
+    def __init__(self, headers):
+        super().__init__()
+        self._extra = list(headers)
+
+    def send_headers(self, connection, headers):
+        super().send_headers(connection, list(headers) + self._extra)
+
+
+class _Server(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class Coordinator(object):
+    """Serves a :class:`WorkQueue` to :class:`Worker` objects over
+    XML-RPC, and hands the output of each finished job to a callback.
+
+    """
+
+    def __init__(self, queue, on_output, host="127.0.0.1", port=0,
+                 token=None):
+        """Instantiates a Coordinator, and starts listening (but not
+        answering) for workers.
+
+        :param WorkQueue queue: The jobs to hand out
+
+        :param on_output: Called with a :class:`Job`, its output (as
+            bytes) and the worker's details about how it did the job (a
+            dict) when a worker finishes it. Whatever it returns is the
+            job's result. If it raises an exception, the job is tried
+            again.
+
+        :param str host: The address to listen on. Defaults to this
+            machine only; pass ``""`` to listen on all of them.
+
+        :param int port: The port to listen on. Defaults to any free
+            one.
+
+        :param str token: The token workers have to send with every
+            request. Defaults to a new random one.
+
+        """
+        self.queue = queue
+        self.on_output = on_output
+        self.token = token or secrets.token_urlsafe(24)
+        self.server = _Server((host, port), requestHandler=_RequestHandler,
+                              allow_none=True, logRequests=False)
+        self.server.coordinator = self
+        for name in ('lease', 'renew', 'complete', 'fail'):
+            self.server.register_function(getattr(self, name), name)
+
+    @property
+    def url(self):
+        """The URL workers should connect to"""
+        host, port = self.server.server_address[:2]
+        if host in ("", "0.0.0.0", "::"):
+            host = socket.getfqdn()
+        return "http://{}:{}/".format(host, port)
+
+    def authorized(self, header):
+        """Checks a request's ``Authorization`` header.
+
+        :rtype: bool
+        """
+        expected = "Bearer {}".format(self.token)
+        return hmac.compare_digest((header or "").encode(),
+                                   expected.encode())
+
+    def lease(self, worker):
+        if self.queue.finished.is_set():
+            return {'done': True}
+        job = self.queue.lease(worker)
+        if job is None:
+            return {}
+        logger.info("%s is working on %s (attempt %d)",
+                    worker, job.name, job.attempts)
+        return {
+            'name': job.name,
+            'token': job.token,
+            'info': job.info,
+            'file': _RequestHandler.FILES_PATH + quote(job.name),
+            'lease_timeout': self.queue.lease_timeout,
+        }
+
+    def renew(self, name, token):
+        return self.queue.renew(name, token)
+
+    def complete(self, name, token, output, details=None):
+        job = self.queue.take(name, token)
+        if job is None:
+            logger.info("Ignoring late output for %s", name)
+            return False
+
+        try:
+            value = self.on_output(job, output.data, details or {})
+        except Exception as e:
+            logger.error("Could not record output for %s: %s", name, e)
+            self.queue.failed(job, str(e))
+            return False
+        self.queue.succeeded(job, value)
+        return True
+
+    def fail(self, name, token, error):
+        job = self.queue.take(name, token)
+        if job is None:
+            return False
+        logger.warning("%s failed on %s: %s", job.worker, name, error)
+        self.queue.failed(job, error)
+        return True
+
+    def serve(self, poll_interval=1.0):
+        """Answers workers until every job has succeeded or been given up
+        on, then stops listening.
+
+        :return: A :class:`~grader.utils.jobs.JobResult` for every job
+        :rtype: list
+        """
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  daemon=True)
+        thread.start()
+        try:
+            while not self.queue.finished.wait(poll_interval):
+                self.queue.expire()
+        finally:
+            self.server.shutdown()
+            self.server.server_close()
+            thread.join()
+        return self.queue.results
+
+
+class Worker(object):
+    """Leases jobs from a :class:`Coordinator` and does them, until
+    there aren't any left.
+
+    """
+
+    def __init__(self, url, do_job, name=None, poll_interval=2.0,
+                 token=None):
+        """Instantiates a Worker.
+
+        :param str url: The coordinator's URL
+
+        :param do_job: Called with a job's ``info`` dict and the path to
+            its downloaded file. Returns the job's output, as bytes, or
+            a tuple of the output and a dict of details for the
+            coordinator (e.g., how the job was done).
+
+        :param str name: The worker's name, for log messages. Defaults
+            to the host's name and the worker's process ID.
+
+        :param float poll_interval: Seconds to wait before asking again
+            when there's nothing to do right now
+
+        :param str token: The coordinator's token
+
+        """
+        self.url = url.rstrip("/")
+        self.do_job = do_job
+        self.name = name or "{}:{}".format(socket.gethostname(), os.getpid())
+        self.poll_interval = poll_interval
+        self._headers = []
+        if token:
+            self._headers.append(("Authorization", "Bearer " + token))
+
+    def _proxy(self):
+        # ServerProxy objects can't be shared between threads
+        return xmlrpc.client.ServerProxy(
+            self.url + "/RPC2", allow_none=True,
+            transport=_TokenTransport(self._headers)
+        )
+
+    def run(self):
+        """Does jobs until the coordinator runs out of them (or goes
+        away).
+
+        :raises WorkQueueError: if the coordinator can't be reached at
+            all
+
+        :return: How many jobs were done
+        :rtype: int
+        """
+        proxy = self._proxy()
+        connected = False
+        count = 0
+        while True:
+            try:
+                lease = proxy.lease(self.name)
+            except xmlrpc.client.ProtocolError as e:
+                if e.errcode == 403:
+                    raise WorkQueueError(
+                        "The coordinator at {} didn't accept our "
+                        "token".format(self.url)
+                    ) from e
+                raise
+            except OSError as e:
+                if connected:
+                    logger.info("The coordinator has gone away")
+                    return count
+                raise WorkQueueError(
+                    "Could not reach the coordinator at {}: {}".format(
+                        self.url, e)
+                ) from e
+            connected = True
+
+            if lease.get('done'):
+                return count
+            if not lease:
+                time.sleep(self.poll_interval)
+                continue
+
+            try:
+                if self._do(proxy, lease):
+                    count += 1
+            except OSError as e:
+                logger.info("The coordinator has gone away: %s", e)
+                return count
+
+    def _do(self, proxy, lease):
+        name, token = lease['name'], lease['token']
+        stop = threading.Event()
+        renewer = threading.Thread(target=self._renew,
+                                   args=(lease, stop), daemon=True)
+        renewer.start()
+        try:
+            with self._download(lease) as path:
+                output = self.do_job(lease['info'], path)
+        except Exception as e:
+            logger.error("Could not do %s: %s", name, e)
+            proxy.fail(name, token, str(e) or repr(e))
+            return False
+        finally:
+            stop.set()
+            renewer.join()
+
+        details = {}
+        if isinstance(output, tuple):
+            output, details = output
+        return proxy.complete(name, token, xmlrpc.client.Binary(output),
+                              details)
+
+    def _renew(self, lease, stop):
+        proxy = self._proxy()
+        while not stop.wait(lease['lease_timeout'] / 3):
+            try:
+                if not proxy.renew(lease['name'], lease['token']):
+                    logger.warning("Lost the lease on %s", lease['name'])
+                    return
+            except OSError as e:
+                logger.warning("Could not renew the lease on %s: %s",
+                               lease['name'], e)
+
+    @contextmanager
+    def _download(self, lease):
+        """Downloads a job's file to a temporary path, checking its SHA1
+        sum if the job's ``info`` has one.
+
+        """
+        fd, path = tempfile.mkstemp(prefix="grader-job-")
+        request = Request(self.url + lease['file'],
+                          headers=dict(self._headers))
+        try:
+            sha1 = hashlib.sha1()
+            with open(fd, 'wb') as f, urlopen(request) as response:
+                while True:
+                    chunk = response.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    sha1.update(chunk)
+                    f.write(chunk)
+
+            expected = lease['info'].get('sha1')
+            if expected and sha1.hexdigest() != expected:
+                raise WorkQueueError(
+                    "{} was corrupted in transit".format(lease['name'])
+                )
+            yield path
+        finally:
+            os.remove(path)
@@ -46,8 +46,6 @@ setup(  # pragma: no cover
         # that you indicate whether you support Python 2, Python 3 or both.
         'Programming Language :: Python :: 3',
         'Programming Language :: Python :: 3 :: Only',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
         'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
@@ -67,7 +65,7 @@ setup(  # pragma: no cover
         'redkyn-common>=1.0.1'
     ],
 
-    python_requires='>=3.4',
+    python_requires='>=3.6',
     setup_requires=[
         'setuptools_scm>=1.15',
         'setuptools>=12'